@@ -15,41 +15,427 @@
 #     * Um Aspecto Interno: O próprio protagonista pode lutar contra seus defeitos de personalidade, medos, indecisão ou vícios, que atuam como forças antagônicas.
 
 import os
+import copy
 import json
-import requests
-from typing import Any, Dict, List, Optional
+import hashlib
+import itertools
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 from book_dataclasses import Book
+from response_parser import ParseResult, ParseStats, ResponseParser
+from token_budget import TokenBudgetPlanner
+from latency import LatencyTracker
+from hedging import RequestHedger
+from circuit_breaker import CircuitBreaker, CircuitOpenError, LLMUnavailableError
+from single_flight import SingleFlight
+from concurrency_limit import AIMDLimiter, ERROR, OK, OVERLOAD, TIMEOUT
+from routing import RouteTable
+from disaster_points import DisasterPointExtractor, extractor as disaster_extractor
+from prompt_cache import SimilarityCache
+from step_memo import STEP_REQUESTS, StepMemo, dependents, step_outputs
+import profiling
+
+# Sent after a response stopped with finish_reason == "length"
+_CONTINUE_PROMPT = (
+    "Your previous answer was cut off. Continue exactly where it stopped, "
+    "without repeating anything and without any extra text."
+)
 
 
 class LLMentryPoint:
-    def __init__( self, api_key: str, base_url: str = "https://api.openai.com/v1", model: str = "gpt-3.5-turbo" ):
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://api.openai.com/v1",
+        model: str = "gpt-3.5-turbo",
+        max_tokens: int = 1500,
+        max_continuations: int = 2,
+        endpoints: Optional[List[str]] = None,
+        hedger: Optional[RequestHedger] = None,
+        circuit_breaker: Optional[Dict[str, Any]] = None,
+        connect_timeout: float = 5.0,
+        coalesce_steps: Optional[List[str]] = None,
+        routes: Optional[Dict[str, Dict[str, Any]]] = None,
+        concurrency: Any = None,
+    ):
         self.api_key = api_key
         self.base_url = base_url
         self.model = model
+        self._session = None
+        # extra base URLs serving the same model; hedged requests go there first
+        self.endpoints = [u for u in (endpoints or []) if u != base_url]
+        self._endpoint_cycle = itertools.cycle(self.endpoints or [base_url])
+        self.hedger = hedger
+        # per-step latency of first attempts (shared with the hedger when enabled)
+        self.latency = hedger.latency if hedger else LatencyTracker()
+        # per-step max_tokens planning; `max_tokens` caps a single request
+        self.budget = TokenBudgetPlanner(default_max_tokens=max_tokens, ceiling=max_tokens)
+        self.max_continuations = max_continuations
+        # one circuit breaker per endpoint (CircuitBreaker keyword arguments)
+        self.connect_timeout = connect_timeout
+        self._breaker_config = dict(circuit_breaker or {})
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        # per-step model/endpoint routing (see routing.py) and latency per route
+        self.routes = RouteTable(routes)
+        self.route_latency = LatencyTracker()
+        # adaptive in-flight limit per endpoint (AIMDLimiter keyword arguments;
+        # False disables it)
+        self._limiter_config = None if concurrency is False else dict(concurrency or {})
+        self._limiters_lock = threading.Lock()
+        self.limiters: Dict[str, AIMDLimiter] = {}
+        for url in [base_url] + self.endpoints + self.routes.base_urls():
+            self._breaker(url)
+            self._limiter(url)
+        # steps whose identical concurrent requests share one HTTP call; list
+        # steps that want diverse answers per book should stay out of this set
+        self.coalesce_steps = set(coalesce_steps or ())
+        self.single_flight = SingleFlight()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], **overrides: Any) -> "LLMentryPoint":
+        """
+        Build an entrypoint from a `config.json`-style dict.
+
+        Besides `openai_api_key`, `openai_base_url` and `model`, the optional keys
+        `max_tokens`, `endpoints` (list of extra base URLs), `hedging`
+        (RequestHedger keyword arguments, e.g. {"percentile": 0.95, "budget": 0.1})
+        `circuit_breaker` (CircuitBreaker keyword arguments, e.g.
+        {"failure_threshold": 5, "reset_timeout": 30}), `coalesce_steps`
+        (e.g. ["genres", "conceitos"]), `routes` (per-step model routing,
+        see routing.py) and `concurrency` (AIMDLimiter keyword arguments, e.g.
+        {"initial": 8, "max_limit": 64}, or false to disable) are understood.
+        Keyword `overrides` win over config values.
+        """
+        hedging = config.get("hedging")
+        kwargs: Dict[str, Any] = {
+            "api_key": config.get("openai_api_key"),
+            "base_url": config.get("openai_base_url", "https://api.openai.com/v1"),
+            "model": config.get("model", "gpt-3.5-turbo"),
+            "max_tokens": config.get("max_tokens", 1500),
+            "endpoints": config.get("endpoints"),
+            "hedger": RequestHedger(**hedging) if isinstance(hedging, dict) else None,
+            "circuit_breaker": config.get("circuit_breaker"),
+            "coalesce_steps": config.get("coalesce_steps"),
+            "routes": config.get("routes"),
+            "concurrency": config.get("concurrency"),
+        }
+        kwargs.update({k: v for k, v in overrides.items() if v is not None})
+        return cls(**kwargs)
+
+    @property
+    def session(self):
+        """HTTP session, created on first use so importing this module stays cheap."""
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+
+    def _breaker(self, base_url: str) -> CircuitBreaker:
+        breaker = self.breakers.get(base_url)
+        if breaker is None:
+            breaker = self.breakers.setdefault(base_url, CircuitBreaker(**self._breaker_config))
+        return breaker
+
+    def _limiter(self, base_url: str) -> Optional[AIMDLimiter]:
+        if self._limiter_config is None:
+            return None
+        limiter = self.limiters.get(base_url)
+        if limiter is None:
+            with self._limiters_lock:
+                limiter = self.limiters.setdefault(base_url, AIMDLimiter(**self._limiter_config))
+        return limiter
+
+    def limiter_status(self) -> Dict[str, Dict[str, Any]]:
+        return {url: lim.snapshot() for url, lim in self.limiters.items()}
+
+    def warm_up(self, **kwargs: Any) -> Dict[str, Any]:
+        """List the served models and warm every endpoint/model pair before a run (see warmup.py)."""
+        from warmup import warm_up
+
+        return warm_up(self, **kwargs)
+
+    def _pick_endpoint(self) -> str:
+        """First endpoint whose circuit lets a call through; raises CircuitOpenError if none does."""
+        for url in [self.base_url] + self.endpoints:
+            if self._breaker(url).allow():
+                return url
+        raise CircuitOpenError(f"circuit open for all endpoints of {self.base_url}")
+
+    def breaker_status(self) -> Dict[str, Dict[str, Any]]:
+        return {url: b.snapshot() for url, b in self.breakers.items()}
+
+    def route_report(self) -> Dict[str, Dict[str, Any]]:
+        """Per route: model, endpoint, routed steps and request latency (calls, mean/p50/p95/max seconds)."""
+        latency = self.route_latency.summary()
+        report: Dict[str, Dict[str, Any]] = {}
+        for route in [self.routes.default] + list(self.routes.routes.values()):
+            report[route.name] = {
+                "model": route.model or self.model,
+                "base_url": route.base_url or self.base_url,
+                "steps": route.steps,
+                **latency.get(route.name, {"calls": 0}),
+            }
+        return report
 
-    def generate(self, prompt: str, temperature: float  , max_tokens: int   ) -> str:
-            url = _build_endpoint(self.base_url, "chat/completions")
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
+    def _post_chat(self, payload: Dict[str, Any], timeout: float = 60, base_url: Optional[str] = None, latency_sample: bool = True) -> Dict[str, Any]:
+        """
+        POST `payload` to the chat/completions endpoint and return the decoded response.
+
+        Goes through the endpoint's circuit breaker: transport errors, timeouts
+        and 5xx answers count as failures and are raised as LLMUnavailableError;
+        an open circuit raises CircuitOpenError without any network I/O.
+        The request also takes a slot of the endpoint's AIMDLimiter; 429/503
+        answers and timeouts shrink its limit (429 is raised as
+        LLMUnavailableError too, without tripping the breaker). With
+        `latency_sample` False (e.g. one-token warm-up pings) the limiter
+        gets the slot back without learning the latency.
+        """
+        resp, done = self._open_chat(payload, timeout, base_url)
+        try:
+            data = resp.json()
+        except ValueError:
+            done(ERROR)
+            raise
+        done(OK, _completion_tokens(data, None), sample=latency_sample)
+        return data
+
+    def _open_chat(self, payload: Dict[str, Any], timeout: float, base_url: Optional[str], stream: bool = False):
+        """
+        Send the chat request of `_post_chat` and return `(response, done)`
+        once the status is known to be good; `done(outcome, tokens=None)`
+        must be called when the body has been consumed, to release the
+        limiter slot (failures release it here).
+        """
+        import requests
+
+        if base_url is None:
+            base_url = self._pick_endpoint()
+        elif not self._breaker(base_url).allow():
+            raise CircuitOpenError(f"circuit open for {base_url}")
+        breaker = self._breaker(base_url)
+        url = _build_endpoint(base_url, "chat/completions")
+        headers = {
+            "Authorization": f"Bearer {self.routes.api_key_for(base_url) or self.api_key}",
+            "Content-Type": "application/json",
+        }
+        # Ensure all message contents are strings (some servers reject objects)
+        for m in payload["messages"]:
+            if not isinstance(m.get("content"), str):
+                m["content"] = json.dumps(m.get("content"), ensure_ascii=False)
+        limiter = self._limiter(base_url)
+        if limiter is not None and not limiter.acquire(timeout):
+            # the call never went out: give back a half-open trial slot
+            breaker.release()
+            raise LLMUnavailableError(f"{url}: no request slot freed within {timeout}s")
+        started = time.monotonic()
+
+        def done(outcome: str, tokens: Optional[int] = None, sample: bool = True) -> None:
+            if limiter is not None:
+                limiter.release(outcome, time.monotonic() - started if sample else None, tokens)
+
+        outcome = ERROR
+        # every path records an outcome on the breaker, or a half-open
+        # circuit would keep its trial slot forever
+        settled = False
+        try:
+            try:
+                resp = self.session.post(url, headers=headers, json=payload, timeout=(self.connect_timeout, timeout), stream=stream)
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as exc:
+                if isinstance(exc, requests.Timeout):
+                    outcome = TIMEOUT
+                settled = True
+                breaker.record_failure()
+                raise LLMUnavailableError(f"{url}: {exc}") from exc
+            if resp.status_code in (429, 503):
+                outcome = OVERLOAD
+            if resp.status_code >= 500:
+                settled = True
+                breaker.record_failure()
+                raise LLMUnavailableError(f"{url}: HTTP {resp.status_code}")
+            # any other answer (429 included) means the server is up
+            settled = True
+            breaker.record_success()
+            if resp.status_code == 429:
+                raise LLMUnavailableError(f"{url}: HTTP 429 (rate limited)")
+            resp.raise_for_status()
+        except BaseException:
+            if not settled:
+                breaker.record_failure()
+            done(outcome)
+            raise
+        return resp, done
+
+    def stream_text(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: Optional[int] = None,
+        step: Optional[str] = None,
+        timeout: float = 120,
+    ) -> Iterator[str]:
+        """
+        Streamed plain chat completion (`"stream": true`, server-sent events):
+        yields the text pieces as they arrive, so callers can write them out
+        without holding the whole answer. Routed like `generate_text`, but
+        not hedged, coalesced or continued. A connection lost mid-stream
+        raises LLMUnavailableError after the pieces already yielded.
+        """
+        import requests
+
+        route = self.routes.for_step(step)
+        payload = {
+            "model": route.model or self.model,
+            "messages": messages,
+            "temperature": temperature if route.temperature is None else route.temperature,
+            "max_tokens": max_tokens or self.budget.plan(step, ceiling=route.max_tokens),
+            "stream": True,
+        }
+        resp, done = self._open_chat(payload, timeout, route.base_url, stream=True)
+        outcome = ERROR
+        chars = 0
+        try:
+            for raw in resp.iter_lines():
+                # SSE is UTF-8; requests would guess latin-1 for text/event-stream
+                line = raw.decode("utf-8", "replace")
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    piece = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                except (ValueError, KeyError, IndexError, TypeError):
+                    continue
+                if piece:
+                    chars += len(piece)
+                    yield piece
+            outcome = OK
+        except requests.RequestException as exc:
+            # ConnectionError, Timeout, ChunkedEncodingError (connection lost mid-body), ...
+            outcome = TIMEOUT if isinstance(exc, requests.Timeout) else ERROR
+            raise LLMUnavailableError(f"stream interrupted: {exc}") from exc
+        finally:
+            resp.close()
+            done(outcome, chars // 4)
+            if outcome == OK:
+                self.budget.record(step, chars // 4, truncated=False)
+
+    def _send(self, payload: Dict[str, Any], step: Optional[str] = None) -> Dict[str, Any]:
+        """
+        First attempt of a request: timed per step and per route, and hedged
+        when a hedger is configured. Steps routed to their own endpoint are not
+        hedged (the extra endpoints serve the default model).
+        """
+        route = self.routes.for_step(step)
+        started = time.monotonic()
+        try:
+            if route.base_url:
+                data = self._post_chat(payload, base_url=route.base_url)
+                self.latency.record(step, time.monotonic() - started)
+            elif self.hedger is None:
+                data = self._post_chat(payload)
+                self.latency.record(step, time.monotonic() - started)
+            else:
+                data = self.hedger.run(
+                    step,
+                    lambda: self._post_chat(payload),
+                    lambda: self._post_chat(payload, base_url=next(self._endpoint_cycle)),
+                    is_valid=_has_content,
+                )
+        finally:
+            self.route_latency.record(route.name, time.monotonic() - started)
+        return data
+
+    def _complete(self, payload: Dict[str, Any], step: Optional[str] = None):
+        """
+        Send a chat request and return `(content, data)`.
+
+        For steps in `coalesce_steps`, concurrent requests with the same payload
+        fingerprint share a single call (see `single_flight.SingleFlight`).
+        """
+        if step is None or step not in self.coalesce_steps:
+            return self._complete_uncoalesced(payload, step)
+        result, _shared = self.single_flight.do(
+            _payload_key(payload), lambda: self._complete_uncoalesced(payload, step)
+        )
+        return result
+
+    def _complete_uncoalesced(self, payload: Dict[str, Any], step: Optional[str] = None):
+        """
+        Send a chat request and return `(content, data)`.
+
+        When the answer stops with `finish_reason == "length"`, continuation
+        requests are issued (up to `max_continuations`) and the pieces are
+        concatenated. The total completion length is fed back to `self.budget`.
+        `content` is None when the response has no `choices[0].message.content`.
+        """
+        data = self._send(payload, step)
+        try:
+            choice = data["choices"][0]
+            content = choice["message"]["content"]
+        except Exception:
+            return None, data
+        finish = choice.get("finish_reason")
+        used = _completion_tokens(data, content)
+
+        pieces = [content or ""]
+        continuations = 0
+        while finish == "length" and continuations < self.max_continuations:
+            continuations += 1
+            # Continuations are free text: a strict response_format would force
+            # the model to restart the JSON document instead of finishing it.
+            follow = {k: v for k, v in payload.items() if k != "response_format"}
+            follow["messages"] = list(payload["messages"]) + [
+                {"role": "assistant", "content": "".join(pieces)},
+                {"role": "user", "content": _CONTINUE_PROMPT},
+            ]
+            data = self._post_chat(follow, base_url=self.routes.for_step(step).base_url)
+            try:
+                choice = data["choices"][0]
+                piece = choice["message"]["content"] or ""
+            except Exception:
+                break
+            finish = choice.get("finish_reason")
+            used += _completion_tokens(data, piece)
+            pieces.append(piece)
+
+        self.budget.record(step, used, truncated=continuations > 0)
+        return "".join(pieces), data
+
+    def generate_text(
+            self,
+            messages: List[Dict[str, str]],
+            temperature: float,
+            max_tokens: Optional[int] = None,
+            step: Optional[str] = None,
+        ) -> str:
+            """Plain (unstructured) chat completion; returns the assistant text or ''."""
+            route = self.routes.for_step(step)
+            payload = {
+                "model": route.model or self.model,
+                "messages": messages,
+                "temperature": temperature if route.temperature is None else route.temperature,
+                "max_tokens": max_tokens or self.budget.plan(step, ceiling=route.max_tokens),
             }
+            with profiling.section("network"):
+                content, _ = self._complete(payload, step)
+            return content or ""
+
+    def generate(self, prompt: str, temperature: float  , max_tokens: int   ) -> str:
             payload = {
                 "model": self.model,
                 "messages": [
-                    {"role": "system", "content": _PROMPTS["system_structure"]},
+                    {"role": "system", "content": _load_prompts()["system_structure"]},
                     {"role": "user", "content": prompt},
                 ],
                 "temperature": temperature,
                 "max_tokens": max_tokens,
             }
-            # Ensure all message contents are strings (some servers reject objects)
-            for m in payload["messages"]:
-                if not isinstance(m.get("content"), str):
-                    m["content"] = json.dumps(m.get("content"), ensure_ascii=False)
-            resp = requests.post(url, headers=headers, json=payload, timeout=60)
-            resp.raise_for_status()
-            data = resp.json()
+            data = self._post_chat(payload)
             content = data["choices"][0]["message"]["content"]
             return content
         
@@ -57,8 +443,9 @@ class LLMentryPoint:
             self,
             prompts: List[Dict[str, str]],
             temperature: float ,
-            max_tokens: int = 1500,
+            max_tokens: Optional[int] = None,
             response_schema: Optional[Dict[str, Any]] = None,
+            step: Optional[str] = None,
         ) -> Dict[str, Any]:
             """
             Request structured output when `response_schema` is provided (LM Studio style).
@@ -67,49 +454,40 @@ class LLMentryPoint:
             - If `response_schema` is provided, the request payload will include
               `response_format` set to the supplied schema. The function will attempt
               to parse `choices[0].message.content` as JSON and return the parsed object.
+            - `step` names the pipeline step (defaults to the schema name); when
+              `max_tokens` is None it is planned per step by `self.budget`.
+            - A route configured for `step` overrides model, temperature and the
+              `max_tokens` ceiling.
             """
- 
+            if step is None and response_schema:
+                step = response_schema.get("json_schema", {}).get("name")
+            route = self.routes.for_step(step)
+            if route.temperature is not None:
+                temperature = route.temperature
+            if max_tokens is None:
+                max_tokens = self.budget.plan(step, response_schema, ceiling=route.max_tokens)
 
             # Build request that asks for structured output
-            url = _build_endpoint(self.base_url, "chat/completions")
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-            }
             messages = prompts
         
             payload = {
-                "model": self.model,
+                "model": route.model or self.model,
                 "messages": messages,
                 "temperature": temperature,
                 "max_tokens": max_tokens,
                 "response_format": response_schema,
             }
 
-            # Ensure message contents are strings (some servers require string content)
-            for m in payload["messages"]:
-                if not isinstance(m.get("content"), str):
-                    m["content"] = json.dumps(m.get("content"), ensure_ascii=False)
-
-            resp = requests.post(url, headers=headers, json=payload, timeout=60)
-            try:
-                resp.raise_for_status()
-            except requests.exceptions.HTTPError:
-                # Attach payload to the exception message to ease debugging of malformed requests
-                raise
-            data = resp.json()
-
-           
-            # Extract the assistant message content
-            try:
-                content = data["choices"][0]["message"]["content"]
-            except Exception:
+            with profiling.section("network"):
+                content, data = self._complete(payload, step)
+            if content is None:
                 # Unexpected response shape: return raw response
                 return {"raw_response": data}
 
             # Try parsing content as JSON
             try:
-                return json.loads(content)
+                with profiling.section("parse"):
+                    return json.loads(content)
             except Exception:
                 # Some structured responses may already be JSON objects in the response
                 # or the server might return structured data in a different field. Try
@@ -126,63 +504,310 @@ class LLMentryPoint:
                 # Fallback: return the raw content string
                 return {"content": content}
 
+def _summary_json(extra_summary: Any) -> str:
+    """`extra_summary` as JSON for the prompt context (str() if it is not serializable)."""
+    with profiling.section("serialization"):
+        try:
+            return json.dumps(extra_summary, ensure_ascii=False)
+        except Exception:
+            return str(extra_summary)
+
+
+def _has_content(data: Any) -> bool:
+    try:
+        return isinstance(data["choices"][0]["message"]["content"], str)
+    except Exception:
+        return False
+
+
+def _payload_key(payload: Dict[str, Any]) -> str:
+    # max_tokens is planned from live usage stats, so it is left out of the fingerprint
+    stable = {k: v for k, v in payload.items() if k != "max_tokens"}
+    raw = json.dumps(stable, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _request_key(step: str, prompts: List[Dict[str, str]]) -> str:
+    raw = json.dumps([step, prompts], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _item_identity(item: Any) -> str:
+    return json.dumps(item, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def _character_key(item: Any) -> Any:
+    """Characters are the same character when their `nome` matches."""
+    if isinstance(item, dict) and str(item.get("nome", "")).strip():
+        return str(item["nome"]).strip().casefold()
+    return _item_identity(item)
+
+
+def _act_number(item: Any) -> Optional[int]:
+    try:
+        return int(item.get("act", 0))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _act_key(item: Any) -> Any:
+    """Acts are the same act when their number matches."""
+    number = _act_number(item)
+    return number if number in (1, 2, 3) else _item_identity(item)
+
+
+def _completion_tokens(data: Dict[str, Any], content: Optional[str]) -> int:
+    """Completion tokens reported by the server, or a ~4 chars/token estimate."""
+    try:
+        return int(data["usage"]["completion_tokens"])
+    except Exception:
+        return len(content or "") // 4
+
+
 _PROMPT_PATH = os.path.join(os.path.dirname(__file__), "llm_prompts.json")
+
+@lru_cache(maxsize=None)
 def _load_prompts():
+    # Read lazily (and once per process) instead of at import time
     with open(_PROMPT_PATH, "r", encoding="utf-8") as f:
         return json.load(f)
-_PROMPTS = _load_prompts()
 
 
-def choose(msg, items):
+def _characters_for_sheets(book: Book) -> List[Dict[str, Any]]:
+    """Protagonists and antagonists as `{"nome", "papel", ...}` dicts (plain names are accepted)."""
+    out: List[Dict[str, Any]] = []
+    seen = set()
+    for papel, items in (("protagonista", book.protagonistas), ("antagonista", book.antagonistas)):
+        for item in items or []:
+            c = dict(item) if isinstance(item, dict) else {"nome": str(item)}
+            if not c.get("nome"):
+                continue
+            c["nome"] = str(c["nome"])
+            c["papel"] = papel
+            if (papel, c["nome"]) in seen:
+                continue
+            seen.add((papel, c["nome"]))
+            out.append(c)
+    return out
+
+
+def choose(msg, items, rng=None):
     import random
     print( )
     for x in items:
         print( "  - ", x)
-    choice = random.choice(items)
+    choice = (rng or random).choice(items)
     print(f"{msg} : {choice}")
     return  choice
 
+def announce(label, value):
+    print(f"  {label}:", value)
+
+def prompt_choice(msg, items, rng=None):
+    """Interactive chooser: lists the candidates and reads a number from stdin (empty = random)."""
+    import random
+    print()
+    for i, x in enumerate(items, 1):
+        print(f"  {i}. {x}")
+    while True:
+        answer = input(f"{msg} [1-{len(items)}]: ").strip()
+        if not answer:
+            return (rng or random).choice(items)
+        if answer.isdigit() and 1 <= int(answer) <= len(items):
+            return items[int(answer) - 1]
+
 class LLMBookGenerator:
-    def __init__(self,  api_key: str, base_url: str = "https://api.openai.com/v1", model: str = "gpt-3.5-turbo" , temperature: float = 0.6, max_tokens: int = 1500 ):
+    def __init__(self,  api_key: str, base_url: str = "https://api.openai.com/v1", model: str = "gpt-3.5-turbo" , temperature: float = 0.6, max_tokens: int = 1500, entrypoint: Optional[LLMentryPoint] = None ):
         self.api_key = api_key
         self.base_url = base_url
         self.model = model
-        self.entrypoint = LLMentryPoint(api_key=api_key, base_url=base_url, model=model)
-        self.prompts = _load_prompts()
+        # a preconfigured entrypoint (endpoints, hedging, ...) may be injected
+        self.entrypoint = entrypoint or LLMentryPoint(api_key=api_key, base_url=base_url, model=model, max_tokens=max_tokens)
         self.temperature = temperature
         self.max_tokens = max_tokens
-
-    def _parse_structured(self, result: Any, key: Optional[str] = None) -> Any:
+        # one compiled parser per response schema name, plus repair-path counters
+        self._parsers: Dict[str, ResponseParser] = {}
+        self.parse_stats = ParseStats()
+        # last good value per request (served while the endpoint is down) and fallback counters
+        self._lock = threading.Lock()
+        self._last_good: "OrderedDict[str, Any]" = OrderedDict()
+        self.last_good_size = 256
+        self.fallback_counts: Counter = Counter()
+        # random source used by choose(); reseeded per book when a seed is given
+        self.rng = None
+        # picks one candidate of a choice step: chooser(msg, items, rng) -> item
+        # (a ranker, an interactive prompt, ...); defaults to a random choice
+        self.chooser = choose
+        # reports the characters picked by a step: announce(label, name);
+        # None keeps the pipeline quiet (the service streams step events)
+        self.announce: Optional[Callable[[str, Any], None]] = announce
+        # optional StepMemo: step outputs memoized by a hash of their declared inputs
+        self.memo: Optional[StepMemo] = None
+        # optional SimilarityCache (prompt_cache.py): parsed answers reused for
+        # near-identical requests of the steps it is enabled for
+        self.prompt_cache: Optional[SimilarityCache] = None
+        # sentence picker of the heuristic acts fallback (keywords per language)
+        self.disaster_points: DisasterPointExtractor = disaster_extractor("pt")
+        # character sheets: characters per request and requests in flight
+        self.character_batch_size = 4
+        self.character_workers = 4
+        # list steps: follow-up requests for only the invalid/missing items
+        self.item_repair_rounds = 1
+        self.item_repair_counts: Counter = Counter()
+
+    def spawn(self) -> "LLMBookGenerator":
         """
-        Helper to parse structured responses returned by `generate_json`.
-        Accepts multiple shapes and returns:
-        - If `key` provided and result is dict containing key: return that value
-        - If result is dict and contains a single list-like value, return that list
-        - If result is string, try JSON-parsing and attempt same extraction
-        - Otherwise, return None or an appropriate fallback
+        Generator for one of several concurrent books: shares the entrypoint,
+        parsers, last-good cache, memo and counters, with its own `rng`.
         """
-        # If result is a dict and contains the key
-        if isinstance(result, dict):
-            if key and key in result:
-                return result[key]
+        child = copy.copy(self)
+        child.rng = None
+        return child
 
-            # find first list value
-            for v in result.values():
-                if isinstance(v, list):
-                    return v
+    @property
+    def prompts(self) -> Dict[str, str]:
+        return _load_prompts()
 
-            return None
-
-        # If result is a JSON string, try to parse
-        if isinstance(result, str):
-            try:
-                parsed = json.loads(result)
-                return self._parse_structured(parsed, key)
-            except Exception:
-                return None
+    def _request_json(self, prompts: List[Dict[str, str]], schema: Dict[str, Any], book: Optional[Book] = None) -> ParseResult:
+        """
+        Request a structured step and parse it against its schema.
+
+        If the endpoint is unavailable (including an open circuit) the last good
+        value for the same request is reused when known; every degraded outcome
+        is recorded on `book.fallbacks` so the caller's fallback is visible in
+        the output. Returns a ParseResult whose `ok` is False when the caller
+        must use its fallback. With `self.prompt_cache` enabled for the step, a
+        near-identical earlier request is answered from it (repair "similar").
+        """
+        step = schema.get("json_schema", {}).get("name", "")
+        key = _request_key(step, prompts)
+        cache = self.prompt_cache
+        model = None
+        if cache is not None and cache.enabled(step):
+            model = self.entrypoint.routes.for_step(step).model or self.entrypoint.model
+            hit = cache.get(step, prompts, model)
+            if hit is not None:
+                return ParseResult(hit, "similar")
+        try:
+            result = self.entrypoint.generate_json(prompts, response_schema=schema, temperature=self.temperature)
+        except LLMUnavailableError as exc:
+            reason = "circuit_open" if isinstance(exc, CircuitOpenError) else "unavailable"
+            with self._lock:
+                cached = self._last_good.get(key)
+            if cached is not None:
+                self._record_fallback(book, step, "cached")
+                return ParseResult(cached, "cached")
+            self._record_fallback(book, step, reason)
+            return ParseResult(None, reason)
+
+        parsed = self._parse_response(result, schema)
+        if parsed.ok:
+            with self._lock:
+                self._last_good[key] = parsed.value
+                self._last_good.move_to_end(key)
+                while len(self._last_good) > self.last_good_size:
+                    self._last_good.popitem(last=False)
+            if model is not None:
+                cache.put(step, prompts, parsed.value, model)
+        else:
+            self._record_fallback(book, step, "parse_failed")
+        return parsed
 
-        # Unknown shape
-        return None
+    def _request_items(
+        self,
+        prompts: List[Dict[str, str]],
+        schema: Dict[str, Any],
+        book: Optional[Book] = None,
+        min_items: Optional[int] = None,
+        item_key: Optional[Callable[[Any], Any]] = None,
+    ) -> ParseResult:
+        """
+        `_request_json` for a list step, re-requesting only what is missing.
+
+        When the answer has valid items but also items rejected by the item
+        schema (e.g. a character without `descricao`) or fewer than
+        `min_items` (default: the schema's `minItems`), a follow-up request
+        lists the valid items as context and asks only for the missing ones;
+        its valid items are appended, skipping those whose `item_key` (default:
+        the whole item) matches a kept one, since models often echo the items
+        given as context. Up to `self.item_repair_rounds` follow-ups; the
+        result may still be short, callers decide what to do.
+        """
+        parsed = self._request_json(prompts, schema, book)
+        if not parsed.ok or not isinstance(parsed.value, list):
+            return parsed
+        spec = schema.get("json_schema", {})
+        step = spec.get("name", "")
+        body = spec.get("schema", {})
+        key = (body.get("required") or list(body.get("properties", {})) or [step])[0]
+        field_schema = body.get("properties", {}).get(key, {})
+        if min_items is None:
+            min_items = int(field_schema.get("minItems", 0) or 0)
+        required = (field_schema.get("items") or {}).get("required", [])
+
+        item_key = item_key or _item_identity
+        valid = list(parsed.value)
+        invalid = list(parsed.rejected)
+        seen = {item_key(item) for item in valid}
+        missing = max(min_items - len(valid), len(invalid))
+        rounds = 0
+        while missing > 0 and rounds < self.item_repair_rounds:
+            rounds += 1
+            template = self.prompts.get(
+                "user_repair_items",
+                "Itens válidos já obtidos (não os repita): {{validos}}\nItens inválidos ou incompletos: {{invalidos}}\n"
+                "Gere apenas {{faltam}} item(ns), cada um com os campos {{campos}}.",
+            )
+            repair = (
+                template.replace("{{validos}}", json.dumps(valid, ensure_ascii=False))
+                .replace("{{invalidos}}", json.dumps(invalid, ensure_ascii=False, default=str) if invalid else "-")
+                .replace("{{faltam}}", str(missing))
+                .replace("{{campos}}", ", ".join(required) or key)
+            )
+            follow_up = prompts[:-1] + [dict(prompts[-1], content=f"{prompts[-1]['content']}\n\n{repair}")]
+            repair_schema = copy.deepcopy(schema)
+            repair_schema["json_schema"]["schema"]["properties"][key]["minItems"] = missing
+            # no book: a failed follow-up keeps the valid items instead of a fallback
+            answer = self._request_json(follow_up, repair_schema, None)
+            if not answer.ok:
+                break
+            added = 0
+            for item in answer.value:
+                if added >= missing:
+                    break
+                k = item_key(item)
+                if k in seen:
+                    continue
+                seen.add(k)
+                valid.append(item)
+                added += 1
+            missing -= added
+            invalid = list(answer.rejected)
+        if rounds:
+            with self._lock:
+                self.item_repair_counts[(step, "repaired" if missing <= 0 else "incomplete")] += 1
+        return ParseResult(valid, parsed.repair, [] if missing <= 0 else invalid)
+
+    def _record_fallback(self, book: Optional[Book], step: str, reason: str) -> None:
+        with self._lock:
+            self.fallback_counts[(step, reason)] += 1
+        if book is not None:
+            book.fallbacks.append({"step": step, "reason": reason})
+
+    def _parse_response(self, result: Any, schema: Dict[str, Any]) -> ParseResult:
+        """
+        Parse a `generate_json` result against the step's `response_schema`.
+        The parser is compiled on first use and the repair path taken is
+        recorded in `self.parse_stats`.
+        """
+        name = schema.get("json_schema", {}).get("name", "")
+        parser = self._parsers.get(name)
+        if parser is None:
+            parser = self._parsers[name] = ResponseParser(schema)
+        with profiling.section("parse"):
+            parsed = parser.parse(result)
+        self.parse_stats.record(parser.name, parsed.repair)
+        return parsed
 
     def generate_conceitos(self, book: Book, extra_summary: Optional[Dict[str, Any]] = None) -> list[str]:
         schema = {
@@ -216,16 +841,12 @@ class LLMBookGenerator:
             prompts[-1]["content"] += f" Context: genero: {genero}"
 
         if extra_summary:
-            try:
-                ctx = json.dumps(extra_summary, ensure_ascii=False)
-            except Exception:
-                ctx = str(extra_summary)
+            ctx = _summary_json(extra_summary)
             prompts[-1]["content"] += f" More context: {ctx}"
 
-        result = self.entrypoint.generate_json(prompts, response_schema=schema, temperature= self.temperature, max_tokens=self.max_tokens)
-        if isinstance(result, dict):
-            if "conceitos" in result and isinstance(result["conceitos"], list):
-                return [str(x).strip() for x in result["conceitos"] if x]
+        parsed = self._request_json(prompts, schema, book)
+        if parsed.ok:
+            return parsed.value
         # fallback defaults
         return [
             "Um mundo onde os sonhos influenciam a realidade",
@@ -235,7 +856,7 @@ class LLMBookGenerator:
         ]
 
 
-    def generate_genres(self, extra_summary: Optional[Dict[str, Any]] = None) -> list[str]:
+    def generate_genres(self, extra_summary: Optional[Dict[str, Any]] = None, book: Optional[Book] = None) -> list[str]:
         # Use LM Studio / OpenAI-style structured JSON schema to request a list of genres
         schema = {
             "type": "json_schema",
@@ -264,45 +885,12 @@ class LLMBookGenerator:
         ]
         
         if extra_summary:
-            try:
-                ctx = json.dumps(extra_summary, ensure_ascii=False)
-            except Exception:
-                ctx = str(extra_summary)
+            ctx = _summary_json(extra_summary)
             prompts[-1]["content"] += f" Context: {ctx}"
 
-        result = self.entrypoint.generate_json(prompts, response_schema=schema, temperature= self.temperature, max_tokens=self.max_tokens)
-
-        # `generate_json` should return a parsed object when response_schema is used.
-        # Handle a few possible shapes defensively.
-        if isinstance(result, dict):
-            # Typical LM Studio shape: {"genres": [..]}
-            if "genres" in result and isinstance(result["genres"], list):
-                return [str(x).strip() for x in result["genres"] if x]
-
-            # Sometimes structured output is nested under a top-level name
-            for v in result.values():
-                if isinstance(v, list) and all(isinstance(i, str) for i in v):
-                    return [i.strip() for i in v]
-
-            # If parsing produced other fields, try to find first list of strings
-            for v in result.values():
-                if isinstance(v, list):
-                    cleaned = [str(x).strip() for x in v if isinstance(x, (str, int, float))]
-                    if cleaned:
-                        return cleaned
-
-            return []
-
-        # If result is a string, try JSON parsing fallback
-        if isinstance(result, str):
-            try:
-                parsed = json.loads(result)
-                if isinstance(parsed, list):
-                    return [str(x).strip() for x in parsed]
-                if isinstance(parsed, dict) and "genres" in parsed:
-                    return [str(x).strip() for x in parsed["genres"]]
-            except Exception:
-                pass
+        parsed = self._request_json(prompts, schema, book)
+        if parsed.ok:
+            return parsed.value
 
         # fallback default genres
         return ["Fantasy", "Science Fiction", "Romance", "Mystery", "Historical", "Horror"]
@@ -346,42 +934,14 @@ class LLMBookGenerator:
         ]
 
         if extra_summary:
-            try:
-                ctx = json.dumps(extra_summary, ensure_ascii=False)
-            except Exception:
-                ctx = str(extra_summary)
+            ctx = _summary_json(extra_summary)
             prompts[-1]["content"] += f" Context: {ctx}"
 
-        result = self.entrypoint.generate_json(prompts, response_schema=schema, temperature= self.temperature, max_tokens=self.max_tokens)
-
-        # Defensive parsing
-        if isinstance(result, dict):
-            if "temas" in result and isinstance(result["temas"], list):
-                return [str(x).strip() for x in result["temas"] if x]
-
-            for v in result.values():
-                if isinstance(v, list) and all(isinstance(i, str) for i in v):
-                    return [i.strip() for i in v]
-
-            for v in result.values():
-                if isinstance(v, list):
-                    cleaned = [str(x).strip() for x in v if isinstance(x, (str, int, float))]
-                    if cleaned:
-                        return cleaned
-
-            return []
-
-        if isinstance(result, str):
-            try:
-                parsed = json.loads(result)
-                if isinstance(parsed, list):
-                    return [str(x).strip() for x in parsed]
-                if isinstance(parsed, dict) and "temas" in parsed:
-                    return [str(x).strip() for x in parsed["temas"]]
-            except Exception:
-                pass
-
-        return []
+        parsed = self._request_json(prompts, schema, book)
+        if parsed.ok:
+            return parsed.value
+        # fallback: broad universal themes
+        return ["Identidade", "Perdão", "Família", "Coragem", "Solidão"]
 
 
     def generate_tramas(self, book: Book, extra_summary: Optional[Dict[str, Any]] = None) -> list[str]:
@@ -442,48 +1002,20 @@ class LLMBookGenerator:
         ]
 
         if extra_summary:
-            try:
-                ctx = json.dumps(extra_summary, ensure_ascii=False)
-            except Exception:
-                ctx = str(extra_summary)
+            ctx = _summary_json(extra_summary)
             prompts[-1]["content"] += f" More context: {ctx}"
 
-        result = self.entrypoint.generate_json(prompts, response_schema=schema, temperature= self.temperature, max_tokens=self.max_tokens)
-
-        # Parse result defensively (similar to generate_genres)
-        if isinstance(result, dict):
-            if "tramas" in result and isinstance(result["tramas"], list):
-                return [str(x).strip() for x in result["tramas"] if x]
-
-            for v in result.values():
-                if isinstance(v, list) and all(isinstance(i, str) for i in v):
-                    return [i.strip() for i in v]
-
-            for v in result.values():
-                if isinstance(v, list):
-                    cleaned = [str(x).strip() for x in v if isinstance(x, (str, int, float))]
-                    if cleaned:
-                        return cleaned
-
-            # fallback: create simple tramas based on conceito if available
-            if conceito:
-                return [f"Uma história sobre {conceito} e suas consequências."]
-            return [
-                "Um herói improvável é forçado a enfrentar uma antiga ameaça.",
-                "Um segredo de família vem à tona e muda tudo.",
-            ]
-
-        if isinstance(result, str):
-            try:
-                parsed = json.loads(result)
-                if isinstance(parsed, list):
-                    return [str(x).strip() for x in parsed]
-                if isinstance(parsed, dict) and "tramas" in parsed:
-                    return [str(x).strip() for x in parsed["tramas"]]
-            except Exception:
-                pass
+        parsed = self._request_json(prompts, schema, book)
+        if parsed.ok:
+            return parsed.value
 
-        return []
+        # fallback: create simple tramas based on conceito if available
+        if conceito:
+            return [f"Uma história sobre {conceito} e suas consequências."]
+        return [
+            "Um herói improvável é forçado a enfrentar uma antiga ameaça.",
+            "Um segredo de família vem à tona e muda tudo.",
+        ]
 
     def generate_loglines(self, book: Book, extra_summary: Optional[Dict[str, Any]] = None) -> list[str]:
         """
@@ -533,42 +1065,16 @@ class LLMBookGenerator:
             prompts[-1]["content"] += f" Context: genero: {genero}"
 
         if extra_summary:
-            try:
-                ctx = json.dumps(extra_summary, ensure_ascii=False)
-            except Exception:
-                ctx = str(extra_summary)
+            ctx = _summary_json(extra_summary)
             prompts[-1]["content"] += f" Context: {ctx}"
 
-        result = self.entrypoint.generate_json(prompts, response_schema=schema, temperature= self.temperature, max_tokens=self.max_tokens)
-
-        # Defensive parsing (similar to other generators)
-        if isinstance(result, dict):
-            if "loglines" in result and isinstance(result["loglines"], list):
-                return [str(x).strip() for x in result["loglines"] if x]
-
-            for v in result.values():
-                if isinstance(v, list) and all(isinstance(i, str) for i in v):
-                    return [i.strip() for i in v]
-
-            for v in result.values():
-                if isinstance(v, list):
-                    cleaned = [str(x).strip() for x in v if isinstance(x, (str, int, float))]
-                    if cleaned:
-                        return cleaned
-
-            return []
-
-        if isinstance(result, str):
-            try:
-                parsed = json.loads(result)
-                if isinstance(parsed, list):
-                    return [str(x).strip() for x in parsed]
-                if isinstance(parsed, dict) and "loglines" in parsed:
-                    return [str(x).strip() for x in parsed["loglines"]]
-            except Exception:
-                pass
-
-        return []
+        parsed = self._request_json(prompts, schema, book)
+        if parsed.ok:
+            return parsed.value
+        # fallback: a generic logline built from the conceito
+        if conceito:
+            return [f"Em um mundo marcado por {conceito}, um protagonista improvável precisa enfrentar as consequências para salvar o que ama."]
+        return ["Um protagonista improvável precisa enfrentar uma ameaça antiga para salvar o que ama."]
 
     def generate_protagonistas(self, book: Book, extra_summary: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
@@ -620,18 +1126,12 @@ class LLMBookGenerator:
         ]
 
         if extra_summary:
-            try:
-                ctx = json.dumps(extra_summary, ensure_ascii=False)
-            except Exception:
-                ctx = str(extra_summary)
+            ctx = _summary_json(extra_summary)
             prompts[-1]["content"] += f" Context: {ctx}"
 
-        result = self.entrypoint.generate_json(prompts, response_schema=schema, temperature= self.temperature, max_tokens=self.max_tokens)
-
-        # Use helper to parse structured response
-        parsed = self._parse_structured(result, "protagonistas")
-        if isinstance(parsed, list):
-            return parsed
+        parsed = self._request_items(prompts, schema, book, item_key=_character_key)
+        if parsed.ok:
+            return parsed.value
 
         # Fallback: create a simple main protagonist from available book data
         main_name = "Protagonista"
@@ -689,17 +1189,12 @@ class LLMBookGenerator:
         ]
 
         if extra_summary:
-            try:
-                ctx = json.dumps(extra_summary, ensure_ascii=False)
-            except Exception:
-                ctx = str(extra_summary)
+            ctx = _summary_json(extra_summary)
             prompts[-1]["content"] += f" Context: {ctx}"
 
-        result = self.entrypoint.generate_json(prompts, response_schema=schema, temperature= self.temperature, max_tokens=self.max_tokens)
-
-        parsed = self._parse_structured(result, "antagonistas")
-        if isinstance(parsed, list):
-            return parsed
+        parsed = self._request_items(prompts, schema, book, item_key=_character_key)
+        if parsed.ok:
+            return parsed.value
 
         # Fallback
         main_name = "Antagonista"
@@ -707,6 +1202,166 @@ class LLMBookGenerator:
             main_name = f"Antagonista em {conceito}"[:60]
         return [{"nome": main_name, "descricao": conceito or "Um antagonista indefinido.", "acoes": [], "transformacao": ""}]
 
+    def generate_character_sheets(
+        self,
+        book: Book,
+        extra_summary: Optional[Dict[str, Any]] = None,
+        batch_size: Optional[int] = None,
+        on_sheet: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Generate a character sheet (ficha) for every protagonist and antagonist.
+
+        Characters are packed `batch_size` per structured request (default
+        `self.character_batch_size`) and the batches run concurrently (up to
+        `self.character_workers`). Sheets are appended to `book.character_sheets`
+        as each batch arrives (and passed to `on_sheet`); at the end the list is
+        put back in character order. Characters missing from an answer are
+        re-requested on their own (`self.item_repair_rounds` times), then get a
+        fallback sheet built from their description.
+        """
+        characters = _characters_for_sheets(book)
+        book.character_sheets = []
+        if not characters:
+            return []
+        size = max(1, batch_size or self.character_batch_size)
+        batches = [characters[i:i + size] for i in range(0, len(characters), size)]
+
+        def receive(batch: List[Dict[str, Any]], sheets: List[Dict[str, Any]]) -> None:
+            with self._lock:
+                book.character_sheets.extend(sheets)
+            if on_sheet is not None:
+                for sheet in sheets:
+                    on_sheet(sheet)
+
+        if len(batches) == 1 or self.character_workers <= 1:
+            for batch in batches:
+                receive(batch, self._character_sheet_batch(book, batch, extra_summary))
+        else:
+            import contextvars
+            from concurrent.futures import ThreadPoolExecutor, as_completed
+
+            error: Optional[BaseException] = None
+            with ThreadPoolExecutor(max_workers=min(self.character_workers, len(batches))) as pool:
+                # copy_context: batches report into the caller's profiling step
+                futures = {
+                    pool.submit(contextvars.copy_context().run, self._character_sheet_batch, book, batch, extra_summary): batch
+                    for batch in batches
+                }
+                for fut in as_completed(futures):
+                    # let every batch finish before re-raising (batch mode defers each request)
+                    try:
+                        sheets = fut.result()
+                    except BaseException as exc:
+                        error = error or exc
+                        continue
+                    receive(futures[fut], sheets)
+            if error is not None:
+                raise error
+
+        order = {(c["papel"], c["nome"]): i for i, c in enumerate(characters)}
+        book.character_sheets.sort(key=lambda sh: order.get((sh.get("papel"), sh.get("nome")), len(order)))
+        return book.character_sheets
+
+    def _character_sheet_batch(self, book: Book, batch: List[Dict[str, Any]], extra_summary: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Sheets for `batch` (one request, plus follow-ups for missing characters), in batch order."""
+        answered, answered_ok = self._character_sheet_answers(book, batch, extra_summary, book)
+        ok = answered_ok
+        unanswered = [c for c in batch if c["nome"].strip().lower() not in answered]
+        rounds = 0
+        while unanswered and ok and rounds < self.item_repair_rounds:
+            rounds += 1
+            # ask again for the missing characters only
+            more, ok = self._character_sheet_answers(book, unanswered, extra_summary, None)
+            answered.update(more)
+            unanswered = [c for c in unanswered if c["nome"].strip().lower() not in answered]
+        if rounds:
+            with self._lock:
+                self.item_repair_counts[("character_sheets", "incomplete" if unanswered else "repaired")] += 1
+
+        sheets = []
+        for c in batch:
+            sheet = answered.get(c["nome"].strip().lower())
+            if sheet is None:
+                # Fallback: minimal sheet from what the character step produced
+                sheet = {"nome": c["nome"], "papel": c["papel"], "personalidade": c.get("descricao", ""), "motivacao": "", "arco": c.get("transformacao", "")}
+            else:
+                sheet = dict(sheet, nome=c["nome"], papel=c["papel"])
+            sheets.append(sheet)
+        if unanswered and answered_ok:
+            self._record_fallback(book, "character_sheets", "incomplete")
+        return sheets
+
+    def _character_sheet_answers(
+        self,
+        book: Book,
+        batch: List[Dict[str, Any]],
+        extra_summary: Optional[Dict[str, Any]],
+        record: Optional[Book],
+    ) -> Tuple[Dict[str, Dict[str, Any]], bool]:
+        """One structured request for `batch`: (sheets by lower-cased name, parsed ok); fallbacks go to `record`."""
+        schema = {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "character_sheets",
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "character_sheets": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "nome": {"type": "string"},
+                                    "papel": {"type": "string"},
+                                    "idade": {"type": "string"},
+                                    "aparencia": {"type": "string"},
+                                    "personalidade": {"type": "string"},
+                                    "historia": {"type": "string"},
+                                    "motivacao": {"type": "string"},
+                                    "medo": {"type": "string"},
+                                    "arco": {"type": "string"}
+                                },
+                                "required": ["nome", "papel", "personalidade", "motivacao"]
+                            },
+                            "minItems": len(batch),
+                        }
+                    },
+                    "required": ["character_sheets"],
+                },
+            },
+        }
+
+        prompt_system = self.prompts.get("system_character_sheet", "Você é um assistente que cria fichas de personagens em JSON válido.")
+        prompt_user_template = self.prompts.get("user_character_sheet", "Escreva uma ficha para cada personagem: {{personagens}}")
+
+        personagens = json.dumps(batch, ensure_ascii=False)
+        prompt_user = (
+            prompt_user_template
+            .replace("{{personagens}}", personagens)
+            .replace("{{logline}}", str(getattr(book, "logline", "") or ""))
+            .replace("{{tema}}", str(getattr(book, "tema", "") or ""))
+            .replace("{{conceito}}", str(getattr(book, "conceito", "") or ""))
+            .replace("{{genero}}", str(getattr(book, "genre", None) or getattr(book, "genero", "") or ""))
+        )
+
+        prompts = [
+            {"role": "system", "content": prompt_system},
+            {"role": "user", "content": prompt_user},
+        ]
+
+        if extra_summary:
+            ctx = _summary_json(extra_summary)
+            prompts[-1]["content"] += f" Context: {ctx}"
+
+        parsed = self._request_json(prompts, schema, record)
+        answered: Dict[str, Dict[str, Any]] = {}
+        if parsed.ok:
+            for sheet in parsed.value:
+                if isinstance(sheet, dict) and sheet.get("nome"):
+                    answered.setdefault(str(sheet["nome"]).strip().lower(), sheet)
+        return answered, parsed.ok
+
     def generate_logline_expansion(self, book: Book, extra_summary: Optional[Dict[str, Any]] = None) -> str:
         """
         Expand the book's `logline` into a single paragraph describing:
@@ -727,14 +1382,15 @@ class LLMBookGenerator:
         )
 
         # Provide the entire book as JSON context to the model
-        try:
-            book_json = book.to_json()
-        except Exception:
-            # Fallback to dict if to_json isn't available
+        with profiling.section("serialization"):
             try:
-                book_json = json.dumps(book.to_dict(), ensure_ascii=False)
+                book_json = book.to_json()
             except Exception:
-                book_json = str(book.__dict__)
+                # Fallback to dict if to_json isn't available
+                try:
+                    book_json = json.dumps(book.to_dict(), ensure_ascii=False)
+                except Exception:
+                    book_json = str(book.__dict__)
 
         user_msg = (
             f"Expand this logline into one paragraph (premise, major disasters/conflicts, ending):\n\n"
@@ -746,36 +1402,13 @@ class LLMBookGenerator:
             {"role": "user", "content": user_msg},
         ]
 
-        url = _build_endpoint(self.entrypoint.base_url, "chat/completions")
-        headers = {
-            "Authorization": f"Bearer {self.entrypoint.api_key}",
-            "Content-Type": "application/json",
-        }
-        payload = {
-            "model": self.entrypoint.model,
-            "messages": messages,
-            "temperature": self.temperature,
-            "max_tokens": self.max_tokens,
-        }
-
-        # Ensure string content
-        for m in payload["messages"]:
-            if not isinstance(m.get("content"), str):
-                m["content"] = json.dumps(m.get("content"), ensure_ascii=False)
-
-        resp = requests.post(url, headers=headers, json=payload, timeout=60)
-        try:
-            resp.raise_for_status()
-        except requests.exceptions.HTTPError:
-            # Attach response text to exception for debugging
-            raise
-        data = resp.json()
         try:
-            content = data["choices"][0]["message"]["content"]
-        except Exception:
-            # Unexpected shape
-            return ""
-
+            content = self.entrypoint.generate_text(messages, temperature=self.temperature, step="logline_expansion")
+        except LLMUnavailableError as exc:
+            reason = "circuit_open" if isinstance(exc, CircuitOpenError) else "unavailable"
+            self._record_fallback(book, "logline_expansion", reason)
+            # fallback: the logline itself still gives the acts step something to work with
+            return str(book.logline)
         return content.strip()
 
 
@@ -836,49 +1469,41 @@ class LLMBookGenerator:
             {"role": "user", "content": user_msg},
         ]
 
+        cleaned: List[Dict[str, Any]] = []
         try:
-            result = self.entrypoint.generate_json(prompts, response_schema=schema, temperature=self.temperature, max_tokens=600)
-            parsed = self._parse_structured(result, "acts")
-            if isinstance(parsed, list) and len(parsed) >= 3:
-                # Normalize items to expected shape
-                cleaned = []
-                for item in parsed[:3]:
-                    if isinstance(item, dict):
-                        cleaned.append({
-                            "act": int(item.get("act", len(cleaned) + 1)),
-                            "description": str(item.get("description", "")).strip(),
-                            "disaster_point": str(item.get("disaster_point", "")).strip(),
-                        })
+            # invalid or missing acts are re-requested on their own
+            parsed = self._request_items(prompts, schema, book, min_items=3, item_key=_act_key)
+            if parsed.ok:
+                # Normalize items to expected shape (one per act number 1-3).
+                # An act answered twice (e.g. echoed by a repair answer) is
+                # dropped, never relabelled as another act; only items with
+                # no usable number take the act numbers left free.
+                items = [item for item in parsed.value if isinstance(item, dict)]
+                by_number: Dict[int, Dict[str, Any]] = {}
+                for item in items:
+                    number = _act_number(item)
+                    if number in (1, 2, 3) and number not in by_number:
+                        by_number[number] = item
+                free = sorted({1, 2, 3} - set(by_number))
+                for item in items:
+                    if free and _act_number(item) not in (1, 2, 3):
+                        by_number[free.pop(0)] = item
+                for number, item in sorted(by_number.items()):
+                    cleaned.append({
+                        "act": number,
+                        "description": str(item.get("description", "")).strip(),
+                        "disaster_point": str(item.get("disaster_point", "")).strip(),
+                    })
                 if len(cleaned) >= 3:
-                    return cleaned
+                    return sorted(cleaned, key=lambda a: a["act"])
+                self._record_fallback(book, "acts", "incomplete")
         except Exception:
             # fall through to heuristic fallback
-            pass
-
-        # Heuristic fallback: extract candidate sentences from the expanded logline
-        import re
-
-        sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+", text) if s.strip()]
-        # keywords to prioritize for disasters
-        kws = ["desastre", "desapare", "brecha", "fragment", "falha", "sacrif", "experimento", "rebeld", "risco", "consequ"]
-        candidates = []
-        for s in sentences:
-            low = s.lower()
-            if any(k in low for k in kws):
-                candidates.append(s)
-        # if not enough candidates, use the longest sentences
-        if len(candidates) < 3:
-            # combine candidates with longest sentences until 3
-            remaining = [s for s in sentences if s not in candidates]
-            remaining_sorted = sorted(remaining, key=lambda x: -len(x))
-            for s in remaining_sorted:
-                if len(candidates) >= 3:
-                    break
-                candidates.append(s)
+            self._record_fallback(book, "acts", "error")
 
-        # ensure we have at least 3 items
-        while len(candidates) < 3:
-            candidates.append("Uma virada dramática que altera o curso da história.")
+        # Heuristic fallback: disaster sentences of the expanded logline
+        # (keyword sentences, then the longest ones; see disaster_points.py)
+        candidates = self.disaster_points.extract(text, 3)
 
         acts = []
         # Map candidates to acts with narrative rules
@@ -898,46 +1523,120 @@ class LLMBookGenerator:
             "disaster_point": candidates[2],
         })
 
+        if cleaned:
+            # keep the acts the LLM did answer, the heuristic fills the rest
+            present = {a["act"] for a in cleaned}
+            acts = sorted(cleaned + [a for a in acts if a["act"] not in present], key=lambda a: a["act"])
         return acts
 
 
-    def build_book_structure_with_llm(
-        self,
-        temperature: float ,
-        max_tokens: int = 1500,
-    ) -> Book:
-        """
-        Calls the LLM to generate a book structure and returns a Book object.
-        - api_key: OpenAI-compatible API key
-        - base_url: API base URL (default: OpenAI)
-        - model: model name
-        - book_title, author: optional metadata
-        - extra_summary: dict with keys like 'conceito', 'trama', etc.
-        - structure_config: dict with structure numbers (acts, chapters, etc.)
-        """
-        book_title = None
-        author = None
-        extra_summary = None
-    
-        
-        
-        book = Book()
-        
-        book.genre = choose( "The genre of the book is",  self.generate_genres(extra_summary ) )
-        book.conceito = choose( "The conceito of the book is",  self.generate_conceitos( book, extra_summary ) )
+    # Pipeline steps in execution order; each `_step_<name>` fills the Book field(s) it names.
+    PIPELINE = [
+        "genre",
+        "conceito",
+        "logline",
+        "tema",
+        "logline_expanded",
+        "acts",
+        "protagonistas",
+        "antagonistas",
+        "character_sheets",
+    ]
+
+    # Steps that pick one of several LLM candidates, with the message shown by the chooser
+    CHOICE_STEPS = {
+        "genre": "The genre of the book is",
+        "conceito": "The conceito of the book is",
+        "logline": "The logline of the book is",
+        "tema": "The tema of the book is",
+    }
+
+    def run_step(self, name: str, book: Book, extra_summary: Optional[Dict[str, Any]] = None) -> None:
+        """Run a single pipeline step on `book` (see `PIPELINE`); memoized when `self.memo` is set."""
+        with profiling.step(name, book):
+            self._run_step(name, book, extra_summary)
+
+    def _run_step(self, name: str, book: Book, extra_summary: Optional[Dict[str, Any]]) -> None:
+        if self.memo is None or name in self.CHOICE_STEPS:
+            getattr(self, f"_step_{name}")(book, extra_summary)
+            return
+        key = self.memo.key(name, book, extra_summary, self._memo_settings(name))
+        cached = self.memo.get(key)
+        if cached is not None:
+            for field_name, value in cached.items():
+                setattr(book, field_name, value)
+            return
+        mark = len(book.fallbacks)
+        getattr(self, f"_step_{name}")(book, extra_summary)
+        outputs = {f: getattr(book, f) for f in step_outputs(name)}
+        # a missing output is a failure even when no fallback was recorded
+        if len(book.fallbacks) == mark and all(v is not None for v in outputs.values()):
+            self.memo.put(key, outputs)
+
+    def step_candidates(self, name: str, book: Book, extra_summary: Optional[Dict[str, Any]] = None) -> List[Any]:
+        """Generate the candidates of a choice step (see `CHOICE_STEPS`) without choosing one."""
+        if self.memo is None:
+            return getattr(self, f"_candidates_{name}")(book, extra_summary)
+        key = self.memo.key(name, book, extra_summary, self._memo_settings(name))
+        cached = self.memo.get(key)
+        if cached is not None:
+            return cached
+        mark = len(book.fallbacks)
+        candidates = getattr(self, f"_candidates_{name}")(book, extra_summary)
+        if len(book.fallbacks) == mark:
+            self.memo.put(key, candidates)
+        return candidates
+
+    def _memo_settings(self, name: str) -> List[Any]:
+        """Model, endpoint and temperature of each request of step `name` (part of its memo key)."""
+        settings: List[Any] = []
+        for request in STEP_REQUESTS.get(name, [name]):
+            route = self.entrypoint.routes.for_step(request)
+            temperature = self.temperature if route.temperature is None else route.temperature
+            settings.append([request, route.model or self.entrypoint.model, route.base_url, temperature])
+        return settings
+
+    def choose_candidate(self, name: str, candidates: List[Any]) -> Any:
+        return self.chooser(self.CHOICE_STEPS[name], candidates, self.rng)
+
+    def _candidates_genre(self, book: Book, extra_summary: Optional[Dict[str, Any]]) -> List[str]:
+        return self.generate_genres(extra_summary, book)
+
+    def _candidates_conceito(self, book: Book, extra_summary: Optional[Dict[str, Any]]) -> List[str]:
+        return self.generate_conceitos(book, extra_summary)
+
+    def _candidates_logline(self, book: Book, extra_summary: Optional[Dict[str, Any]]) -> List[str]:
         # Logline should come before trama and must not depend on trama
-        book.logline = choose( "The logline of the book is",  self.generate_loglines( book, extra_summary ) )
+        return self.generate_loglines(book, extra_summary)
+
+    def _candidates_tema(self, book: Book, extra_summary: Optional[Dict[str, Any]]) -> List[str]:
+        return self.generate_temas(book, extra_summary)
+
+    def _step_genre(self, book: Book, extra_summary: Optional[Dict[str, Any]]) -> None:
+        book.genre = self.choose_candidate("genre", self.step_candidates("genre", book, extra_summary))
+
+    def _step_conceito(self, book: Book, extra_summary: Optional[Dict[str, Any]]) -> None:
+        book.conceito = self.choose_candidate("conceito", self.step_candidates("conceito", book, extra_summary))
+
+    def _step_logline(self, book: Book, extra_summary: Optional[Dict[str, Any]]) -> None:
+        book.logline = self.choose_candidate("logline", self.step_candidates("logline", book, extra_summary))
         # Trama can use conceito and optionally the generated logline
         #book.trama = choose( "The trama of the book is",  self.generate_tramas( book, extra_summary ) )
-        book.tema = choose( "The tema of the book is",  self.generate_temas( book, extra_summary ) )
 
+    def _step_tema(self, book: Book, extra_summary: Optional[Dict[str, Any]]) -> None:
+        book.tema = self.choose_candidate("tema", self.step_candidates("tema", book, extra_summary))
+
+    def _step_logline_expanded(self, book: Book, extra_summary: Optional[Dict[str, Any]]) -> None:
         # Expand the selected logline into a descriptive paragraph and attach to book
         try:
             expanded = self.generate_logline_expansion(book, extra_summary)
             book.logline_expanded = expanded
         except Exception:
+            # recorded, so the missing expansion is visible and not memoized
+            self._record_fallback(book, "logline_expansion", "error")
             book.logline_expanded = None
-               
+
+    def _step_acts(self, book: Book, extra_summary: Optional[Dict[str, Any]]) -> None:
         # Generate a 3-act outline based on the expanded logline (tries LLM then fallback)
         try:
             acts = self.generate_three_acts_from_logline(book, extra_summary)
@@ -946,32 +1645,16 @@ class LLMBookGenerator:
         except Exception:
             # leave book.acts as default/empty if generation fails
             pass
-   
 
-         
+    def _step_protagonistas(self, book: Book, extra_summary: Optional[Dict[str, Any]]) -> None:
         protos = self.generate_protagonistas( book, extra_summary )
         for p in protos:
-            if "nome" in p:
-                print("  Protagonist:", p["nome"]) 
-
-        ants = self.generate_antagonistas( book, extra_summary )
-        for a in ants:
-            if "nome" in a:
-                print("  Antagonist:", a["nome"])
-
-        # Attach lists for backward compatibility
+            if "nome" in p and self.announce is not None:
+                self.announce("Protagonist", p["nome"])
+        # Attach list for backward compatibility
         book.protagonistas = protos
-        book.antagonistas = ants
 
-        # Generate character sheets (fichas) for important characters
-        try:
-            sheets = self.generate_character_sheets(book, extra_summary)
-            if sheets:
-                book.character_sheets = sheets
-        except Exception:
-            pass
-
-        # Set primary hero/villain fields on Book to the name only (avoid duplicating ficha)
+        # Set primary hero field on Book to the name only (avoid duplicating ficha)
         try:
             if protos and isinstance(protos, list) and isinstance(protos[0], dict):
                 book.heroi = protos[0].get("nome")
@@ -981,6 +1664,14 @@ class LLMBookGenerator:
                     book.heroi = protos[0]
         except Exception:
             pass
+
+    def _step_antagonistas(self, book: Book, extra_summary: Optional[Dict[str, Any]]) -> None:
+        ants = self.generate_antagonistas( book, extra_summary )
+        for a in ants:
+            if "nome" in a and self.announce is not None:
+                self.announce("Antagonist", a["nome"])
+        book.antagonistas = ants
+
         try:
             if ants and isinstance(ants, list) and isinstance(ants[0], dict):
                 book.vilao = ants[0].get("nome")
@@ -990,8 +1681,68 @@ class LLMBookGenerator:
         except Exception:
             pass
 
+    def _step_character_sheets(self, book: Book, extra_summary: Optional[Dict[str, Any]]) -> None:
+        # Generate character sheets (fichas) for important characters; the
+        # method streams them into book.character_sheets itself
+        self.generate_character_sheets(book, extra_summary)
+
+    def build_book_structure_with_llm(
+        self,
+        temperature: float ,
+        max_tokens: int = 1500,
+        extra_summary: Optional[Dict[str, Any]] = None,
+        seed: Optional[int] = None,
+        book: Optional[Book] = None,
+    ) -> Book:
+        """
+        Calls the LLM to generate a book structure and returns a Book object.
+        - extra_summary: dict with keys like 'conceito', 'trama', etc.
+        - seed: makes the choices between candidates reproducible
+        - book: optional pre-filled Book; steps whose field is already set
+          (e.g. a fixed `genre`) are skipped
+        """
+        # a fresh stream per book: an unseeded book must not continue the
+        # previous seeded book's choices
+        if seed is not None:
+            import random
+            self.rng = random.Random(seed)
+        else:
+            self.rng = None
+
+        book = book or Book()
+        for name in self.PIPELINE:
+            if getattr(book, name, None):
+                continue
+            self.run_step(name, book, extra_summary)
         return book 
 
+    def regenerate(
+        self,
+        book: Book,
+        changed_fields: List[str],
+        extra_summary: Optional[Dict[str, Any]] = None,
+    ) -> List[str]:
+        """
+        Recompute only the steps downstream of `changed_fields` (already set on `book`).
+
+        Outputs of the affected steps (and their recorded fallbacks) are cleared
+        first so no stale value leaks into the prompts, then the steps run in
+        pipeline order; everything else is kept. With `self.memo` set, steps
+        whose inputs were seen before are served from the memo. Returns the
+        names of the recomputed steps.
+        """
+        steps = dependents(changed_fields, self.PIPELINE)
+        defaults = Book()
+        stale = set()
+        for name in steps:
+            for field_name in step_outputs(name):
+                setattr(book, field_name, getattr(defaults, field_name))
+            stale.update(STEP_REQUESTS.get(name, ()))
+        book.fallbacks = [f for f in book.fallbacks if f.get("step") not in stale]
+        for name in steps:
+            self.run_step(name, book, extra_summary)
+        return steps
+
 
 def _build_endpoint(base_api: str, path: str) -> str:
     base = base_api.rstrip('/')
@@ -1005,8 +1756,9 @@ def build_book_structure_with_llm(
     model: str = "gpt-3.5-turbo",
     temperature: float = 0.9,
     max_tokens: int = 1500,
+    entrypoint: Optional[LLMentryPoint] = None,
 ) -> Book:
-    generator = LLMBookGenerator( api_key=api_key, base_url=base_url, model=model )
+    generator = LLMBookGenerator( api_key=api_key, base_url=base_url, model=model, entrypoint=entrypoint )
     return generator.build_book_structure_with_llm(
         temperature=temperature,
         max_tokens=max_tokens,
@@ -0,0 +1,339 @@
+"""Offline batch submission of pipeline requests.
+
+For overnight runs latency does not matter, cost and server throughput do.
+`BatchPipeline` runs the book pipeline level by level across many books:
+for each level it runs the level's steps on every book with a
+`BatchEntryPoint`, which records each chat request instead of sending it.
+All recorded requests are written as one OpenAI-batch-style JSONL file
+(`{"custom_id", "method", "url", "body"}` per line) and handed to a
+submitter. When the output arrives the same steps are run again and the
+entrypoint answers each request from the batch results, so the
+`generate_*` methods, their parsing and their fallbacks are reused as-is.
+
+Submitters:
+  - OpenAIBatchSubmitter: uploads the file to `/v1/files`, creates a job on
+    `/v1/batches`, polls it and downloads the output file.
+  - LocalBatchProcessor: stand-in that runs the JSONL file against a normal
+    chat endpoint (or any callable) and writes an output file in the same
+    format; used for testing and for servers without a batch API.
+
+Example:
+    generator = LLMBookGenerator(api_key, entrypoint=BatchEntryPoint(api_key, base_url))
+    books = BatchPipeline(generator, LocalBatchProcessor(LLMentryPoint(api_key, base_url)), "batch_runs").run(1000)
+"""
+from __future__ import annotations
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from book_dataclasses import Book
+from circuit_breaker import LLMUnavailableError
+from LLMStructure import LLMBookGenerator, LLMentryPoint, _build_endpoint, _payload_key
+
+CHAT_COMPLETIONS_URL = "/v1/chat/completions"
+
+# Steps grouped by dependency level: every step of a level only needs fields
+# filled by earlier levels, so one batch job can serve a whole level.
+BATCH_LEVELS: List[List[str]] = [
+    ["genre"],
+    ["conceito"],
+    ["logline", "tema"],
+    ["logline_expanded", "protagonistas", "antagonistas"],
+    ["acts"],
+    ["character_sheets"],
+]
+
+
+class BatchDeferred(BaseException):
+    """
+    Raised by BatchEntryPoint after recording a request whose result is not known yet.
+
+    Derives from BaseException (like GeneratorExit) so the generators'
+    `except Exception` fallbacks do not swallow it: the step is simply
+    re-run once the batch results are in.
+    """
+
+
+@dataclass
+class BatchRequest:
+    custom_id: str
+    book_key: str
+    step: Optional[str]
+    fingerprint: str
+    body: Dict[str, Any]
+
+    def to_line(self) -> Dict[str, Any]:
+        return {"custom_id": self.custom_id, "method": "POST", "url": CHAT_COMPLETIONS_URL, "body": self.body}
+
+
+class BatchEntryPoint(LLMentryPoint):
+    """
+    LLMentryPoint that records requests (collect mode) and answers them from
+    batch results (replay mode) instead of calling the server.
+
+    `current_book` must be set to the key of the book whose step is running;
+    results are looked up by (book key, payload fingerprint).
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.current_book: str = ""
+        self.collecting = True
+        self.pending: List[BatchRequest] = []
+        self._results: Dict[Tuple[str, str], Optional[Dict[str, Any]]] = {}
+        self._seq = 0
+
+    def _complete(self, payload: Dict[str, Any], step: Optional[str] = None):
+        fingerprint = _payload_key(payload)
+        key = (self.current_book, fingerprint)
+        if key not in self._results:
+            if not self.collecting:
+                raise LLMUnavailableError(f"no batch result for step {step!r} of {self.current_book}")
+            self._seq += 1
+            body = json.loads(json.dumps(payload, ensure_ascii=False, default=str))
+            for m in body.get("messages", []):
+                if not isinstance(m.get("content"), str):
+                    m["content"] = json.dumps(m.get("content"), ensure_ascii=False)
+            self.pending.append(BatchRequest(
+                custom_id=f"{self.current_book}:{step or 'chat'}:{self._seq}",
+                book_key=self.current_book,
+                step=step,
+                fingerprint=fingerprint,
+                body=body,
+            ))
+            raise BatchDeferred(step)
+
+        data = self._results[key]
+        if data is None:
+            raise LLMUnavailableError(f"batch request failed for step {step!r} of {self.current_book}")
+        try:
+            content = data["choices"][0]["message"]["content"]
+        except Exception:
+            return None, data
+        usage = data.get("usage", {}).get("completion_tokens", len(content or "") // 4)
+        self.budget.record(step, usage)
+        return content, data
+
+    def take_pending(self) -> List[BatchRequest]:
+        pending, self.pending = self.pending, []
+        return pending
+
+    def add_results(self, requests: List[BatchRequest], results: Dict[str, Optional[Dict[str, Any]]]) -> None:
+        """Map batch output (custom_id -> response body or None) back to (book, request)."""
+        for req in requests:
+            self._results[(req.book_key, req.fingerprint)] = results.get(req.custom_id)
+
+
+def write_batch_file(path: str, requests: List[BatchRequest]) -> str:
+    with open(path, "w", encoding="utf-8") as f:
+        for req in requests:
+            f.write(json.dumps(req.to_line(), ensure_ascii=False) + "\n")
+    return path
+
+
+def read_batch_output(path: str) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Parse a batch output JSONL file into `{custom_id: response body or None on error}`."""
+    results: Dict[str, Optional[Dict[str, Any]]] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            ok = not item.get("error") and int(response.get("status_code", 200)) < 400
+            results[item.get("custom_id")] = response.get("body") if ok else None
+    return results
+
+
+class LocalBatchProcessor:
+    """
+    Processes a batch input file locally and writes a batch output file.
+
+    Each line's body is sent through `handler` (default: the chat endpoint of
+    `entrypoint`), with up to `max_workers` requests in flight.
+    """
+
+    def __init__(
+        self,
+        entrypoint: Optional[LLMentryPoint] = None,
+        handler: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+        max_workers: int = 8,
+    ):
+        if handler is None and entrypoint is None:
+            raise ValueError("LocalBatchProcessor needs an entrypoint or a handler")
+        self.handler = handler or entrypoint._post_chat
+        self.max_workers = max_workers
+
+    def submit(self, input_path: str) -> str:
+        with open(input_path, "r", encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+
+        def run(item: Dict[str, Any]) -> Dict[str, Any]:
+            try:
+                body = self.handler(item["body"])
+                return {"custom_id": item["custom_id"], "response": {"status_code": 200, "body": body}, "error": None}
+            except Exception as exc:
+                return {"custom_id": item["custom_id"], "response": None, "error": {"message": str(exc)}}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            out = list(pool.map(run, lines))
+        output_path = _output_path(input_path)
+        with open(output_path, "w", encoding="utf-8") as f:
+            for item in out:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        return output_path
+
+
+class OpenAIBatchSubmitter:
+    """Submits a batch input file to an OpenAI-compatible `/v1/batches` API and waits for the output."""
+
+    TERMINAL = {"completed", "failed", "expired", "cancelled"}
+
+    def __init__(
+        self,
+        entrypoint: LLMentryPoint,
+        completion_window: str = "24h",
+        poll_interval: float = 30.0,
+        timeout: Optional[float] = None,
+    ):
+        self.entrypoint = entrypoint
+        self.completion_window = completion_window
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+    def _url(self, path: str) -> str:
+        return _build_endpoint(self.entrypoint.base_url, path)
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.entrypoint.api_key}"}
+
+    def submit(self, input_path: str) -> str:
+        session = self.entrypoint.session
+        with open(input_path, "rb") as fh:
+            resp = session.post(
+                self._url("files"),
+                headers=self._headers(),
+                files={"file": (os.path.basename(input_path), fh)},
+                data={"purpose": "batch"},
+                timeout=300,
+            )
+        resp.raise_for_status()
+        file_id = resp.json()["id"]
+
+        resp = session.post(
+            self._url("batches"),
+            headers=self._headers(),
+            json={"input_file_id": file_id, "endpoint": CHAT_COMPLETIONS_URL, "completion_window": self.completion_window},
+            timeout=60,
+        )
+        resp.raise_for_status()
+        batch = resp.json()
+
+        started = time.monotonic()
+        while batch.get("status") not in self.TERMINAL:
+            if self.timeout is not None and time.monotonic() - started > self.timeout:
+                raise TimeoutError(f"batch {batch.get('id')} still {batch.get('status')} after {self.timeout}s")
+            time.sleep(self.poll_interval)
+            resp = session.get(self._url(f"batches/{batch['id']}"), headers=self._headers(), timeout=60)
+            resp.raise_for_status()
+            batch = resp.json()
+
+        output_path = _output_path(input_path)
+        with open(output_path, "wb") as out:
+            for file_key in ("output_file_id", "error_file_id"):
+                file_id = batch.get(file_key)
+                if not file_id:
+                    continue
+                resp = session.get(self._url(f"files/{file_id}/content"), headers=self._headers(), timeout=300)
+                resp.raise_for_status()
+                out.write(resp.content)
+                if not resp.content.endswith(b"\n"):
+                    out.write(b"\n")
+        return output_path
+
+
+class BatchPipeline:
+    """
+    Runs the book pipeline for many books, one batch job per level.
+
+    `generator.entrypoint` must be a BatchEntryPoint. `submitter` is any
+    object with `submit(input_path) -> output_path`.
+    """
+
+    def __init__(
+        self,
+        generator: LLMBookGenerator,
+        submitter: Any,
+        workdir: str,
+        levels: Optional[List[List[str]]] = None,
+        max_rounds: int = 3,
+    ):
+        if not isinstance(generator.entrypoint, BatchEntryPoint):
+            raise TypeError("BatchPipeline needs a generator whose entrypoint is a BatchEntryPoint")
+        self.generator = generator
+        self.entrypoint: BatchEntryPoint = generator.entrypoint
+        self.submitter = submitter
+        self.workdir = workdir
+        self.levels = levels or BATCH_LEVELS
+        self.max_rounds = max_rounds
+        self.stats: List[Dict[str, Any]] = []
+
+    def run(self, books: Any, extra_summary: Optional[Dict[str, Any]] = None) -> List[Book]:
+        """Generate `books` (a count or a list of Book objects to fill) and return them."""
+        if isinstance(books, int):
+            books = [Book() for _ in range(books)]
+        os.makedirs(self.workdir, exist_ok=True)
+        keys = [f"book-{i}" for i in range(len(books))]
+
+        for level_no, steps in enumerate(self.levels):
+            started = time.monotonic()
+            # first pass records every request of this level
+            self.entrypoint.collecting = True
+            deferred = [
+                (key, book, step)
+                for key, book in zip(keys, books)
+                for step in steps
+                if self._run(key, book, step, extra_summary)
+            ]
+            rounds = 0
+            total = 0
+            while deferred:
+                requests = self.entrypoint.take_pending()
+                if requests:
+                    # one bulk job for the whole level (per round)
+                    input_path = os.path.join(self.workdir, f"level{level_no}_round{rounds}_input.jsonl")
+                    write_batch_file(input_path, requests)
+                    output_path = self.submitter.submit(input_path)
+                    self.entrypoint.add_results(requests, read_batch_output(output_path))
+                    total += len(requests)
+                rounds += 1
+                # re-run deferred steps from the results; a step that issues a
+                # follow-up request gets another round, up to `max_rounds`
+                self.entrypoint.collecting = rounds < self.max_rounds
+                deferred = [d for d in deferred if self._run(d[0], d[1], d[2], extra_summary)]
+            self.stats.append({
+                "level": level_no,
+                "steps": steps,
+                "requests": total,
+                "rounds": rounds,
+                "seconds": round(time.monotonic() - started, 3),
+            })
+        return books
+
+    def _run(self, key: str, book: Book, step: str, extra_summary: Optional[Dict[str, Any]]) -> bool:
+        """Run one step; return True when it was deferred waiting for batch results."""
+        self.entrypoint.current_book = key
+        try:
+            self.generator.run_step(step, book, extra_summary)
+        except BatchDeferred:
+            return True
+        return False
+
+
+def _output_path(input_path: str) -> str:
+    root, ext = os.path.splitext(input_path)
+    return f"{root.replace('_input', '')}_output{ext or '.jsonl'}"
@@ -0,0 +1,160 @@
+"""Startup benchmark and regression check for the storyGenerator entrypoints.
+
+Runs `python -X importtime -c "import <module>"` in fresh interpreters and
+reports the median cumulative import time of each module. It also times
+cold start to first request: a fresh interpreter imports LLMStructure,
+builds an `LLMentryPoint` and sends one `_post_chat` to a local stub
+server; the time runs from process spawn to the decoded answer, so the
+lazy `requests` import and session creation are included. It fails (exit
+code 1) when:
+
+  - a module listed in `LAZY_MODULES` is imported eagerly (e.g. `requests`,
+    which should only load on the first HTTP call), or
+  - the median import time exceeds `--max-ms`, or
+  - the median time to first request exceeds `--max-first-ms`.
+
+Usage:
+    python bench_startup.py                 # report + check
+    python bench_startup.py --runs 20 --max-ms 80 --max-first-ms 400
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Modules measured by default (the CLI entry point and the generator module)
+MODULES = ["main", "LLMStructure"]
+
+# Modules that must not be pulled in by a bare import
+LAZY_MODULES = ["requests", "urllib3"]
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)")
+
+
+def measure_import(module: str) -> Tuple[float, List[str]]:
+    """Import `module` in a fresh interpreter; return (cumulative ms, imported module names)."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=HERE,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr}")
+    cumulative_us = 0
+    names: List[str] = []
+    for line in proc.stderr.splitlines():
+        m = _IMPORTTIME_RE.search(line)
+        if not m:
+            continue
+        name = m.group(3)
+        names.append(name)
+        if name == module:
+            cumulative_us = int(m.group(2))
+    return cumulative_us / 1000.0, names
+
+
+# Child of measure_first_request: prints the wall-clock time of the first answer
+_FIRST_REQUEST = """
+import sys, time
+from LLMStructure import LLMentryPoint
+entry = LLMentryPoint(api_key="bench", base_url=sys.argv[1], model="bench")
+entry._post_chat({"model": "bench", "messages": [{"role": "user", "content": "ping"}], "max_tokens": 1})
+print(time.time())
+"""
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Answers every POST with a one-token chat completion."""
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b'{"choices": [{"message": {"content": "ok"}, "finish_reason": "stop"}], "usage": {"completion_tokens": 1}}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+def measure_first_request(runs: int) -> Dict[str, float]:
+    """Median/min ms from spawning a fresh interpreter to its first `_post_chat` answer."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    times: List[float] = []
+    try:
+        for _ in range(runs):
+            started = time.time()
+            proc = subprocess.run([sys.executable, "-c", _FIRST_REQUEST, url], cwd=HERE, capture_output=True, text=True)
+            if proc.returncode != 0:
+                raise RuntimeError(f"first request failed:\n{proc.stderr}")
+            times.append((float(proc.stdout.split()[-1]) - started) * 1000.0)
+    finally:
+        server.shutdown()
+        server.server_close()
+    return {"median_ms": statistics.median(times), "min_ms": min(times)}
+
+
+def run(modules: List[str], runs: int) -> Dict[str, Dict[str, object]]:
+    report: Dict[str, Dict[str, object]] = {}
+    for module in modules:
+        times: List[float] = []
+        eager: List[str] = []
+        for _ in range(runs):
+            ms, names = measure_import(module)
+            times.append(ms)
+            eager = [m for m in LAZY_MODULES if m in names]
+        report[module] = {
+            "median_ms": statistics.median(times),
+            "min_ms": min(times),
+            "eager_imports": eager,
+        }
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, default=80.0, help="fail if a median import exceeds this")
+    parser.add_argument("--max-first-ms", type=float, default=400.0,
+                        help="fail if the median time from process start to the first answer exceeds this")
+    parser.add_argument("--no-first-request", action="store_true", help="only time the imports")
+    args = parser.parse_args()
+
+    failed = False
+    for module, r in run(args.modules, args.runs).items():
+        status = "ok"
+        if r["eager_imports"]:
+            status = f"FAIL eager import of {', '.join(r['eager_imports'])}"
+            failed = True
+        elif r["median_ms"] > args.max_ms:
+            status = f"FAIL over budget ({args.max_ms:.1f} ms)"
+            failed = True
+        print(f"{module:<16} median {r['median_ms']:7.2f} ms   min {r['min_ms']:7.2f} ms   {status}")
+    if not args.no_first_request:
+        r = measure_first_request(args.runs)
+        status = "ok"
+        if r["median_ms"] > args.max_first_ms:
+            status = f"FAIL over budget ({args.max_first_ms:.1f} ms)"
+            failed = True
+        print(f"{'first request':<16} median {r['median_ms']:7.2f} ms   min {r['min_ms']:7.2f} ms   {status}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
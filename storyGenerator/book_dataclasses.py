@@ -107,6 +107,12 @@ class Book:
     acts: List[Act] = field(default_factory=list)
     # character_sheets: fichas geradas pelo LLM para personagens importantes
     character_sheets: List[Dict[str, Any]] = field(default_factory=list)
+    # fallbacks: steps that used a fallback/cached value instead of a fresh LLM answer
+    # (each entry: {"step": ..., "reason": ...})
+    fallbacks: List[Dict[str, Any]] = field(default_factory=list)
+    # summaries: rolling scene/chapter/act/book summaries kept by SummaryMemory
+    # (keys "book", "act:0", "chapter:0.1", "scene:0.1.2")
+    summaries: Dict[str, str] = field(default_factory=dict)
 
     def add_act(self, act: Act) -> Act:
         self.acts.append(act)
@@ -147,6 +153,9 @@ class Book:
             # `acts` may contain `Act` instances or plain dicts produced by LLM helpers.
             "acts": [a.to_dict() if hasattr(a, "to_dict") else a for a in self.acts],
             "character_sheets": self.character_sheets,
+            "fallbacks": self.fallbacks,
+            # rolling continuity summaries (summary_memory.py), only once there are any
+            **({"summaries": self.summaries} if self.summaries else {}),
         }
 
     def to_json(self, **kwargs) -> str:
@@ -218,6 +227,8 @@ class Book:
             book.character_sheets = data.get("character_sheets", []) or []
         except Exception:
             book.character_sheets = []
+        book.fallbacks = data.get("fallbacks", []) or []
+        book.summaries = data.get("summaries") or {}
         return book
 
 
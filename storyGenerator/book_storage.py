@@ -0,0 +1,315 @@
+"""SQLite storage backend for generated books.
+
+Each node of a `Book` is stored as its own row (books, acts, chapters,
+scenes, beats, characters), with indexes on the fields we query by (genre,
+tema, chapter id, character name). That allows partial loads, such as one
+chapter or every logline of a genre, without deserializing whole books.
+
+- Writes are batched: `save_many` inserts any number of books in a single
+  transaction with `executemany`.
+- The database runs in WAL mode so several batch workers can write to it
+  while readers keep reading.
+- `load_dict(book_id)` returns exactly `book.to_dict()` of the saved book,
+  and `load(book_id)` is `Book.from_dict(load_dict(book_id))`.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from book_dataclasses import Act, Beat, Book, Chapter, Scene
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT,
+    author TEXT,
+    genre TEXT,
+    genero TEXT,
+    conceito TEXT,
+    trama TEXT,
+    logline TEXT,
+    logline_expanded TEXT,
+    tema TEXT,
+    heroi TEXT,
+    vilao TEXT,
+    character_sheets TEXT,
+    fallbacks TEXT,
+    summaries TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_books_genre ON books (genre);
+CREATE INDEX IF NOT EXISTS idx_books_tema ON books (tema);
+
+CREATE TABLE IF NOT EXISTS acts (
+    book_id INTEGER NOT NULL REFERENCES books (id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    act_id TEXT,
+    title TEXT,
+    data TEXT,
+    PRIMARY KEY (book_id, idx)
+);
+
+CREATE TABLE IF NOT EXISTS chapters (
+    book_id INTEGER NOT NULL REFERENCES books (id) ON DELETE CASCADE,
+    act_idx INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    chapter_id TEXT,
+    title TEXT,
+    PRIMARY KEY (book_id, act_idx, idx)
+);
+CREATE INDEX IF NOT EXISTS idx_chapters_id ON chapters (book_id, chapter_id);
+
+CREATE TABLE IF NOT EXISTS scenes (
+    book_id INTEGER NOT NULL REFERENCES books (id) ON DELETE CASCADE,
+    act_idx INTEGER NOT NULL,
+    chapter_idx INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    scene_id TEXT,
+    title TEXT,
+    PRIMARY KEY (book_id, act_idx, chapter_idx, idx)
+);
+
+CREATE TABLE IF NOT EXISTS beats (
+    book_id INTEGER NOT NULL REFERENCES books (id) ON DELETE CASCADE,
+    act_idx INTEGER NOT NULL,
+    chapter_idx INTEGER NOT NULL,
+    scene_idx INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    text TEXT,
+    contents TEXT,
+    PRIMARY KEY (book_id, act_idx, chapter_idx, scene_idx, idx)
+);
+
+CREATE TABLE IF NOT EXISTS characters (
+    book_id INTEGER NOT NULL REFERENCES books (id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    nome TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (book_id, role, idx)
+);
+CREATE INDEX IF NOT EXISTS idx_characters_nome ON characters (nome);
+"""
+
+_BOOK_TEXT_FIELDS = ("title", "author", "genre", "genero", "conceito", "trama", "logline", "logline_expanded", "tema")
+_ROLES = ("protagonistas", "antagonistas")
+
+
+class BookStore:
+    """Row-per-node SQLite store for `Book` objects."""
+
+    def __init__(self, path: str):
+        self.path = path
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30.0, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(_SCHEMA)
+        # stores created before the summaries column existed
+        columns = {r["name"] for r in self._conn.execute("PRAGMA table_info(books)")}
+        if "summaries" not in columns:
+            self._conn.execute("ALTER TABLE books ADD COLUMN summaries TEXT")
+
+    def close(self) -> None:
+        self._conn.close()
+
+    # ------------------------------------------------------------------ write
+
+    def save(self, book: Any) -> int:
+        return self.save_many([book])[0]
+
+    def save_many(self, books: Iterable[Any]) -> List[int]:
+        """Insert `books` (Book objects or `to_dict()` dicts) in one transaction; returns their ids."""
+        rows: Dict[str, List[Tuple[Any, ...]]] = {"acts": [], "chapters": [], "scenes": [], "beats": [], "characters": []}
+        ids: List[int] = []
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            for book in books:
+                d = book.to_dict() if hasattr(book, "to_dict") else book
+                cur = self._conn.execute(
+                    "INSERT INTO books (title, author, genre, genero, conceito, trama, logline, logline_expanded, "
+                    "tema, heroi, vilao, character_sheets, fallbacks, summaries, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    tuple(d.get(k) for k in _BOOK_TEXT_FIELDS)
+                    + (
+                        _dumps(d.get("heroi")),
+                        _dumps(d.get("vilao")),
+                        _dumps(d.get("character_sheets") or []),
+                        _dumps(d.get("fallbacks") or []),
+                        _dumps(d.get("summaries")) if d.get("summaries") else None,
+                        now,
+                    ),
+                )
+                book_id = cur.lastrowid
+                ids.append(book_id)
+                _collect_rows(book_id, d, rows)
+            self._conn.executemany("INSERT INTO acts VALUES (?, ?, ?, ?, ?)", rows["acts"])
+            self._conn.executemany("INSERT INTO chapters VALUES (?, ?, ?, ?, ?)", rows["chapters"])
+            self._conn.executemany("INSERT INTO scenes VALUES (?, ?, ?, ?, ?, ?)", rows["scenes"])
+            self._conn.executemany("INSERT INTO beats VALUES (?, ?, ?, ?, ?, ?, ?)", rows["beats"])
+            self._conn.executemany("INSERT INTO characters VALUES (?, ?, ?, ?, ?)", rows["characters"])
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return ids
+
+    def delete(self, book_id: int) -> None:
+        self._conn.execute("DELETE FROM books WHERE id = ?", (book_id,))
+
+    # ------------------------------------------------------------------- read
+
+    def load_dict(self, book_id: int) -> Optional[Dict[str, Any]]:
+        """Return the saved book as `Book.to_dict()` produced it, or None."""
+        row = self._conn.execute("SELECT * FROM books WHERE id = ?", (book_id,)).fetchone()
+        if row is None:
+            return None
+        chars: Dict[str, List[Any]] = {r: [] for r in _ROLES}
+        for c in self._conn.execute(
+            "SELECT role, data FROM characters WHERE book_id = ? ORDER BY role, idx", (book_id,)
+        ):
+            chars.setdefault(c["role"], []).append(json.loads(c["data"]))
+        out: Dict[str, Any] = {k: row[k] for k in ("title", "author", "genre", "genero", "conceito", "trama", "logline", "logline_expanded", "tema")}
+        out.update({
+            "heroi": _loads(row["heroi"]),
+            "vilao": _loads(row["vilao"]),
+            "protagonistas": chars["protagonistas"],
+            "antagonistas": chars["antagonistas"],
+            "acts": self._load_acts(book_id),
+            "character_sheets": _loads(row["character_sheets"]) or [],
+            "fallbacks": _loads(row["fallbacks"]) or [],
+        })
+        summaries = _loads(row["summaries"])
+        if summaries:
+            out["summaries"] = summaries
+        return out
+
+    def load(self, book_id: int) -> Optional[Book]:
+        d = self.load_dict(book_id)
+        return Book.from_dict(d) if d is not None else None
+
+    def load_chapter(self, book_id: int, chapter_id: str) -> Optional[Chapter]:
+        """Load a single chapter (with scenes and beats) by its id."""
+        row = self._conn.execute(
+            "SELECT act_idx, idx, chapter_id, title FROM chapters WHERE book_id = ? AND chapter_id = ?",
+            (book_id, chapter_id),
+        ).fetchone()
+        if row is None:
+            return None
+        chapter = Chapter(id=row["chapter_id"], title=row["title"])
+        for scene in self._load_scenes(book_id, row["act_idx"], row["idx"]):
+            chapter.add_scene(scene)
+        return chapter
+
+    def loglines(self, genre: Optional[str] = None) -> List[Tuple[int, str]]:
+        """`(book_id, logline)` pairs, optionally for one genre (served from the genre index)."""
+        if genre is None:
+            cur = self._conn.execute("SELECT id, logline FROM books ORDER BY id")
+        else:
+            cur = self._conn.execute("SELECT id, logline FROM books WHERE genre = ? ORDER BY id", (genre,))
+        return [(r["id"], r["logline"]) for r in cur]
+
+    def book_ids(self, genre: Optional[str] = None, tema: Optional[str] = None) -> List[int]:
+        sql = "SELECT id FROM books"
+        where: List[str] = []
+        params: List[Any] = []
+        if genre is not None:
+            where.append("genre = ?")
+            params.append(genre)
+        if tema is not None:
+            where.append("tema = ?")
+            params.append(tema)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        return [r[0] for r in self._conn.execute(sql + " ORDER BY id", params)]
+
+    def find_characters(self, nome: str) -> List[Tuple[int, str, Dict[str, Any]]]:
+        """`(book_id, role, character)` for every character with this name."""
+        cur = self._conn.execute("SELECT book_id, role, data FROM characters WHERE nome = ?", (nome,))
+        return [(r["book_id"], r["role"], json.loads(r["data"])) for r in cur]
+
+    def iter_books(self, genre: Optional[str] = None, tema: Optional[str] = None) -> Iterator[Book]:
+        for book_id in self.book_ids(genre=genre, tema=tema):
+            book = self.load(book_id)
+            if book is not None:
+                yield book
+
+    def count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM books").fetchone()[0]
+
+    # ---------------------------------------------------------------- helpers
+
+    def _load_acts(self, book_id: int) -> List[Any]:
+        acts: List[Any] = []
+        for a in self._conn.execute(
+            "SELECT idx, act_id, title, data FROM acts WHERE book_id = ? ORDER BY idx", (book_id,)
+        ):
+            if a["data"] is not None:
+                # plain dict acts (e.g. the three-act outline) are stored verbatim
+                acts.append(json.loads(a["data"]))
+                continue
+            chapters = []
+            for c in self._conn.execute(
+                "SELECT idx, chapter_id, title FROM chapters WHERE book_id = ? AND act_idx = ? ORDER BY idx",
+                (book_id, a["idx"]),
+            ):
+                chapter = Chapter(id=c["chapter_id"], title=c["title"], scenes=self._load_scenes(book_id, a["idx"], c["idx"]))
+                chapters.append(chapter)
+            acts.append(Act(id=a["act_id"], title=a["title"], chapters=chapters).to_dict())
+        return acts
+
+    def _load_scenes(self, book_id: int, act_idx: int, chapter_idx: int) -> List[Scene]:
+        scenes: Dict[int, Scene] = {}
+        for s in self._conn.execute(
+            "SELECT idx, scene_id, title FROM scenes WHERE book_id = ? AND act_idx = ? AND chapter_idx = ? ORDER BY idx",
+            (book_id, act_idx, chapter_idx),
+        ):
+            scenes[s["idx"]] = Scene(id=s["scene_id"], title=s["title"])
+        for b in self._conn.execute(
+            "SELECT scene_idx, text, contents FROM beats WHERE book_id = ? AND act_idx = ? AND chapter_idx = ? "
+            "ORDER BY scene_idx, idx",
+            (book_id, act_idx, chapter_idx),
+        ):
+            scene = scenes.get(b["scene_idx"])
+            if scene is not None:
+                scene.beats.append(Beat(text=b["text"], contents=b["contents"]))
+        return list(scenes.values())
+
+
+def _collect_rows(book_id: int, d: Dict[str, Any], rows: Dict[str, List[Tuple[Any, ...]]]) -> None:
+    for ai, act in enumerate(d.get("acts") or []):
+        is_node = isinstance(act, dict) and set(act) <= {"id", "title", "chapters"}
+        if not is_node:
+            rows["acts"].append((book_id, ai, _get(act, "id"), _get(act, "title"), _dumps(act)))
+            continue
+        rows["acts"].append((book_id, ai, act.get("id"), act.get("title"), None))
+        for ci, ch in enumerate(act.get("chapters") or []):
+            rows["chapters"].append((book_id, ai, ci, ch.get("id"), ch.get("title")))
+            for si, sc in enumerate(ch.get("scenes") or []):
+                rows["scenes"].append((book_id, ai, ci, si, sc.get("id"), sc.get("title")))
+                for bi, bt in enumerate(sc.get("beats") or []):
+                    rows["beats"].append((book_id, ai, ci, si, bi, bt.get("text"), bt.get("contents")))
+    for role in _ROLES:
+        for idx, ch in enumerate(d.get(role) or []):
+            nome = ch.get("nome") if isinstance(ch, dict) else str(ch)
+            rows["characters"].append((book_id, role, idx, nome, _dumps(ch)))
+
+
+def _get(obj: Any, key: str) -> Any:
+    return obj.get(key) if isinstance(obj, dict) else None
+
+
+def _dumps(value: Any) -> Optional[str]:
+    return None if value is None else json.dumps(value, ensure_ascii=False)
+
+
+def _loads(value: Optional[str]) -> Any:
+    return None if value is None else json.loads(value)
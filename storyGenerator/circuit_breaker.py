@@ -0,0 +1,98 @@
+"""Per-endpoint circuit breaker for LLM calls.
+
+When an endpoint is down every book would otherwise wait out full request
+timeouts before using its fallbacks. A `CircuitBreaker` counts consecutive
+failures (connection errors, timeouts, 5xx) and, past `failure_threshold`,
+opens: calls are rejected immediately with `CircuitOpenError` for
+`reset_timeout` seconds. After that one trial call is let through
+(half-open); its outcome closes the circuit again or re-opens it.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class LLMUnavailableError(RuntimeError):
+    """The LLM endpoint could not serve a request (transport error, timeout, 5xx or open circuit)."""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """Raised without contacting the endpoint because its circuit is open."""
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker for a single endpoint.
+
+    - failure_threshold: consecutive failures that open the circuit
+    - reset_timeout: seconds to stay open before allowing a trial call
+    - half_open_max_calls: trial calls allowed at once while half-open
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_max_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trials = 0
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"rejected": 0, "opened": 0, "failures": 0, "successes": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def allow(self) -> bool:
+        """Return True if a call may go out now (reserves a trial slot when half-open)."""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._trials < self.half_open_max_calls:
+                self._trials += 1
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.stats["successes"] += 1
+            self._failures = 0
+            self._trials = 0
+            self._state = CLOSED
+
+    def release(self) -> None:
+        """Give back the trial slot reserved by `allow()` for a call that never went out."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._trials > 0:
+                self._trials -= 1
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.stats["failures"] += 1
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.stats["opened"] += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._trials = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._maybe_half_open()
+            return {"state": self._state, "consecutive_failures": self._failures, **self.stats}
+
+    def _maybe_half_open(self) -> None:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._trials = 0
@@ -0,0 +1,341 @@
+"""Columnar export of generated books and vectorized analytics over them.
+
+Prompt tuning needs aggregates over many runs (genre/tema distributions,
+logline lengths, cast sizes, fallback rates, act lengths). Instead of
+loading every book with `Book.from_dict` and looping in Python,
+`ColumnarWriter` flattens books into typed columns once and
+`ColumnarBooks` answers group-bys and histograms with NumPy over
+memory-mapped arrays.
+
+On-disk layout of a columnar directory:
+
+  - `<column>.npy`: one array per column;
+  - `strings.json`: the string dictionary of every string column (the
+    column stores int32 codes into it, -1 for missing);
+  - `meta.json`: row counts per level and the column list.
+
+Columns come in three levels. Book-level columns have one row per book:
+`genre`, `tema` (strings), `logline_chars`, `logline_words`,
+`logline_expanded_chars`, `protagonistas`, `antagonistas`,
+`character_sheets`, `acts` and `fallbacks` (counts). The other levels have
+one row per act (`acts.book`, `acts.index`, `acts.description_chars`) or per
+fallback (`fallbacks.book`, `fallbacks.step`, `fallbacks.reason`). Their
+`.book` column is the book row, so book-level keys group them too.
+
+NumPy is only needed here and is imported on first use.
+"""
+from __future__ import annotations
+
+import json
+import os
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+STRING_COLUMNS = ("genre", "tema", "fallbacks.step", "fallbacks.reason")
+
+# column -> (array typecode while collecting, numpy dtype)
+COLUMNS: Dict[str, Tuple[str, str]] = {
+    "genre": ("i", "int32"),
+    "tema": ("i", "int32"),
+    "logline_chars": ("i", "int32"),
+    "logline_words": ("i", "int32"),
+    "logline_expanded_chars": ("i", "int32"),
+    "protagonistas": ("h", "int16"),
+    "antagonistas": ("h", "int16"),
+    "character_sheets": ("h", "int16"),
+    "acts": ("h", "int16"),
+    "fallbacks": ("h", "int16"),
+    "acts.book": ("i", "int32"),
+    "acts.index": ("h", "int16"),
+    "acts.description_chars": ("i", "int32"),
+    "fallbacks.book": ("i", "int32"),
+    "fallbacks.step": ("i", "int32"),
+    "fallbacks.reason": ("i", "int32"),
+}
+
+LEVELS = ("acts", "fallbacks")
+
+AGGREGATES = ("count", "sum", "mean", "min", "max")
+
+
+def _np():
+    try:
+        import numpy
+    except ImportError as exc:
+        raise ImportError("columnar export/analytics need NumPy: pip install numpy") from exc
+    return numpy
+
+
+def level_of(column: str) -> str:
+    head = column.split(".", 1)[0]
+    return head if "." in column and head in LEVELS else "books"
+
+
+class ColumnarWriter:
+    """Flattens books into columns; `close()` writes the directory (replacing it)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = 0
+        self._data: Dict[str, array] = {name: array(code) for name, (code, _) in COLUMNS.items()}
+        self._codes: Dict[str, Dict[str, int]] = {name: {} for name in STRING_COLUMNS}
+
+    def __enter__(self) -> "ColumnarWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+
+    def _code(self, column: str, value: Any) -> int:
+        if value is None or value == "":
+            return -1
+        codes = self._codes[column]
+        value = str(value)
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+        return code
+
+    def append(self, book: Any) -> int:
+        """Add a Book (or a `to_dict()` dict); returns its row."""
+        d = book.to_dict() if hasattr(book, "to_dict") else book
+        row = self.rows
+        self.rows += 1
+        data = self._data
+        logline = d.get("logline") or ""
+        acts = d.get("acts") or []
+        fallbacks = d.get("fallbacks") or []
+        data["genre"].append(self._code("genre", d.get("genre") or d.get("genero")))
+        data["tema"].append(self._code("tema", d.get("tema")))
+        data["logline_chars"].append(len(logline))
+        data["logline_words"].append(len(logline.split()))
+        data["logline_expanded_chars"].append(len(d.get("logline_expanded") or ""))
+        data["protagonistas"].append(len(d.get("protagonistas") or []))
+        data["antagonistas"].append(len(d.get("antagonistas") or []))
+        data["character_sheets"].append(len(d.get("character_sheets") or []))
+        data["acts"].append(len(acts))
+        data["fallbacks"].append(len(fallbacks))
+        for i, act in enumerate(acts):
+            text = (act.get("description") or act.get("title") or "") if isinstance(act, dict) else str(act)
+            data["acts.book"].append(row)
+            data["acts.index"].append(i)
+            data["acts.description_chars"].append(len(text))
+        for fb in fallbacks:
+            if not isinstance(fb, dict):
+                continue
+            data["fallbacks.book"].append(row)
+            data["fallbacks.step"].append(self._code("fallbacks.step", fb.get("step")))
+            data["fallbacks.reason"].append(self._code("fallbacks.reason", fb.get("reason")))
+        return row
+
+    def extend(self, books: Iterable[Any]) -> int:
+        n = 0
+        for book in books:
+            self.append(book)
+            n += 1
+        return n
+
+    def close(self) -> None:
+        np = _np()
+        os.makedirs(self.path, exist_ok=True)
+        for name, (_, dtype) in COLUMNS.items():
+            np.save(os.path.join(self.path, name + ".npy"), np.frombuffer(self._data[name], dtype=dtype))
+        strings = {name: list(codes) for name, codes in self._codes.items()}
+        with open(os.path.join(self.path, "strings.json"), "w", encoding="utf-8") as f:
+            json.dump(strings, f, ensure_ascii=False)
+        rows = {"books": self.rows}
+        rows.update({level: len(self._data[level + ".book"]) for level in LEVELS})
+        with open(os.path.join(self.path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "rows": rows, "columns": list(COLUMNS)}, f, indent=2)
+
+
+def export_books(books: Iterable[Any], path: str) -> int:
+    """Write `books` (Books or dicts) as a columnar directory; returns the number of books."""
+    with ColumnarWriter(path) as writer:
+        return writer.extend(books)
+
+
+class ColumnarBooks:
+    """Memory-mapped columns of a directory written by ColumnarWriter, plus analytics."""
+
+    def __init__(self, path: str, mmap: bool = True):
+        self.path = path
+        self._mmap_mode = "r" if mmap else None
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, "strings.json"), "r", encoding="utf-8") as f:
+            self.strings: Dict[str, List[str]] = json.load(f)
+        self._columns: Dict[str, Any] = {}
+
+    def __len__(self) -> int:
+        return self.meta["rows"]["books"]
+
+    def column(self, name: str):
+        arr = self._columns.get(name)
+        if arr is None:
+            if name not in self.meta["columns"]:
+                raise KeyError(f"unknown column {name!r}")
+            file = os.path.join(self.path, name + ".npy")
+            try:
+                arr = _np().load(file, mmap_mode=self._mmap_mode)
+            except ValueError:
+                # empty arrays cannot be memory-mapped
+                arr = _np().load(file)
+            self._columns[name] = arr
+        return arr
+
+    def labels(self, name: str) -> List[str]:
+        return self.strings.get(name, [])
+
+    def _at_level(self, name: str, level: str):
+        """Column `name` expressed per row of `level` (book-level columns are broadcast)."""
+        values = self.column(name)
+        own = level_of(name)
+        if own == level:
+            return values
+        if own != "books":
+            raise ValueError(f"{name!r} is a {own}-level column and cannot be used per {level} row")
+        return values[self.column(level + ".book")]
+
+    def _mask(self, where: Any, level: str):
+        if where is None:
+            return None
+        where = _np().asarray(where, dtype=bool)
+        return where if level == "books" else where[self.column(level + ".book")]
+
+    def value_counts(self, name: str, where: Any = None) -> Dict[str, int]:
+        """Rows per label of a string column, most frequent first (`where`: book-level mask)."""
+        np = _np()
+        level = level_of(name)
+        codes = self.column(name)
+        mask = self._mask(where, level)
+        if mask is not None:
+            codes = codes[mask]
+        labels = self.labels(name)
+        counts = np.bincount(codes[codes >= 0], minlength=len(labels))
+        order = np.argsort(-counts, kind="stable")
+        return {labels[i]: int(counts[i]) for i in order if counts[i]}
+
+    def histogram(self, name: str, bins: Any = 20, where: Any = None) -> Dict[str, List[float]]:
+        np = _np()
+        values = self.column(name)
+        mask = self._mask(where, level_of(name))
+        if mask is not None:
+            values = values[mask]
+        counts, edges = np.histogram(values, bins=bins)
+        return {"counts": counts.tolist(), "edges": edges.tolist()}
+
+    def describe(self, name: str, where: Any = None) -> Dict[str, float]:
+        np = _np()
+        values = self.column(name)
+        mask = self._mask(where, level_of(name))
+        if mask is not None:
+            values = values[mask]
+        if len(values) == 0:
+            return {"count": 0}
+        p50, p90, p99 = np.percentile(values, [50, 90, 99])
+        return {
+            "count": int(len(values)),
+            "mean": float(values.mean()),
+            "std": float(values.std()),
+            "min": float(values.min()),
+            "p50": float(p50),
+            "p90": float(p90),
+            "p99": float(p99),
+            "max": float(values.max()),
+        }
+
+    def group_by(self, key: str, value: Optional[str] = None, agg: str = "mean", where: Any = None) -> Dict[str, float]:
+        """
+        Aggregate `value` per label of the string column `key`.
+
+        `value` may be a column of a finer level than `key` (e.g. key "genre",
+        value "acts.description_chars": one sample per act). `agg` is one of
+        count, sum, mean, min, max; `count` needs no `value`.
+        """
+        np = _np()
+        if agg not in AGGREGATES:
+            raise ValueError(f"agg must be one of {AGGREGATES}")
+        level = level_of(value) if value else level_of(key)
+        codes = self._at_level(key, level)
+        values = self.column(value) if value else None
+        keep = codes >= 0
+        mask = self._mask(where, level)
+        if mask is not None:
+            keep &= mask
+        codes = codes[keep]
+        labels = self.labels(key)
+        counts = np.bincount(codes, minlength=len(labels))
+        if agg == "count":
+            result = counts
+        else:
+            values = values[keep].astype("float64")
+            if agg in ("sum", "mean"):
+                # bincount of no rows is int64 even with weights
+                sums = np.bincount(codes, weights=values, minlength=len(labels)).astype("float64")
+                result = sums if agg == "sum" else np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+            else:
+                order = np.argsort(codes, kind="stable")
+                sorted_codes = codes[order]
+                starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]) if len(codes) else np.array([], dtype=int)
+                reduce = np.minimum if agg == "min" else np.maximum
+                result = np.zeros(len(labels))
+                if len(starts):
+                    result[sorted_codes[starts]] = reduce.reduceat(values[order], starts)
+        return {labels[i]: (int(result[i]) if agg == "count" else float(result[i])) for i in np.flatnonzero(counts)}
+
+    def fallback_rates(self, by: Optional[str] = None, where: Any = None) -> Dict[str, Any]:
+        """
+        Share of books with at least one fallback per step:
+        `{step: rate}`, or `{label: {step: rate}}` grouped by a book-level string column.
+        """
+        np = _np()
+        steps = self.labels("fallbacks.step")
+        fb_book = self.column("fallbacks.book").astype("int64")
+        fb_step = self.column("fallbacks.step").astype("int64")
+        valid = fb_step >= 0
+        if where is not None:
+            valid &= np.asarray(where, dtype=bool)[fb_book]
+        # one count per (book, step), however many fallbacks the step recorded
+        pairs = np.unique(fb_book[valid] * max(1, len(steps)) + fb_step[valid])
+        books, step_codes = np.divmod(pairs, max(1, len(steps)))
+        total_mask = np.ones(len(self), dtype=bool) if where is None else np.asarray(where, dtype=bool)
+        if by is None:
+            total = int(total_mask.sum())
+            hits = np.bincount(step_codes, minlength=len(steps))
+            return {steps[i]: float(hits[i]) / total for i in range(len(steps)) if total and hits[i]}
+        groups = self.column(by)
+        labels = self.labels(by)
+        totals = np.bincount(groups[total_mask & (groups >= 0)], minlength=len(labels))
+        group_of = groups[books]
+        ok = group_of >= 0
+        table = np.zeros((len(labels), max(1, len(steps))))
+        np.add.at(table, (group_of[ok], step_codes[ok]), 1)
+        out: Dict[str, Any] = {}
+        for g in np.flatnonzero(totals):
+            row = {steps[s]: float(table[g, s]) / totals[g] for s in np.flatnonzero(table[g])}
+            out[labels[g]] = row
+        return out
+
+    def summary(self, by: Optional[str] = None, top: int = 20) -> Dict[str, Any]:
+        """The usual prompt-tuning report in one dict."""
+        report: Dict[str, Any] = {
+            "books": len(self),
+            "genre": dict(list(self.value_counts("genre").items())[:top]),
+            "tema": dict(list(self.value_counts("tema").items())[:top]),
+            "logline_words": self.describe("logline_words"),
+            "logline_words_histogram": self.histogram("logline_words", bins=10),
+            "protagonistas": self.describe("protagonistas"),
+            "acts.description_chars": self.describe("acts.description_chars"),
+            "fallback_rates": self.fallback_rates(),
+        }
+        if by:
+            report["by_" + by] = {
+                "books": self.group_by(by, agg="count"),
+                "logline_words_mean": self.group_by(by, "logline_words"),
+                "protagonistas_mean": self.group_by(by, "protagonistas"),
+                "acts.description_chars_mean": self.group_by(by, "acts.description_chars"),
+                "fallback_rates": self.fallback_rates(by=by),
+            }
+        return report
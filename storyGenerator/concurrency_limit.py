@@ -0,0 +1,125 @@
+"""Adaptive (AIMD) concurrency limit per LLM endpoint.
+
+A fixed number of in-flight requests either idles the inference server or
+overloads its queue until requests hit their timeouts. `AIMDLimiter`
+adjusts the limit from what it observes:
+
+  - additive increase: after `limit` successful, fast requests the limit
+    grows by `increase`;
+  - multiplicative decrease: on 429/503 answers, timeouts, or when latency
+    climbs (the recent per-token latency exceeds `latency_tolerance` times
+    the best recently seen), the limit is multiplied by `backoff`, at most
+    once per `cooldown` seconds so one burst of errors from requests sent
+    before the decrease does not collapse it to the minimum.
+
+Latency is normalized per completion token, so short list steps and long
+expansions can share one baseline. Requests faster than `latency_floor`
+seconds count as taking `latency_floor`: jitter on a near-idle local server
+is not a load signal.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+OK = "ok"
+OVERLOAD = "overload"  # 429 / 503
+TIMEOUT = "timeout"
+ERROR = "error"  # other failures: no signal about load
+
+
+class AIMDLimiter:
+    """In-flight request limit with additive increase / multiplicative decrease."""
+
+    def __init__(
+        self,
+        initial: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 128,
+        increase: float = 1.0,
+        backoff: float = 0.5,
+        latency_tolerance: float = 2.0,
+        cooldown: float = 2.0,
+        window: int = 200,
+        smoothing: float = 0.2,
+        latency_floor: float = 0.05,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(max_limit, initial)))
+        self.increase = increase
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.smoothing = smoothing
+        self.latency_floor = latency_floor
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._ewma: Optional[float] = None
+        self._successes = 0
+        self._last_decrease = 0.0
+        self.stats: Dict[str, int] = {"increases": 0, "decreases": 0, "waited": 0, "rejected": 0}
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Wait for a free slot; False if none freed up within `timeout` seconds."""
+        with self._cond:
+            if self.in_flight >= int(self.limit):
+                self.stats["waited"] += 1
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while self.in_flight >= int(self.limit):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        self.stats["rejected"] += 1
+                        return False
+                    self._cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def release(self, outcome: str, seconds: Optional[float] = None, tokens: Optional[int] = None) -> None:
+        """Free the slot and adapt the limit to `outcome` (OK/OVERLOAD/TIMEOUT/ERROR)."""
+        now = time.monotonic()
+        with self._cond:
+            self.in_flight -= 1
+            if outcome in (OVERLOAD, TIMEOUT):
+                self._decrease(now)
+            elif outcome == OK and seconds is not None:
+                sample = max(seconds, self.latency_floor) / max(16, tokens or 0)
+                self._samples.append(sample)
+                self._ewma = sample if self._ewma is None else (1 - self.smoothing) * self._ewma + self.smoothing * sample
+                best = min(self._samples)
+                if len(self._samples) >= 5 and self._ewma > best * self.latency_tolerance:
+                    self._decrease(now)
+                else:
+                    self._successes += 1
+                    if self._successes >= int(self.limit):
+                        self._successes = 0
+                        if self.limit < self.max_limit:
+                            self.limit = min(self.max_limit, self.limit + self.increase)
+                            self.stats["increases"] += 1
+            self._cond.notify_all()
+
+    def _decrease(self, now: float) -> None:
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self._successes = 0
+        new = max(self.min_limit, self.limit * self.backoff)
+        if new < self.limit:
+            self.limit = new
+            self.stats["decreases"] += 1
+        # the latency baseline is re-learned at the new load
+        self._ewma = None
+        self._samples.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "latency_per_token_s": round(self._ewma, 5) if self._ewma is not None else None,
+                "best_latency_per_token_s": round(min(self._samples), 5) if self._samples else None,
+                **self.stats,
+            }
@@ -0,0 +1,230 @@
+"""Append-only corpus of generated books with O(1) random access.
+
+Files of a corpus at `path`:
+
+  - `path`: data file, a sequence of blocks. Each block is a 5-byte header
+    (`>IB`: payload length, flags) followed by the payload. The payload is one
+    or more length-prefixed records (`>I` length + UTF-8 JSON of
+    `Book.to_dict()`), zlib-compressed when `flags & 1`. With compression,
+    records are grouped into blocks of about `block_size` bytes, each
+    compressed independently; without it, every record is its own block.
+  - `path.idx`: fixed-size entries (`>QII`: block offset, record offset in
+    the decoded block, record length), one per book id, so book `i` is at
+    byte `16 * i`.
+  - `path.keys`: JSONL `{"id", <key fields>}` used for lookups by genre,
+    tema, ... (loaded on first use).
+
+Reading book `i` costs one index entry and one block read from memory-maps;
+`Book.from_dict` only runs for the records requested. Records are visible
+to readers once their block and index entries are written (on `flush()`);
+a crash before that loses only the unflushed tail.
+"""
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from book_dataclasses import Book
+
+_BLOCK_HEADER = struct.Struct(">IB")
+_RECORD_HEADER = struct.Struct(">I")
+_INDEX_ENTRY = struct.Struct(">QII")
+FLAG_ZLIB = 1
+
+DEFAULT_KEY_FIELDS = ("title", "genre", "tema")
+
+
+class CorpusWriter:
+    """Appends books to a corpus; use as a context manager or call `close()`."""
+
+    def __init__(
+        self,
+        path: str,
+        compress: bool = False,
+        block_size: int = 256 * 1024,
+        level: int = 6,
+        key_fields: Sequence[str] = DEFAULT_KEY_FIELDS,
+    ):
+        self.path = path
+        self.compress = compress
+        self.block_size = block_size
+        self.level = level
+        self.key_fields = tuple(key_fields)
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._data = open(path, "ab")
+        self._index = open(path + ".idx", "ab")
+        self._keys = open(path + ".keys", "a", encoding="utf-8")
+        self._next_id = self._index.tell() // _INDEX_ENTRY.size
+        # encoded records (and their key fields) not written yet
+        self._pending: List[bytes] = []
+        self._pending_keys: List[Dict[str, Any]] = []
+        self._pending_bytes = 0
+
+    def __enter__(self) -> "CorpusWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._next_id
+
+    def append(self, book: Any) -> int:
+        """Append a Book (or a `to_dict()` dict) and return its id."""
+        d = book.to_dict() if hasattr(book, "to_dict") else book
+        record = json.dumps(d, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        book_id = self._next_id
+        self._next_id += 1
+        keys = {"id": book_id}
+        keys.update({k: d.get(k) for k in self.key_fields})
+        self._pending.append(record)
+        self._pending_keys.append(keys)
+        self._pending_bytes += len(record) + _RECORD_HEADER.size
+        if not self.compress or self._pending_bytes >= self.block_size:
+            self.flush()
+        return book_id
+
+    def extend(self, books: Iterable[Any]) -> List[int]:
+        return [self.append(b) for b in books]
+
+    def flush(self) -> None:
+        """Write the pending block and its index entries."""
+        if self._pending:
+            if self.compress:
+                self._write_block(self._pending, compressed=True)
+            else:
+                for record in self._pending:
+                    self._write_block([record], compressed=False)
+            for keys in self._pending_keys:
+                self._keys.write(json.dumps(keys, ensure_ascii=False) + "\n")
+            self._pending, self._pending_keys, self._pending_bytes = [], [], 0
+        self._data.flush()
+        self._index.flush()
+        self._keys.flush()
+
+    def _write_block(self, records: List[bytes], compressed: bool) -> None:
+        raw = bytearray()
+        entries = []
+        for record in records:
+            entries.append((len(raw) + _RECORD_HEADER.size, len(record)))
+            raw += _RECORD_HEADER.pack(len(record))
+            raw += record
+        payload = zlib.compress(bytes(raw), self.level) if compressed else bytes(raw)
+        # data before index: an index entry never points past the data file
+        offset = self._data.tell()
+        self._data.write(_BLOCK_HEADER.pack(len(payload), FLAG_ZLIB if compressed else 0))
+        self._data.write(payload)
+        self._data.flush()
+        for rec_offset, length in entries:
+            self._index.write(_INDEX_ENTRY.pack(offset, rec_offset, length))
+
+    def close(self) -> None:
+        self.flush()
+        self._data.close()
+        self._index.close()
+        self._keys.close()
+
+
+class Corpus:
+    """Memory-mapped reader of a corpus written by CorpusWriter."""
+
+    def __init__(self, path: str, cache_blocks: int = 8):
+        self.path = path
+        self.cache_blocks = cache_blocks
+        self._blocks: "OrderedDict[int, bytes]" = OrderedDict()
+        self._keys: Optional[List[Dict[str, Any]]] = None
+        self._data_map: Optional[mmap.mmap] = None
+        self._index_map: Optional[mmap.mmap] = None
+        self._files: List[Any] = []
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Re-map the files to see books appended since opening."""
+        self.close()
+        self._blocks.clear()
+        self._keys = None
+        self._data_map = self._map(self.path)
+        self._index_map = self._map(self.path + ".idx")
+
+    def _map(self, path: str) -> Optional[mmap.mmap]:
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return None
+        f = open(path, "rb")
+        self._files.append(f)
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self) -> None:
+        for m in (self._data_map, self._index_map):
+            if m is not None:
+                m.close()
+        for f in self._files:
+            f.close()
+        self._files = []
+        self._data_map = self._index_map = None
+
+    def __enter__(self) -> "Corpus":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._index_map) // _INDEX_ENTRY.size if self._index_map is not None else 0
+
+    def get_bytes(self, book_id: int) -> bytes:
+        """Raw JSON record of `book_id`."""
+        if not 0 <= book_id < len(self):
+            raise KeyError(book_id)
+        block_offset, rec_offset, length = _INDEX_ENTRY.unpack_from(self._index_map, book_id * _INDEX_ENTRY.size)
+        size, flags = _BLOCK_HEADER.unpack_from(self._data_map, block_offset)
+        start = block_offset + _BLOCK_HEADER.size
+        if not flags & FLAG_ZLIB:
+            # uncompressed records are sliced straight from the memory map
+            return self._data_map[start + rec_offset:start + rec_offset + length]
+        block = self._block(block_offset, start, size)
+        return block[rec_offset:rec_offset + length]
+
+    def get_dict(self, book_id: int) -> Dict[str, Any]:
+        return json.loads(self.get_bytes(book_id))
+
+    def get(self, book_id: int) -> Book:
+        return Book.from_dict(self.get_dict(book_id))
+
+    def __getitem__(self, book_id: int) -> Book:
+        return self.get(book_id)
+
+    def iter_dicts(self, ids: Optional[Iterable[int]] = None) -> Iterator[Dict[str, Any]]:
+        for book_id in (range(len(self)) if ids is None else ids):
+            yield self.get_dict(book_id)
+
+    def ids_where(self, **fields: Any) -> List[int]:
+        """Ids of books whose key fields match, e.g. `ids_where(genre="Fantasia")`."""
+        if self._keys is None:
+            self._keys = []
+            keys_path = self.path + ".keys"
+            if os.path.exists(keys_path):
+                with open(keys_path, "r", encoding="utf-8") as f:
+                    self._keys = [json.loads(line) for line in f if line.strip()]
+        limit = len(self)
+        return [
+            k["id"] for k in self._keys
+            if k["id"] < limit and all(k.get(name) == value for name, value in fields.items())
+        ]
+
+    def _block(self, offset: int, start: int, size: int) -> bytes:
+        """Decompressed block at `offset` (small LRU, neighbouring ids share blocks)."""
+        cached = self._blocks.get(offset)
+        if cached is not None:
+            self._blocks.move_to_end(offset)
+            return cached
+        block = zlib.decompress(self._data_map[start:start + size])
+        self._blocks[offset] = block
+        while len(self._blocks) > self.cache_blocks:
+            self._blocks.popitem(last=False)
+        return block
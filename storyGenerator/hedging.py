@@ -0,0 +1,138 @@
+"""Request hedging for slow LLM calls.
+
+A few `generate_json` calls in a batch run hang close to the 60 second
+timeout and hold up whole books. `RequestHedger` runs the primary request in
+a worker thread; if it has not finished after the `percentile` latency seen
+recently for that step, a duplicate request is issued (to another endpoint
+when one is configured) and the first valid response wins.
+
+Hedges are paid for from a token bucket: every request earns `budget`
+tokens and every hedge costs one, so at most ~`budget` of all requests are
+duplicated. The losing request cannot be aborted mid-flight by `requests`;
+it is cancelled if it has not started yet, otherwise its result is dropped.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from latency import LatencyTracker
+
+
+class RequestHedger:
+    """Issues a duplicate request when the primary is slower than recent `percentile` latency.
+
+    - percentile: latency quantile (per step) after which a hedge is sent
+    - budget: fraction of requests that may be hedged (token bucket refill per request)
+    - min_samples: latencies needed for a step before hedging kicks in
+    - min_delay: never hedge earlier than this many seconds
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        budget: float = 0.1,
+        burst: float = 5.0,
+        min_samples: int = 10,
+        min_delay: float = 0.5,
+        max_workers: int = 16,
+        latency: Optional[LatencyTracker] = None,
+    ):
+        self.percentile = percentile
+        self.budget = budget
+        self.burst = burst
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_workers = max_workers
+        self.latency = latency or LatencyTracker()
+        self._tokens = burst
+        self._lock = threading.Lock()
+        self._executor = None
+        self.stats: Dict[str, int] = {"requests": 0, "hedged": 0, "hedge_won": 0, "budget_exhausted": 0}
+
+    def hedge_delay(self, step: Optional[str]) -> Optional[float]:
+        """Seconds to wait before hedging `step`, or None while there is too little history."""
+        if self.latency.count(step) < self.min_samples:
+            return None
+        p = self.latency.percentile(step, self.percentile)
+        return max(self.min_delay, p or 0.0)
+
+    def run(
+        self,
+        step: Optional[str],
+        primary: Callable[[], Any],
+        hedge: Callable[[], Any],
+        is_valid: Callable[[Any], bool] = lambda r: r is not None,
+    ) -> Any:
+        """Run `primary`, hedging with `hedge` when it is slow; return the first valid result."""
+        with self._lock:
+            self.stats["requests"] += 1
+            self._tokens = min(self.burst, self._tokens + self.budget)
+
+        started = time.monotonic()
+        delay = self.hedge_delay(step)
+        if delay is None:
+            result = primary()
+            self.latency.record(step, time.monotonic() - started)
+            return result
+
+        from concurrent.futures import FIRST_COMPLETED, wait
+
+        pool = self._pool()
+        first = pool.submit(primary)
+        done, _ = wait([first], timeout=delay)
+        if done or not self._take_token():
+            result = first.result()
+            self.latency.record(step, time.monotonic() - started)
+            return result
+
+        second = pool.submit(hedge)
+        with self._lock:
+            self.stats["hedged"] += 1
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        fallback: Any = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                exc = fut.exception()
+                if exc is not None:
+                    error = error or exc
+                    continue
+                result = fut.result()
+                if is_valid(result):
+                    for other in pending:
+                        other.cancel()
+                    self.latency.record(step, time.monotonic() - started)
+                    if fut is second:
+                        with self._lock:
+                            self.stats["hedge_won"] += 1
+                    return result
+                fallback = result
+        if error is not None and fallback is None:
+            raise error  # both attempts failed
+        return fallback
+
+    def _take_token(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            self.stats["budget_exhausted"] += 1
+            return False
+
+    def _pool(self):
+        # imported lazily: concurrent.futures is only needed once hedging kicks in
+        from concurrent.futures import ThreadPoolExecutor
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hedge")
+            return self._executor
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
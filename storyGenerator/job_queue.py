@@ -0,0 +1,222 @@
+"""Durable SQLite-backed job queue for book generation.
+
+Jobs are JSON payloads (seed, genre, presets, structure config). Workers
+claim a job by leasing it for `visibility_timeout` seconds; a job whose
+lease expires (worker crashed or was killed) becomes visible again and is
+handed to another worker, so delivery is at-least-once. Completed jobs keep
+their result JSON; jobs failing `max_attempts` times end up as `failed`.
+
+The database runs in WAL mode so many worker processes can share it.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    visible_at REAL NOT NULL,
+    lease_owner TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (status, visible_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at);
+"""
+
+
+class JobQueue:
+    """SQLite job queue with leases (visibility timeouts) and retry limits."""
+
+    def __init__(self, path: str, visibility_timeout: float = 600.0, max_attempts: int = 5):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30.0, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def enqueue(self, payload: Dict[str, Any], max_attempts: Optional[int] = None) -> int:
+        return self.enqueue_many([payload], max_attempts)[0]
+
+    def enqueue_many(self, payloads: Iterable[Dict[str, Any]], max_attempts: Optional[int] = None) -> List[int]:
+        now = time.time()
+        attempts = max_attempts or self.max_attempts
+        ids: List[int] = []
+        with self._transaction():
+            for p in payloads:
+                cur = self._conn.execute(
+                    "INSERT INTO jobs (payload, max_attempts, visible_at, created_at) VALUES (?, ?, ?, ?)",
+                    (json.dumps(p, ensure_ascii=False), attempts, now, now),
+                )
+                ids.append(cur.lastrowid)
+        return ids
+
+    def claim(self, worker: str, visibility_timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Lease the oldest visible job for `worker`; returns `{"id", "payload", "attempts"}` or None.
+
+        Running jobs whose lease has expired are visible again. Jobs that already
+        used up their attempts are marked failed instead of being handed out.
+        """
+        lease = self.visibility_timeout if visibility_timeout is None else visibility_timeout
+        while True:
+            now = time.time()
+            with self._transaction():
+                row = self._conn.execute(
+                    "SELECT id, payload, attempts, max_attempts FROM jobs "
+                    "WHERE status IN (?, ?) AND visible_at <= ? ORDER BY id LIMIT 1",
+                    (QUEUED, RUNNING, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                if row["attempts"] >= row["max_attempts"]:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, finished_at = ?, error = COALESCE(error, 'lease expired') WHERE id = ?",
+                        (FAILED, now, row["id"]),
+                    )
+                    continue
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, visible_at = ?, lease_owner = ?, "
+                    "started_at = COALESCE(started_at, ?) WHERE id = ?",
+                    (RUNNING, now + lease, worker, now, row["id"]),
+                )
+                return {"id": row["id"], "payload": json.loads(row["payload"]), "attempts": row["attempts"] + 1}
+
+    def extend(self, job_id: int, worker: str, visibility_timeout: Optional[float] = None) -> bool:
+        """Extend the lease of a running job; False if `worker` no longer holds it."""
+        lease = self.visibility_timeout if visibility_timeout is None else visibility_timeout
+        with self._transaction():
+            cur = self._conn.execute(
+                "UPDATE jobs SET visible_at = ? WHERE id = ? AND status = ? AND lease_owner = ?",
+                (time.time() + lease, job_id, RUNNING, worker),
+            )
+        return cur.rowcount == 1
+
+    def complete(self, job_id: int, worker: str, result: Any) -> bool:
+        """
+        Store `result` and mark the job done.
+
+        With at-least-once delivery the lease may have moved to another worker;
+        the first finished result is kept and False is returned for later ones.
+        """
+        with self._transaction():
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, finished_at = ?, lease_owner = ?, error = NULL "
+                "WHERE id = ? AND status != ?",
+                (DONE, json.dumps(result, ensure_ascii=False), time.time(), worker, job_id, DONE),
+            )
+        return cur.rowcount == 1
+
+    def fail(self, job_id: int, worker: str, error: str, retry_delay: float = 5.0) -> bool:
+        """
+        Record a failed attempt; requeue with a delay unless attempts are exhausted.
+
+        Like `extend`, only the worker holding the lease may do so: once it
+        expired and another worker claimed the job, False is returned and the
+        job is left to its new owner.
+        """
+        now = time.time()
+        with self._transaction():
+            row = self._conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND status = ? AND lease_owner = ?",
+                (job_id, RUNNING, worker),
+            ).fetchone()
+            if row is None:
+                return False
+            if row["attempts"] >= row["max_attempts"]:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND status = ? AND lease_owner = ?",
+                    (FAILED, error, now, job_id, RUNNING, worker),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, visible_at = ?, lease_owner = NULL "
+                    "WHERE id = ? AND status = ? AND lease_owner = ?",
+                    (QUEUED, error, now + retry_delay * row["attempts"], job_id, RUNNING, worker),
+                )
+        return True
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def results(self, since_id: int = 0) -> Iterable[Dict[str, Any]]:
+        """Yield `{"id", "payload", "result"}` for done jobs with id > `since_id`."""
+        cur = self._conn.execute(
+            "SELECT id, payload, result FROM jobs WHERE status = ? AND id > ? ORDER BY id", (DONE, since_id)
+        )
+        for row in cur:
+            yield {"id": row["id"], "payload": json.loads(row["payload"]), "result": json.loads(row["result"])}
+
+    def stats(self, window: float = 300.0) -> Dict[str, Any]:
+        """Queue depth per status plus throughput over the last `window` seconds."""
+        now = time.time()
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for row in self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"):
+            counts[row["status"]] = row["n"]
+        ready = self._conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?) AND visible_at <= ?", (QUEUED, RUNNING, now)
+        ).fetchone()[0]
+        recent = self._conn.execute(
+            "SELECT COUNT(*), AVG(finished_at - started_at) FROM jobs WHERE status = ? AND finished_at >= ?",
+            (DONE, now - window),
+        ).fetchone()
+        retried = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE attempts > 1").fetchone()[0]
+        return {
+            "depth": counts[QUEUED] + counts[RUNNING],
+            "ready": ready,
+            **counts,
+            "retried": retried,
+            "throughput_per_min": round((recent[0] or 0) * 60.0 / window, 3),
+            "avg_job_seconds": round(recent[1] or 0.0, 3),
+        }
+
+    def _transaction(self):
+        return _Transaction(self._conn)
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK, so concurrent claimers never lease the same job."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
@@ -0,0 +1,57 @@
+"""Rolling latency statistics per key (pipeline step, route or endpoint)."""
+from __future__ import annotations
+
+import math
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+
+class LatencyTracker:
+    """Keeps the last `window` latencies (seconds) per key and answers percentile queries."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: Optional[str], seconds: float) -> None:
+        k = key or ""
+        with self._lock:
+            dq = self._samples.get(k)
+            if dq is None:
+                dq = self._samples[k] = deque(maxlen=self.window)
+            dq.append(seconds)
+            self._counts[k] = self._counts.get(k, 0) + 1
+
+    def count(self, key: Optional[str]) -> int:
+        with self._lock:
+            return len(self._samples.get(key or "", ()))
+
+    def percentile(self, key: Optional[str], q: float) -> Optional[float]:
+        """Return the `q` quantile (0..1) of recent latencies for `key`, or None without samples."""
+        with self._lock:
+            samples = sorted(self._samples.get(key or "", ()))
+        if not samples:
+            return None
+        idx = min(len(samples) - 1, max(0, int(math.ceil(q * len(samples))) - 1))
+        return samples[idx]
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Return `{key: {calls, mean_s, p50_s, p95_s, max_s}}`."""
+        with self._lock:
+            keys = list(self._samples)
+            counts = dict(self._counts)
+            means = {k: sum(v) / len(v) for k, v in self._samples.items() if v}
+            maxes = {k: max(v) for k, v in self._samples.items() if v}
+        return {
+            k: {
+                "calls": counts.get(k, 0),
+                "mean_s": round(means.get(k, 0.0), 4),
+                "p50_s": round(self.percentile(k, 0.5) or 0.0, 4),
+                "p95_s": round(self.percentile(k, 0.95) or 0.0, 4),
+                "max_s": round(maxes.get(k, 0.0), 4),
+            }
+            for k in keys
+        }
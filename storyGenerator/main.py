@@ -11,13 +11,9 @@ from __future__ import annotations
 import argparse
 import json
 import os
-import random
-import re
 from typing import Any, Dict, List, Optional
 
-import requests
-
-from LLMStructure import  build_book_structure_with_llm
+from LLMStructure import  LLMBookGenerator, LLMentryPoint, build_book_structure_with_llm, prompt_choice
  
 def loadFromJson( filepath: str ) -> Dict[str, Any]:
     """Load a JSON file and return its contents as a dictionary."""
@@ -39,18 +35,82 @@ def loadFromJson( filepath: str ) -> Dict[str, Any]:
     return data
 
 
-def main() -> int:
-   # load host, apikey from config file or env vars
+def load_llm_config() -> Dict[str, Any]:
+    """Load config.json and resolve the API key / base URL from env vars when missing."""
     llm_config = loadFromJson(
         os.path.join(os.path.dirname(__file__), "config.json")
     )
-
-    # Call the LLM structure builder
     api_key = llm_config.get("openai_api_key") or os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise ValueError("API key not found in config file or environment variable OPENAI_API_KEY")
-    base_url = llm_config.get("openai_base_url") or os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
-    book = build_book_structure_with_llm(  api_key=api_key, base_url=base_url )
+    llm_config["openai_api_key"] = api_key
+    llm_config["openai_base_url"] = llm_config.get("openai_base_url") or os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+    return llm_config
+
+
+def warm_up_endpoints(entrypoint: LLMentryPoint, llm_config: Dict[str, Any], forced: bool = False) -> bool:
+    """Warm-up before a run when asked for (flag or `warm_up` config key); False when nothing is ready."""
+    from warmup import format_report, warm_up_from_config
+
+    report = warm_up_from_config(entrypoint, llm_config.get("warm_up") or forced)
+    if report is None:
+        return True
+    print(format_report(report))
+    return report["ready_count"] > 0
+
+
+def warm_up_only(args: argparse.Namespace) -> int:
+    from warmup import format_report
+
+    llm_config = load_llm_config()
+    entrypoint = LLMentryPoint.from_config(llm_config)
+    report = entrypoint.warm_up(timeout=args.timeout, attempts=args.attempts)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    return 0 if report["ready"] else 1
+
+
+def generate_one(args: argparse.Namespace) -> int:
+    # load host, apikey from config file or env vars
+    llm_config = load_llm_config()
+    api_key = llm_config["openai_api_key"]
+    base_url = llm_config["openai_base_url"]
+
+    # Call the LLM structure builder
+    # optional config keys (endpoints, hedging, ...) configure the shared entrypoint
+    entrypoint = LLMentryPoint.from_config(llm_config, api_key=api_key, base_url=base_url)
+    if not warm_up_endpoints(entrypoint, llm_config, getattr(args, "warm_up", False)):
+        print("No endpoint is ready; not generating.")
+        return 1
+    profile = getattr(args, "profile", None)
+    profiler = None
+    if profile:
+        import profiling
+
+        profiler = profiling.Profiler(sample=True)
+        profiler.start()
+    top_k = getattr(args, "speculate", 0)
+    interactive = getattr(args, "interactive", False)
+    if top_k or interactive:
+        generator = LLMBookGenerator(api_key=api_key, base_url=base_url, model=entrypoint.model, entrypoint=entrypoint)
+        if interactive:
+            generator.chooser = prompt_choice
+    if top_k:
+        from speculative import SpeculativeRunner
+
+        runner = SpeculativeRunner(generator, top_k=top_k)
+        book = runner.build(temperature=0.9)
+        print(f"Speculation: {runner.stats}")
+    elif interactive:
+        book = generator.build_book_structure_with_llm(temperature=0.9)
+    else:
+        book = build_book_structure_with_llm(  api_key=api_key, base_url=base_url, model=entrypoint.model, entrypoint=entrypoint )
+
+    if profiler is not None:
+        profiler.stop()
+        profiler.write_report(profile + ".json")
+        profiler.write_stacks(profile + ".folded")
+        print(json.dumps(profiler.report(), indent=2))
+        print(f"Profile written to {profile}.json and {profile}.folded")
 
     # Save the generated book structure to a JSON file
     with open( "output.json", "w", encoding="utf-8") as f:
@@ -59,8 +119,281 @@ def main() -> int:
         json.dump( book_json, f, ensure_ascii=False, indent=2)
 
     print(f"Book structure saved to output.json")
+    books = {}
+    locales = [l.strip() for l in (getattr(args, "locales", None) or "").split(",") if l.strip()]
+    if locales:
+        from multi_locale import LeafTranslator
+
+        translator = LeafTranslator(LLMBookGenerator(api_key=api_key, base_url=base_url, model=entrypoint.model, entrypoint=entrypoint))
+        books = translator.translate(book, [l for l in locales if l != translator.pivot])
+        for locale, translated in books.items():
+            path = f"output.{locale}.json"
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(translated.to_dict(), f, ensure_ascii=False, indent=2)
+            print(f"{locale} translation saved to {path}")
+        print(f"Translation: {translator.stats}")
+    if entrypoint.routes:
+        print(json.dumps({"routes": entrypoint.route_report()}, indent=2))
+
+    store_path = getattr(args, "store", None)
+    if store_path:
+        from book_storage import BookStore
+
+        store = BookStore(store_path)
+        book_id = store.save(book)
+        print(f"Book stored in {store_path} (id {book_id})")
+        for locale, translated in books.items():
+            print(f"{locale} translation stored in {store_path} (id {store.save(translated)})")
+        store.close()
+    return 0
+
+
+def enqueue_jobs(args: argparse.Namespace) -> int:
+    from job_queue import JobQueue
+
+    structure = loadStructureConfig(args.structure) if args.structure else None
+    payloads = []
+    for i in range(args.count):
+        payload: Dict[str, Any] = {"structure": structure}
+        if args.seed is not None:
+            payload["seed"] = args.seed + i
+        if args.genre:
+            payload["genre"] = args.genre
+        payloads.append(payload)
+    queue = JobQueue(args.queue)
+    ids = queue.enqueue_many(payloads, max_attempts=args.max_attempts)
+    queue.close()
+    print(f"Enqueued {len(ids)} job(s) into {args.queue}")
+    return 0
+
+
+def run_workers(args: argparse.Namespace) -> int:
+    from worker import run_pool, run_worker
+
+    llm_config = load_llm_config()
+    # warm the servers once for every worker process
+    if not warm_up_endpoints(LLMentryPoint.from_config(llm_config), llm_config, args.warm_up):
+        print("No endpoint is ready; not starting workers.")
+        return 1
+    kwargs = {
+        "max_jobs": args.max_jobs,
+        "exit_when_empty": args.exit_when_empty,
+        "visibility_timeout": args.visibility_timeout,
+        "store_path": args.store,
+        "profile_path": args.profile,
+    }
+    if args.processes <= 1:
+        done = run_worker(args.queue, llm_config, **kwargs)
+        print(f"Worker finished {done} job(s)")
+        return 0
+    codes = run_pool(args.queue, llm_config, args.processes, **kwargs)
+    return 0 if all(c == 0 for c in codes) else 1
+
+
+def show_stats(args: argparse.Namespace) -> int:
+    from job_queue import JobQueue
+
+    queue = JobQueue(args.queue)
+    stats = queue.stats(window=args.window)
+    queue.close()
+    print(json.dumps(stats, indent=2))
+    return 0
+
+
+def export_corpus(args: argparse.Namespace) -> int:
+    from corpus import CorpusWriter
+    from job_queue import JobQueue
+
+    queue = JobQueue(args.queue)
+    count = 0
+    with CorpusWriter(args.corpus, compress=args.compress) as writer:
+        for job in queue.results(since_id=args.since_id):
+            writer.append(job["result"]["book"])
+            count += 1
+            last = job["id"]
+    queue.close()
+    print(f"Exported {count} book(s) to {args.corpus}" + (f" (last job id {last})" if count else ""))
+    return 0
+
+
+def _source_books(args: argparse.Namespace):
+    """Book dicts from the source given to `columnar` (corpus, store, queue or JSON files)."""
+    if args.corpus:
+        from corpus import Corpus
+
+        with Corpus(args.corpus) as corpus:
+            yield from corpus.iter_dicts()
+    elif args.store:
+        from book_storage import BookStore
+
+        store = BookStore(args.store)
+        try:
+            for book_id in store.book_ids():
+                yield store.load_dict(book_id)
+        finally:
+            store.close()
+    elif args.queue:
+        from job_queue import JobQueue
+
+        queue = JobQueue(args.queue)
+        try:
+            for job in queue.results():
+                yield job["result"]["book"]
+        finally:
+            queue.close()
+    for path in args.files:
+        with open(path, "r", encoding="utf-8") as f:
+            yield json.load(f)
+
+
+def export_columnar(args: argparse.Namespace) -> int:
+    from columnar import export_books
+
+    count = export_books(_source_books(args), args.out)
+    print(f"Exported {count} book(s) to {args.out}")
+    return 0
+
+
+def analyze_columnar(args: argparse.Namespace) -> int:
+    from columnar import ColumnarBooks
+
+    books = ColumnarBooks(args.columns)
+    print(json.dumps(books.summary(by=args.by, top=args.top), ensure_ascii=False, indent=2))
     return 0
 
 
+def draft_prose(args: argparse.Namespace) -> int:
+    from book_dataclasses import Book
+    from prose_drafting import ProseDrafter, ProseStore, book_dir
+    from summary_memory import SummaryMemory, llm_summarizer
+
+    llm_config = load_llm_config()
+    entrypoint = LLMentryPoint.from_config(llm_config)
+    generator = LLMBookGenerator(api_key=entrypoint.api_key, base_url=entrypoint.base_url, model=entrypoint.model, entrypoint=entrypoint)
+    with open(args.book, "r", encoding="utf-8") as f:
+        book = Book.from_dict(json.load(f))
+    store = ProseStore(book_dir(args.out, book))
+    memory = SummaryMemory(book, summarize=llm_summarizer(entrypoint) if args.llm_summaries else None)
+    drafter = ProseDrafter(generator, store, max_workers=args.workers, memory=memory, words_per_beat=args.words)
+    stats = drafter.draft(book)
+    print(json.dumps(stats))
+    if args.manuscript:
+        count = store.assemble(book, args.manuscript)
+        print(f"{count} beat(s) written to {args.manuscript}")
+    print(f"Beats stored in {store.path}")
+    return 0 if not stats["failed"] else 1
+
+
+def run_service(args: argparse.Namespace) -> int:
+    from service import serve
+
+    serve(
+        load_llm_config(),
+        host=args.host,
+        port=args.port,
+        unix_socket=args.unix_socket,
+        max_jobs=args.max_jobs,
+        memo_entries=args.memo,
+    )
+    return 0
+
+
+def loadStructureConfig( filepath: str ) -> Dict[str, Any]:
+    with open( filepath, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate story structures with an LLM.")
+    sub = parser.add_subparsers(dest="command")
+    p = sub.add_parser("generate", help="generate one book into output.json (default)")
+    p.add_argument("--store", default=None, help="also save the book into this SQLite book store")
+    p.add_argument("--interactive", action="store_true", help="pick genre/conceito/logline/tema yourself")
+    p.add_argument("--speculate", type=int, default=0, metavar="K",
+                   help="start the next step for the top K candidates while a choice is pending")
+    p.add_argument("--profile", default=None, metavar="PREFIX",
+                   help="profile the run; writes PREFIX.json (per-step breakdown) and PREFIX.folded (stacks)")
+    p.add_argument("--warm-up", action="store_true", help="load the models on every endpoint before generating")
+    p.add_argument("--locales", default=None, metavar="en-US,es-ES",
+                   help="also translate the book's text into these locales (output.<locale>.json)")
+
+    p = sub.add_parser("enqueue", help="add generation jobs to the queue")
+    p.add_argument("--queue", default="jobs.db")
+    p.add_argument("--count", type=int, default=1)
+    p.add_argument("--seed", type=int, default=None, help="seed of the first job; job i uses seed+i")
+    p.add_argument("--genre", default=None)
+    p.add_argument("--structure", default=None, help="path to a book_structure_config.json")
+    p.add_argument("--max-attempts", type=int, default=5)
+
+    p = sub.add_parser("worker", help="process queued jobs")
+    p.add_argument("--queue", default="jobs.db")
+    p.add_argument("--processes", type=int, default=1)
+    p.add_argument("--max-jobs", type=int, default=None, help="per process")
+    p.add_argument("--exit-when-empty", action="store_true")
+    p.add_argument("--visibility-timeout", type=float, default=600.0)
+    p.add_argument("--store", default=None, help="also save finished books into this SQLite book store")
+    p.add_argument("--profile", default=None, metavar="PREFIX",
+                   help="profile each worker; writes PREFIX.<worker>.json and PREFIX.<worker>.folded")
+    p.add_argument("--warm-up", action="store_true", help="load the models on every endpoint before starting")
+
+    p = sub.add_parser("warmup", help="list served models and warm every endpoint; reports cold-start times")
+    p.add_argument("--timeout", type=float, default=180.0, help="seconds allowed for a model to load")
+    p.add_argument("--attempts", type=int, default=3)
+    p.add_argument("--json", action="store_true", help="print the full report as JSON")
+
+    p = sub.add_parser("stats", help="queue depth and throughput")
+    p.add_argument("--queue", default="jobs.db")
+    p.add_argument("--window", type=float, default=300.0, help="throughput window in seconds")
+
+    p = sub.add_parser("export", help="append finished books to a random-access corpus file")
+    p.add_argument("--queue", default="jobs.db")
+    p.add_argument("--corpus", default="books.corpus")
+    p.add_argument("--compress", action="store_true", help="zlib-compress records in blocks")
+    p.add_argument("--since-id", type=int, default=0, help="only jobs with a larger id (incremental export)")
+
+    p = sub.add_parser("columnar", help="export books as NumPy columns for analytics (needs numpy)")
+    p.add_argument("files", nargs="*", help="book JSON files (e.g. output.json)")
+    p.add_argument("--corpus", default=None, help="read books from this corpus file")
+    p.add_argument("--store", default=None, help="read books from this SQLite book store")
+    p.add_argument("--queue", default=None, help="read finished books from this job queue")
+    p.add_argument("--out", default="books.columns", help="output directory")
+
+    p = sub.add_parser("analyze", help="aggregate statistics over a columnar export (needs numpy)")
+    p.add_argument("--columns", default="books.columns")
+    p.add_argument("--by", default=None, help="also group by this string column (genre, tema)")
+    p.add_argument("--top", type=int, default=20, help="labels shown per distribution")
+
+    p = sub.add_parser("draft", help="draft the prose of every beat of a book into a per-book directory")
+    p.add_argument("--book", default="output.json", help="book JSON with acts/chapters/scenes/beats")
+    p.add_argument("--out", default="drafts", help="root directory of the per-book beat stores")
+    p.add_argument("--workers", type=int, default=4, help="chapters drafted concurrently")
+    p.add_argument("--words", type=int, default=250, help="target words per beat")
+    p.add_argument("--llm-summaries", action="store_true", help="summarize for continuity with the LLM")
+    p.add_argument("--manuscript", default=None, help="also assemble the drafted beats into this text file")
+
+    p = sub.add_parser("serve", help="run a local HTTP service that streams books step by step")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--unix-socket", default=None, help="listen on this Unix socket instead of TCP")
+    p.add_argument("--max-jobs", type=int, default=4, help="concurrent generation jobs")
+    p.add_argument("--memo", type=int, default=0, metavar="N", help="memoize up to N step outputs across jobs")
+
+    args = parser.parse_args(argv)
+    commands = {
+        None: generate_one,
+        "generate": generate_one,
+        "enqueue": enqueue_jobs,
+        "worker": run_workers,
+        "stats": show_stats,
+        "export": export_corpus,
+        "columnar": export_columnar,
+        "analyze": analyze_columnar,
+        "draft": draft_prose,
+        "warmup": warm_up_only,
+        "serve": run_service,
+    }
+    return commands[args.command](args)
+
+
 if __name__ == "__main__":
     raise SystemExit(main())
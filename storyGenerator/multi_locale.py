@@ -0,0 +1,279 @@
+"""Multi-locale books: generate the structure once, translate only the text.
+
+Producing the same book in several languages by running the whole pipeline
+per language repeats every structure call (genre, conceito, logline, acts,
+characters, sheets) and gives a different book each time. Instead the book
+is generated once in the pivot language (`PIVOT`, the language of
+llm_prompts.json) and `LeafTranslator` translates its textual leaves into
+each target locale:
+
+  - leaves are the free-text fields (`text_leaves`): logline, conceito,
+    tema, act descriptions and disaster points, character `descricao`,
+    `acoes` and `transformacao`, the text fields of the character sheets,
+    and the titles/beats of an act -> beat tree. Names and ids are kept.
+  - identical texts are translated once, and texts are packed into batches
+    of about `batch_chars` characters: one structured request per batch and
+    locale, with the batches of every locale running concurrently (up to
+    `workers`).
+  - a text missing from an answer (or a batch whose request failed) keeps
+    its pivot text, and the fallback is recorded on that locale's
+    `book.fallbacks` (step "translations").
+
+`translate(book, ["en-US"])` returns one translated copy of the book per
+locale; the pivot book itself is not modified.
+"""
+from __future__ import annotations
+
+import contextvars
+import copy
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from book_dataclasses import Act, Book
+
+PIVOT = "pt-BR"
+
+# Language names used in the translation prompt
+LOCALES: Dict[str, str] = {
+    "pt-BR": "português do Brasil",
+    "pt-PT": "português europeu",
+    "en-US": "inglês (Estados Unidos)",
+    "en-GB": "inglês (Reino Unido)",
+    "es-ES": "espanhol (Espanha)",
+    "es-MX": "espanhol (México)",
+    "fr-FR": "francês",
+    "de-DE": "alemão",
+    "it-IT": "italiano",
+}
+
+# Free-text fields, per kind of node
+BOOK_FIELDS = ["genre", "genero", "conceito", "trama", "logline", "logline_expanded", "tema"]
+ACT_FIELDS = ["description", "disaster_point"]
+CHARACTER_FIELDS = ["descricao", "acoes", "transformacao"]
+SHEET_FIELDS = ["idade", "aparencia", "personalidade", "historia", "motivacao", "medo", "arco"]
+
+Path = Tuple[Any, ...]
+
+
+def _get(node: Any, key: Any) -> Any:
+    if isinstance(node, (dict, list)):
+        return node[key]
+    return getattr(node, key)
+
+
+def _set(node: Any, key: Any, value: Any) -> None:
+    if isinstance(node, (dict, list)):
+        node[key] = value
+    else:
+        setattr(node, key, value)
+
+
+def _strings(value: Any, path: Path) -> Iterator[Tuple[Path, str]]:
+    """Non-empty strings of a field holding a string or a list of strings."""
+    if isinstance(value, str):
+        if value.strip():
+            yield path, value
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            if isinstance(item, str) and item.strip():
+                yield path + (i,), item
+
+
+def _dict_fields(items: Any, path: Path, fields: Sequence[str]) -> Iterator[Tuple[Path, str]]:
+    for i, item in enumerate(items or ()):
+        if isinstance(item, dict):
+            for name in fields:
+                if name in item:
+                    yield from _strings(item[name], path + (i, name))
+
+
+def text_leaves(book: Book) -> List[Tuple[Path, str]]:
+    """`(path, text)` of every translatable leaf of `book`, in book order."""
+    leaves: List[Tuple[Path, str]] = []
+    for name in BOOK_FIELDS:
+        leaves.extend(_strings(getattr(book, name, None), (name,)))
+    for ai, act in enumerate(book.acts):
+        if isinstance(act, dict):
+            for name in ACT_FIELDS:
+                if name in act:
+                    leaves.extend(_strings(act[name], ("acts", ai, name)))
+        elif isinstance(act, Act):
+            leaves.extend(_strings(act.title, ("acts", ai, "title")))
+            for ci, chapter in enumerate(act.chapters):
+                cpath = ("acts", ai, "chapters", ci)
+                leaves.extend(_strings(chapter.title, cpath + ("title",)))
+                for si, scene in enumerate(chapter.scenes):
+                    spath = cpath + ("scenes", si)
+                    leaves.extend(_strings(scene.title, spath + ("title",)))
+                    for bi, beat in enumerate(scene.beats):
+                        leaves.extend(_strings(beat.text, spath + ("beats", bi, "text")))
+                        leaves.extend(_strings(beat.contents, spath + ("beats", bi, "contents")))
+    for name in ("protagonistas", "antagonistas"):
+        leaves.extend(_dict_fields(getattr(book, name, None), (name,), CHARACTER_FIELDS))
+    leaves.extend(_dict_fields(book.character_sheets, ("character_sheets",), SHEET_FIELDS))
+    return leaves
+
+
+def set_leaf(book: Book, path: Path, value: str) -> None:
+    node: Any = book
+    for key in path[:-1]:
+        node = _get(node, key)
+    _set(node, path[-1], value)
+
+
+def pack_batches(texts: Sequence[str], batch_chars: int = 6000) -> List[List[int]]:
+    """Indexes of `texts` packed in order into batches of about `batch_chars` characters."""
+    batches: List[List[int]] = []
+    current: List[int] = []
+    size = 0
+    for i, text in enumerate(texts):
+        if current and size + len(text) > batch_chars:
+            batches.append(current)
+            current, size = [], 0
+        current.append(i)
+        size += len(text)
+    if current:
+        batches.append(current)
+    return batches
+
+
+class LeafTranslator:
+    """Translates the text leaves of a pivot-language book into other locales."""
+
+    def __init__(self, generator: Any, batch_chars: int = 6000, workers: int = 4, pivot: str = PIVOT):
+        self.generator = generator
+        self.batch_chars = batch_chars
+        self.workers = workers
+        self.pivot = pivot
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"leaves": 0, "texts": 0, "requests": 0, "chars": 0, "missing": 0}
+
+    def translate(self, book: Book, locales: Sequence[str]) -> Dict[str, Book]:
+        """One translated copy of `book` per locale (the pivot locale gets a plain copy)."""
+        leaves = text_leaves(book)
+        texts: List[str] = []
+        index: Dict[str, int] = {}
+        for _path, text in leaves:
+            if text not in index:
+                index[text] = len(texts)
+                texts.append(text)
+        batches = pack_batches(texts, self.batch_chars)
+        with self._lock:
+            self.stats["leaves"] += len(leaves)
+            self.stats["texts"] += len(texts)
+
+        books = {locale: copy.deepcopy(book) for locale in locales}
+        targets = [locale for locale in locales if locale != self.pivot]
+        translated: Dict[str, List[Optional[str]]] = {locale: [None] * len(texts) for locale in targets}
+        jobs = [(locale, batch) for locale in targets for batch in batches]
+
+        def run(locale: str, batch: List[int]) -> None:
+            answer = self._translate_batch(books[locale], locale, [texts[i] for i in batch])
+            for i, text in zip(batch, answer):
+                translated[locale][i] = text
+
+        if len(jobs) <= 1 or self.workers <= 1:
+            for locale, batch in jobs:
+                run(locale, batch)
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(jobs)), thread_name_prefix="translate") as pool:
+                # copy_context: batches report into the caller's profiling step
+                futures = [pool.submit(contextvars.copy_context().run, run, locale, batch) for locale, batch in jobs]
+                for fut in futures:
+                    fut.result()
+
+        for locale in targets:
+            out = books[locale]
+            for path, text in leaves:
+                value = translated[locale][index[text]]
+                if value is not None:
+                    set_leaf(out, path, value)
+        return books
+
+    def _translate_batch(self, book: Book, locale: str, texts: List[str]) -> List[Optional[str]]:
+        """One structured request for `texts`; None for every text missing from the answer."""
+        gen = self.generator
+        schema = {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "translations",
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "translations": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "id": {"type": "integer"},
+                                    "texto": {"type": "string"},
+                                },
+                                "required": ["id", "texto"],
+                            },
+                            "minItems": len(texts),
+                        }
+                    },
+                    "required": ["translations"],
+                },
+            },
+        }
+
+        prompt_system = gen.prompts.get("system_translate", "Você é um tradutor literário. Responda em JSON válido.")
+        prompt_user_template = gen.prompts.get(
+            "user_translate",
+            "Traduza cada texto de {{idioma_origem}} para {{idioma}}, mantendo os ids: {{textos}}",
+        )
+        items = json.dumps([{"id": i, "texto": t} for i, t in enumerate(texts)], ensure_ascii=False)
+        prompt_user = (
+            prompt_user_template
+            .replace("{{textos}}", items)
+            .replace("{{idioma_origem}}", LOCALES.get(self.pivot, self.pivot))
+            .replace("{{idioma}}", LOCALES.get(locale, locale))
+            .replace("{{genero}}", str(getattr(book, "genre", None) or getattr(book, "genero", "") or ""))
+        )
+        prompts = [
+            {"role": "system", "content": prompt_system},
+            {"role": "user", "content": prompt_user},
+        ]
+
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["chars"] += sum(len(t) for t in texts)
+        parsed = gen._request_json(prompts, schema, book)
+        out: List[Optional[str]] = [None] * len(texts)
+        if parsed.ok:
+            for item in parsed.value:
+                if not isinstance(item, dict):
+                    continue
+                try:
+                    i = int(item.get("id"))
+                except (TypeError, ValueError):
+                    continue
+                text = item.get("texto")
+                if 0 <= i < len(texts) and isinstance(text, str) and text.strip():
+                    out[i] = text.strip()
+        missing = sum(1 for t in out if t is None)
+        if missing:
+            with self._lock:
+                self.stats["missing"] += missing
+            if parsed.ok:
+                gen._record_fallback(book, "translations", "incomplete")
+        return out
+
+
+def generate_multi_locale(
+    generator: Any,
+    locales: Sequence[str],
+    temperature: float = 0.9,
+    extra_summary: Optional[Dict[str, Any]] = None,
+    seed: Optional[int] = None,
+    translator: Optional[LeafTranslator] = None,
+) -> Dict[str, Book]:
+    """Build the book once in the pivot language, then translate it into `locales`."""
+    translator = translator or LeafTranslator(generator)
+    book = generator.build_book_structure_with_llm(temperature=temperature, extra_summary=extra_summary, seed=seed)
+    books = translator.translate(book, [l for l in locales if l != translator.pivot])
+    books[translator.pivot] = book
+    return books
@@ -0,0 +1,216 @@
+"""Opt-in profiling of the generation pipeline.
+
+While a `Profiler` is active (`with Profiler() as prof:` or `start()`/`stop()`):
+
+  - every pipeline step run through `LLMBookGenerator.run_step` is timed;
+  - code inside `section(category)` adds its time to the current step under
+    `network` (HTTP round trips), `serialization` (Book/extra_summary to
+    JSON) or `parse` (response decoding and schema repair);
+  - the remaining time of a step is `fallback` when the step recorded a
+    fallback on the book, otherwise `other` (prompt building, choosing, ...);
+  - with `sample=True` a background thread samples every thread's stack each
+    `interval` seconds; `write_stacks(path)` writes them in the folded format
+    read by flamegraph.pl, speedscope and inferno (`frame;frame;frame count`).
+
+When no profiler is active `section()` returns a shared no-op context
+manager, so the hooks cost a function call and an attribute read.
+"""
+from __future__ import annotations
+
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+from typing import Any, Dict, Optional
+
+CATEGORIES = ("network", "serialization", "parse")
+
+_NULL = nullcontext()
+_active: Optional["Profiler"] = None
+# (step name, per-step accumulator) of the running step; a ContextVar so
+# worker threads started with copy_context() report into the parent step
+_current: contextvars.ContextVar = contextvars.ContextVar("profiling_step", default=None)
+_in_section: contextvars.ContextVar = contextvars.ContextVar("profiling_section", default=False)
+
+
+def active() -> Optional["Profiler"]:
+    return _active
+
+
+def section(category: str):
+    """Time the enclosed code under `category` for the current step (no-op when not profiling)."""
+    prof = _active
+    if prof is None:
+        return _NULL
+    return _Section(prof, category)
+
+
+def step(name: str, book: Any = None):
+    """Time a whole pipeline step (no-op when not profiling)."""
+    prof = _active
+    if prof is None:
+        return _NULL
+    return _Step(prof, name, book)
+
+
+class _Section:
+    __slots__ = ("prof", "category", "started", "token")
+
+    def __init__(self, prof: "Profiler", category: str):
+        self.prof = prof
+        self.category = category
+
+    def __enter__(self):
+        # nested sections are counted once, under the outermost category
+        self.token = None if _in_section.get() else _in_section.set(True)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.token is None:
+            return False
+        elapsed = time.perf_counter() - self.started
+        _in_section.reset(self.token)
+        current = _current.get()
+        self.prof._add(current[0] if current else "(no step)", self.category, elapsed, current[1] if current else None)
+        return False
+
+
+class _Step:
+    __slots__ = ("prof", "name", "book", "started", "token", "acc", "fallbacks")
+
+    def __init__(self, prof: "Profiler", name: str, book: Any):
+        self.prof = prof
+        self.name = name
+        self.book = book
+
+    def __enter__(self):
+        self.acc = {"sections": 0.0}
+        self.fallbacks = len(getattr(self.book, "fallbacks", None) or ())
+        self.token = _current.set((self.name, self.acc))
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        _current.reset(self.token)
+        degraded = len(getattr(self.book, "fallbacks", None) or ()) > self.fallbacks
+        # concurrent sections (character sheet batches) can add up to more than wall time
+        rest = max(0.0, elapsed - self.acc["sections"])
+        self.prof._finish_step(self.name, elapsed, rest, degraded)
+        return False
+
+
+class Profiler:
+    """Per-step time breakdown plus an optional sampling profiler."""
+
+    def __init__(self, sample: bool = False, interval: float = 0.005):
+        self.sample = sample
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._steps: Dict[str, Dict[str, float]] = {}
+        self.stacks: Counter = Counter()
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.started_at: Optional[float] = None
+        self.wall_s = 0.0
+
+    def __enter__(self) -> "Profiler":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        global _active
+        if _active is not None and _active is not self:
+            raise RuntimeError("another Profiler is already active")
+        _active = self
+        self.started_at = time.perf_counter()
+        if self.sample and self._sampler is None:
+            self._stop.clear()
+            self._sampler = threading.Thread(target=self._sample_loop, name="profiler-sampler", daemon=True)
+            self._sampler.start()
+
+    def stop(self) -> None:
+        global _active
+        if _active is self:
+            _active = None
+        if self.started_at is not None:
+            self.wall_s += time.perf_counter() - self.started_at
+            self.started_at = None
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+            self._sampler = None
+
+    def _entry(self, step_name: str) -> Dict[str, float]:
+        entry = self._steps.get(step_name)
+        if entry is None:
+            entry = self._steps[step_name] = {"calls": 0, "total_s": 0.0}
+            for c in CATEGORIES:
+                entry[f"{c}_s"] = 0.0
+            entry.update({"fallback_s": 0.0, "other_s": 0.0})
+        return entry
+
+    def _add(self, step_name: str, category: str, seconds: float, acc: Optional[Dict[str, float]]) -> None:
+        with self._lock:
+            entry = self._entry(step_name)
+            key = f"{category}_s"
+            entry[key] = entry.get(key, 0.0) + seconds
+            if acc is not None:
+                acc["sections"] += seconds
+
+    def _finish_step(self, step_name: str, elapsed: float, rest: float, degraded: bool) -> None:
+        with self._lock:
+            entry = self._entry(step_name)
+            entry["calls"] += 1
+            entry["total_s"] += elapsed
+            entry["fallback_s" if degraded else "other_s"] += rest
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """`{step: {calls, total_s, network_s, serialization_s, parse_s, fallback_s, other_s}}`."""
+        with self._lock:
+            return {
+                name: {k: (round(v, 4) if isinstance(v, float) else v) for k, v in entry.items()}
+                for name, entry in self._steps.items()
+            }
+
+    def write_report(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"wall_s": round(self.wall_s, 4), "steps": self.report()}, f, ensure_ascii=False, indent=2)
+
+    def write_stacks(self, path: str) -> int:
+        """Write sampled stacks in folded format; returns the number of distinct stacks."""
+        with self._lock:
+            stacks = list(self.stacks.items())
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(stacks):
+                f.write(f"{stack} {count}\n")
+        return len(stacks)
+
+    def _sample_loop(self) -> None:
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            sample: Counter = Counter()
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                parts.append(names.get(ident, f"thread-{ident}"))
+                sample[";".join(reversed(parts))] += 1
+            with self._lock:
+                self.stacks.update(sample)
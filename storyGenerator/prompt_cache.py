@@ -0,0 +1,193 @@
+"""Approximate (similarity) cache of structured LLM responses.
+
+An exact cache misses most reuse: requests of list steps such as `genres` or
+`temas` usually differ only in the appended `Context: {...}` JSON of
+`extra_summary`, in whitespace or in key order, and those differences rarely
+change the useful answer. `SimilarityCache` reuses the parsed value of an
+earlier request when the new one is close enough:
+
+  - prompts are normalized (Unicode NFKC, lower case, collapsed whitespace)
+    and every JSON object/array embedded in them is re-serialized with
+    sorted keys, so key order and spacing inside the context do not matter;
+  - requests are only compared within the same bucket: same step (schema
+    name), model and system prompt;
+  - similarity is the Jaccard index of the word sets of the remaining
+    messages; the best entry at or above the step's threshold is a hit.
+    Identical normalized prompts hit without scoring.
+
+It is opt-in per step: only steps listed in `steps` (schema name ->
+threshold) are looked up or stored. Only successfully parsed values are
+stored, and a hit is a copy, so callers may mutate it.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple, Union
+
+DEFAULT_STEPS: Dict[str, float] = {"genres": 0.85, "temas": 0.85}
+
+_WORD_RE = re.compile(r"\w+")
+_SPACE_RE = re.compile(r"\s+")
+_JSON_START_RE = re.compile(r"[\[{]")
+_decoder = json.JSONDecoder()
+
+
+def canonicalize_json(text: str) -> str:
+    """Re-serialize every JSON object/array embedded in `text` with sorted keys."""
+    out: List[str] = []
+    pos = 0
+    while True:
+        m = _JSON_START_RE.search(text, pos)
+        if m is None:
+            break
+        start = m.start()
+        try:
+            value, end = _decoder.raw_decode(text, start)
+        except ValueError:
+            out.append(text[pos:start + 1])
+            pos = start + 1
+            continue
+        out.append(text[pos:start])
+        out.append(json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":")))
+        pos = end
+    out.append(text[pos:])
+    return "".join(out)
+
+
+def normalize(text: str) -> str:
+    text = canonicalize_json(unicodedata.normalize("NFKC", text or ""))
+    return _SPACE_RE.sub(" ", text).strip().lower()
+
+
+class _Entry:
+    __slots__ = ("bucket", "digest", "words", "value")
+
+    def __init__(self, bucket: str, digest: str, words: FrozenSet[str], value: str):
+        self.bucket = bucket
+        self.digest = digest
+        self.words = words
+        self.value = value
+
+
+class SimilarityCache:
+    """LRU of parsed responses, looked up by prompt similarity within a step."""
+
+    def __init__(self, steps: Union[Dict[str, float], Iterable[str], None] = None, threshold: float = 0.85, max_entries: int = 512):
+        if steps is None:
+            steps = DEFAULT_STEPS
+        if not isinstance(steps, dict):
+            steps = {name: threshold for name in steps}
+        self.steps: Dict[str, float] = dict(steps)
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # bucket -> word -> digests of the entries containing it
+        self._index: Dict[str, Dict[str, Set[str]]] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "exact_hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+
+    @classmethod
+    def from_config(cls, config: Any) -> Optional["SimilarityCache"]:
+        """
+        Cache from the `prompt_cache` key of the LLM config: true for the
+        default steps, a list of step names, or
+        `{"steps": {"genres": 0.85}, "threshold": ..., "max_entries": ...}`.
+        """
+        if not config:
+            return None
+        if config is True:
+            return cls()
+        if isinstance(config, list):
+            return cls(steps=config)
+        return cls(
+            steps=config.get("steps"),
+            threshold=config.get("threshold", 0.85),
+            max_entries=config.get("max_entries", 512),
+        )
+
+    def enabled(self, step: str) -> bool:
+        return step in self.steps
+
+    def _features(self, step: str, model: Optional[str], prompts: List[Dict[str, str]]) -> Tuple[str, str, FrozenSet[str]]:
+        system = [normalize(p.get("content", "")) for p in prompts if p.get("role") == "system"]
+        rest = [f"{p.get('role')}: {normalize(p.get('content', ''))}" for p in prompts if p.get("role") != "system"]
+        bucket = hashlib.sha1(json.dumps([step, model, system], ensure_ascii=False).encode("utf-8")).hexdigest()
+        digest = hashlib.sha1((bucket + "\n".join(rest)).encode("utf-8")).hexdigest()
+        words = frozenset(_WORD_RE.findall(" ".join(rest)))
+        return bucket, digest, words
+
+    def get(self, step: str, prompts: List[Dict[str, str]], model: Optional[str] = None) -> Optional[Any]:
+        """Parsed value of the most similar stored request, or None."""
+        threshold = self.steps.get(step)
+        if threshold is None:
+            return None
+        bucket, digest, words = self._features(step, model, prompts)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self.stats["exact_hits"] += 1
+            else:
+                entry = self._most_similar(bucket, words, threshold)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(entry.digest)
+            self.stats["hits"] += 1
+            raw = entry.value
+        return json.loads(raw)
+
+    def _most_similar(self, bucket: str, words: FrozenSet[str], threshold: float) -> Optional[_Entry]:
+        index = self._index.get(bucket)
+        if not index or not words:
+            return None
+        shared: Dict[str, int] = {}
+        for word in words:
+            for digest in index.get(word, ()):
+                shared[digest] = shared.get(digest, 0) + 1
+        best, best_score = None, threshold
+        for digest, n in shared.items():
+            entry = self._entries[digest]
+            score = n / (len(words) + len(entry.words) - n)
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    def put(self, step: str, prompts: List[Dict[str, str]], value: Any, model: Optional[str] = None) -> None:
+        if step not in self.steps:
+            return
+        bucket, digest, words = self._features(step, model, prompts)
+        raw = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            if digest in self._entries:
+                self._entries[digest].value = raw
+                self._entries.move_to_end(digest)
+                return
+            self._entries[digest] = _Entry(bucket, digest, words, raw)
+            index = self._index.setdefault(bucket, {})
+            for word in words:
+                index.setdefault(word, set()).add(digest)
+            self.stats["stored"] += 1
+            while len(self._entries) > self.max_entries:
+                self._evict()
+
+    def _evict(self) -> None:
+        _, entry = self._entries.popitem(last=False)
+        index = self._index.get(entry.bucket, {})
+        for word in entry.words:
+            digests = index.get(word)
+            if digests is not None:
+                digests.discard(entry.digest)
+                if not digests:
+                    del index[word]
+        self.stats["evicted"] += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def hit_rate(self) -> float:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
@@ -0,0 +1,271 @@
+"""Prose drafting stage: writes the text of every beat to a per-book store on disk.
+
+Full prose is megabytes per book, so the drafted text never lives on the
+`Book`: `ProseDrafter.draft(book)` streams each beat's completion
+(`LLMentryPoint.stream_text`) straight into a file of a `ProseStore`, and
+`Beat.contents` stays as it was. Memory use is bounded by one beat per
+worker whatever the length of the book.
+
+  - Acts are drafted in order; the chapters of an act are drafted
+    concurrently by up to `max_workers` threads, the scenes and beats of a
+    chapter in order (each beat continues the previous one). A beat that
+    fails stops its chapter, and the run stops after that act.
+  - Continuity comes from a `SummaryMemory` (summary_memory.py): each beat
+    prompt gets a bounded context instead of the previous beats.
+  - Progress is per beat: a beat is written to `<key>.txt.part` and renamed
+    to `<key>.txt` when its stream ends, so an interrupted run resumes at the
+    first unfinished beat of each chapter. The summaries of the open nodes
+    and the nodes already folded are saved in `progress.json` after every
+    scene; a folded chapter or act stands for its scenes or chapters, so
+    the file stays small however long the book.
+
+Beats need an act -> chapter -> scene -> beat tree (`Act` objects, as built
+by the editor or loaded with `Book.from_dict`); dict acts produced by the
+three-act step have no beats and are skipped.
+"""
+from __future__ import annotations
+
+import contextvars
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from book_dataclasses import Act, Book
+from circuit_breaker import LLMUnavailableError
+from summary_memory import SummaryMemory, act_key, chapter_key, scene_key
+
+
+def beat_key(act: int, chapter: int, scene: int, beat: int) -> str:
+    # zero-padded so that sorted file names follow the book order
+    return f"{act:03d}.{chapter:03d}.{scene:03d}.{beat:03d}"
+
+
+def book_dir(root: str, book: Book) -> str:
+    """Directory of `book` under `root`: title slug plus a hash of title and logline."""
+    slug = re.sub(r"[^\w-]+", "-", (book.title or "livro").lower()).strip("-")[:40] or "livro"
+    digest = hashlib.sha1(f"{book.title}\n{book.logline}".encode("utf-8")).hexdigest()[:10]
+    return os.path.join(root, f"{slug}-{digest}")
+
+
+def iter_beats(book: Book) -> Iterator[Tuple[int, int, int, int, Any]]:
+    """`(act, chapter, scene, beat, Beat)` for every beat of the book's Act objects."""
+    for ai, act in enumerate(book.acts):
+        if not isinstance(act, Act):
+            continue
+        for ci, chapter in enumerate(act.chapters):
+            for si, scene in enumerate(chapter.scenes):
+                for bi, beat in enumerate(scene.beats):
+                    yield ai, ci, si, bi, beat
+
+
+class ProseStore:
+    """One text file per beat under `path`, plus `progress.json`."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key + ".txt")
+
+    def is_done(self, key: str) -> bool:
+        return os.path.exists(self._file(key))
+
+    def done_keys(self) -> Set[str]:
+        return {name[:-4] for name in os.listdir(self.path) if name.endswith(".txt")}
+
+    def open_beat(self, key: str):
+        """Writable file for a beat; `commit_beat` makes it visible, `discard_beat` drops it."""
+        return open(self._file(key) + ".part", "w", encoding="utf-8")
+
+    def commit_beat(self, key: str) -> None:
+        os.replace(self._file(key) + ".part", self._file(key))
+
+    def discard_beat(self, key: str) -> None:
+        try:
+            os.remove(self._file(key) + ".part")
+        except FileNotFoundError:
+            pass
+
+    def read(self, key: str) -> str:
+        with open(self._file(key), "r", encoding="utf-8") as f:
+            return f.read()
+
+    def load_progress(self) -> Dict[str, Any]:
+        try:
+            with open(os.path.join(self.path, "progress.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save_progress(self, summaries: Dict[str, str], folded: Set[str]) -> None:
+        target = os.path.join(self.path, "progress.json")
+        with self._lock:
+            with open(target + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"summaries": summaries, "folded": sorted(folded)}, f, ensure_ascii=False)
+            os.replace(target + ".tmp", target)
+
+    def assemble(self, book: Book, out_path: str) -> int:
+        """Write the drafted beats in book order to one text file; returns the beats written."""
+        count = 0
+        with open(out_path, "w", encoding="utf-8") as out:
+            last: Tuple[int, int] = (-1, -1)
+            for ai, ci, si, bi, _beat in iter_beats(book):
+                key = beat_key(ai, ci, si, bi)
+                if not self.is_done(key):
+                    continue
+                if (ai, ci) != last:
+                    chapter = book.acts[ai].chapters[ci]
+                    out.write(f"\n\n{chapter.title or f'Capítulo {ci + 1}'}\n\n")
+                    last = (ai, ci)
+                with open(self._file(key), "r", encoding="utf-8") as f:
+                    for chunk in iter(lambda: f.read(65536), ""):
+                        out.write(chunk)
+                out.write("\n\n")
+                count += 1
+        return count
+
+
+class ProseDrafter:
+    """Drafts the prose of every beat of a book into a ProseStore."""
+
+    def __init__(
+        self,
+        generator: Any,
+        store: ProseStore,
+        max_workers: int = 4,
+        memory: Optional[SummaryMemory] = None,
+        words_per_beat: int = 250,
+        temperature: float = 0.8,
+    ):
+        self.generator = generator
+        self.store = store
+        self.max_workers = max_workers
+        self.memory = memory
+        self.words_per_beat = words_per_beat
+        self.temperature = temperature
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"beats": 0, "resumed": 0, "failed": 0, "chars": 0}
+
+    def draft(self, book: Book) -> Dict[str, int]:
+        memory = self.memory or SummaryMemory(book)
+        progress = self.store.load_progress()
+        if progress.get("summaries"):
+            memory.summaries.update(progress["summaries"])
+        folded: Set[str] = set(progress.get("folded", ()))
+
+        for ai, act in enumerate(book.acts):
+            if not isinstance(act, Act) or act_key(ai) in folded:
+                continue
+            chapters = [(ci, ch) for ci, ch in enumerate(act.chapters) if chapter_key(ai, ci) not in folded]
+            with ThreadPoolExecutor(max_workers=max(1, self.max_workers), thread_name_prefix="draft") as pool:
+                futures = [
+                    pool.submit(contextvars.copy_context().run, self._draft_chapter, book, memory, folded, ai, ci, chapter)
+                    for ci, chapter in chapters
+                ]
+                done = [f.result() for f in futures]
+            # chapters fold into the act summary here, one at a time and in
+            # story order (concurrent folds of one key would overwrite each
+            # other); a failed chapter stops the folding until the rerun
+            complete = True
+            for (ci, chapter), ok in zip(chapters, done):
+                if not ok:
+                    complete = False
+                    break
+                memory.chapter_done(ai, ci, chapter.title)
+                self._folded(memory, folded, chapter_key(ai, ci))
+            if not complete:
+                # later acts continue from this one: wait for a rerun
+                break
+            memory.act_done(ai, act.title)
+            self._folded(memory, folded, act_key(ai))
+        return dict(self.stats)
+
+    def _folded(self, memory: SummaryMemory, folded: Set[str], key: str) -> None:
+        kind, _, path = key.partition(":")
+        # a folded chapter (act) is skipped whole on resume: its scenes (chapters) need no entry
+        children = {"chapter": "scene:", "act": "chapter:"}.get(kind)
+        with self._lock:
+            if children:
+                folded.difference_update([k for k in folded if k.startswith(f"{children}{path}.")])
+            folded.add(key)
+            snapshot = set(folded)
+        self.store.save_progress(memory.snapshot(), snapshot)
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += n
+
+    def _draft_chapter(self, book: Book, memory: SummaryMemory, folded: Set[str], ai: int, ci: int, chapter: Any) -> bool:
+        """Draft the scenes of one chapter; False when a beat failed (the rest of the chapter waits for a rerun)."""
+        for si, scene in enumerate(chapter.scenes):
+            if scene_key(ai, ci, si) in folded:
+                continue
+            # a partly drafted scene is re-folded from its finished beats
+            memory.forget(scene_key(ai, ci, si))
+            for bi, beat in enumerate(scene.beats):
+                key = beat_key(ai, ci, si, bi)
+                if self.store.is_done(key):
+                    self._count("resumed")
+                else:
+                    prompt = self._prompt(book, memory, ai, ci, si, chapter, scene, beat)
+                    if not self._write_beat(key, prompt):
+                        self._count("failed")
+                        return False
+                    self._count("beats")
+                memory.beat_done(ai, ci, si, self.store.read(key))
+            memory.scene_done(ai, ci, si, scene.title)
+            self._folded(memory, folded, scene_key(ai, ci, si))
+        return True
+
+    def _write_beat(self, key: str, messages: List[Dict[str, str]]) -> bool:
+        entry = self.generator.entrypoint
+        max_tokens = int(self.words_per_beat * 2.5)
+        written = 0
+        try:
+            with self.store.open_beat(key) as f:
+                for piece in entry.stream_text(messages, temperature=self.temperature, max_tokens=max_tokens, step="prose"):
+                    f.write(piece)
+                    written += len(piece)
+        except LLMUnavailableError:
+            written = 0
+        except BaseException:
+            self.store.discard_beat(key)
+            raise
+        if not written:
+            self.store.discard_beat(key)
+            return False
+        self.store.commit_beat(key)
+        self._count("chars", written)
+        return True
+
+    def _prompt(self, book: Book, memory: SummaryMemory, ai: int, ci: int, si: int, chapter: Any, scene: Any, beat: Any) -> List[Dict[str, str]]:
+        prompts = self.generator.prompts
+        system = prompts.get("system_prose", "Você é um romancista. Escreva prosa literária em português brasileiro.")
+        template = prompts.get("user_prose", "Escreva o trecho do beat '{{beat}}' com cerca de {{palavras}} palavras.\n\n{{continuidade}}")
+        act = book.acts[ai]
+        user = (
+            template.replace("{{genero}}", str(book.genre or book.genero or ""))
+            .replace("{{tema}}", str(book.tema or ""))
+            .replace("{{logline}}", str(book.logline or ""))
+            .replace("{{heroi}}", str(_name(book.heroi)))
+            .replace("{{vilao}}", str(_name(book.vilao)))
+            .replace("{{ato}}", str(act.title or f"Ato {ai + 1}"))
+            .replace("{{capitulo}}", str(chapter.title or f"Capítulo {ci + 1}"))
+            .replace("{{cena}}", str(scene.title or f"Cena {si + 1}"))
+            .replace("{{beat}}", str(beat.text or ""))
+            .replace("{{palavras}}", str(self.words_per_beat))
+            .replace("{{continuidade}}", memory.context(ai, ci, si) or "(início do livro)")
+        )
+        return [{"role": "system", "content": system}, {"role": "user", "content": user}]
+
+
+def _name(character: Any) -> str:
+    if isinstance(character, dict):
+        return character.get("nome") or ""
+    return character or ""
@@ -0,0 +1,312 @@
+"""Schema-driven parsing of structured LLM responses.
+
+`generate_json` may hand back a parsed object, a raw string, or a
+`{"content": ...}` wrapper when the model's text was not valid JSON. A
+`ResponseParser` is compiled once from a step's `response_schema` and turns
+any of those shapes into the value the step expects (for example the list
+under `"genres"`), in a single pass.
+
+Common LLM JSON defects are repaired on the way: markdown code fences, prose
+around the JSON, trailing commas and arrays/objects cut off by `max_tokens`.
+Every parse records which repair path produced the value, so `ParseStats`
+can tell how often a step would otherwise have needed a re-request.
+"""
+from __future__ import annotations
+
+import json
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+_FENCE_RE = re.compile(r"```[a-zA-Z0-9_-]*\s*(.*?)\s*(?:```|$)", re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r",(\s*[}\]])")
+
+# Repair path labels (joined with "+" when several repairs were needed)
+REPAIR_NONE = "direct"
+REPAIR_FAILED = "failed"
+
+
+@dataclass
+class ParseResult:
+    """Outcome of parsing one response.
+
+    Fields:
+      - value: the extracted value (list of strings/objects, or an object)
+      - repair: which path produced the value ("direct", "nested", "fence+trailing_comma", ...)
+      - rejected: items dropped because they did not match the item schema
+    """
+    value: Any
+    repair: str
+    rejected: List[Any] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        if self.value is None:
+            return False
+        if isinstance(self.value, list):
+            return len(self.value) > 0
+        return True
+
+
+class ResponseParser:
+    """Extracts and validates the shape described by an OpenAI-style `response_schema`.
+
+    The parser looks at the top-level object schema and picks its first required
+    property (e.g. `genres`, `protagonistas`, `acts`) as the key to extract.
+    Array items are validated against the item schema: strings are stripped and
+    empty ones dropped; objects must be dicts carrying every required field.
+    """
+
+    def __init__(self, response_schema: Optional[Dict[str, Any]]):
+        spec = (response_schema or {}).get("json_schema", {}) or {}
+        schema = spec.get("schema", {}) or {}
+        props = schema.get("properties", {}) or {}
+        required = schema.get("required") or list(props)
+
+        self.name: str = spec.get("name") or (required[0] if required else "response")
+        self.key: Optional[str] = required[0] if required else None
+        field_schema = props.get(self.key, {}) if self.key else {}
+        self.is_list: bool = field_schema.get("type") == "array"
+        self.min_items: int = int(field_schema.get("minItems", 0) or 0)
+        items = field_schema.get("items", {}) or {}
+        self.item_type: str = items.get("type", "string")
+        self.item_required: Tuple[str, ...] = tuple(items.get("required", ()) or ())
+
+    # ------------------------------------------------------------------ parse
+
+    def parse(self, result: Any) -> ParseResult:
+        """Parse `result` (object, JSON text or `{"content": text}` wrapper)."""
+        repairs: List[str] = []
+
+        if isinstance(result, dict) and self._is_text_wrapper(result):
+            result = result["content"]
+
+        if isinstance(result, str):
+            result = self._load_text(result, repairs)
+            if result is None:
+                return ParseResult(None, REPAIR_FAILED)
+
+        value = self._extract(result, repairs)
+        if value is None:
+            return ParseResult(None, REPAIR_FAILED)
+
+        if self.is_list:
+            value, rejected = self.validate_items(value)
+        else:
+            rejected = []
+        return ParseResult(value, "+".join(repairs) or REPAIR_NONE, rejected)
+
+    def validate_item(self, item: Any) -> bool:
+        """Return True when `item` matches the array item schema."""
+        if self.item_type == "object":
+            if not isinstance(item, dict):
+                return False
+            for k in self.item_required:
+                v = item.get(k)
+                if v is None or (isinstance(v, str) and not v.strip()):
+                    return False
+            return True
+        if isinstance(item, bool):
+            return False
+        return isinstance(item, (str, int, float)) and bool(str(item).strip())
+
+    def validate_items(self, items: List[Any]) -> Tuple[List[Any], List[Any]]:
+        """Split `items` into (valid, rejected), normalizing valid scalar items to strings."""
+        valid: List[Any] = []
+        rejected: List[Any] = []
+        for item in items:
+            if not self.validate_item(item):
+                rejected.append(item)
+            elif self.item_type == "object":
+                valid.append(item)
+            else:
+                valid.append(str(item).strip())
+        return valid, rejected
+
+    # --------------------------------------------------------------- helpers
+
+    def _is_text_wrapper(self, result: Dict[str, Any]) -> bool:
+        # `generate_json` wraps unparseable content as {"content": "..."}
+        return (
+            len(result) == 1
+            and isinstance(result.get("content"), str)
+            and self.key != "content"
+        )
+
+    def _extract(self, obj: Any, repairs: List[str]) -> Any:
+        if not self.is_list:
+            if isinstance(obj, dict):
+                if self.key and isinstance(obj.get(self.key), dict):
+                    repairs.append("nested")
+                    return obj[self.key]
+                return obj
+            return None
+
+        if isinstance(obj, list):
+            repairs.append("bare_list")
+            return obj
+        if not isinstance(obj, dict):
+            return None
+        if self.key and isinstance(obj.get(self.key), list):
+            return obj[self.key]
+        # Structured output is sometimes nested under another name
+        # (e.g. {"genres_list": [...]} or {"genres": {"genres": [...]}})
+        for v in obj.values():
+            if isinstance(v, list):
+                repairs.append("nested")
+                return v
+        for v in obj.values():
+            if isinstance(v, dict):
+                inner = self._extract(v, [])
+                if inner is not None:
+                    repairs.append("nested")
+                    return inner
+        return None
+
+    def _load_text(self, text: str, repairs: List[str]) -> Any:
+        """JSON-decode `text`, applying repairs in order until one succeeds."""
+        candidate = text.strip()
+        value = _try_loads(candidate)
+        if value is not _MISSING:
+            return value
+
+        m = _FENCE_RE.search(candidate)
+        if m:
+            candidate = m.group(1).strip()
+            repairs.append("fence")
+            value = _try_loads(candidate)
+            if value is not _MISSING:
+                return value
+
+        start = _first_json_start(candidate)
+        if start < 0:
+            return None
+        end = max(candidate.rfind("}"), candidate.rfind("]"))
+        # Prose around the JSON ("Here is the list: [...] Hope it helps")
+        if end > start and (start > 0 or end < len(candidate) - 1):
+            value = _try_loads(candidate[start : end + 1])
+            if value is not _MISSING:
+                repairs.append("embedded")
+                return value
+        if start > 0:
+            repairs.append("embedded")
+            candidate = candidate[start:]
+
+        fixed = _TRAILING_COMMA_RE.sub(r"\1", candidate)
+        if fixed != candidate:
+            candidate = fixed
+            repairs.append("trailing_comma")
+            value = _try_loads(candidate)
+            if value is not _MISSING:
+                return value
+
+        closed = _close_truncated(candidate)
+        if closed is not None:
+            value = _try_loads(_TRAILING_COMMA_RE.sub(r"\1", closed))
+            if value is not _MISSING:
+                repairs.append("truncated")
+                return value
+        return None
+
+
+class ParseStats:
+    """Counts parse outcomes per (step, repair path)."""
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, step: str, repair: str) -> None:
+        with self._lock:
+            self.counts[(step, repair)] += 1
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        """Return `{step: {repair: count}}`."""
+        out: Dict[str, Dict[str, int]] = {}
+        for (step, repair), n in sorted(self.counts.items()):
+            out.setdefault(step, {})[repair] = n
+        return out
+
+    def failure_rate(self, step: Optional[str] = None) -> float:
+        total = failed = 0
+        for (s, repair), n in self.counts.items():
+            if step is not None and s != step:
+                continue
+            total += n
+            if repair == REPAIR_FAILED:
+                failed += n
+        return failed / total if total else 0.0
+
+
+_MISSING = object()
+
+
+def _try_loads(text: str) -> Any:
+    try:
+        return json.loads(text)
+    except (ValueError, TypeError):
+        return _MISSING
+
+
+def _first_json_start(text: str) -> int:
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    return min(starts) if starts else -1
+
+
+def _close_truncated(text: str) -> Optional[str]:
+    """Cut `text` back to its last complete element and close open containers.
+
+    Tracks the bracket stack while scanning; a "safe point" is recorded after
+    every complete array element or object value. `["a", "b", "c` becomes
+    `["a", "b"]` and `{"x": ["a", "b` becomes `{"x": ["a"]}`.
+    """
+    stack: List[str] = []
+    expect_value: List[bool] = []  # per object frame: True after ':'
+    in_string = False
+    escape = False
+    safe_end = -1
+    safe_stack: List[str] = []
+
+    def mark(pos: int) -> None:
+        nonlocal safe_end, safe_stack
+        safe_end = pos
+        safe_stack = list(stack)
+
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+                if stack and (stack[-1] == "[" or expect_value[-1]):
+                    mark(i + 1)
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "[{":
+            stack.append(ch)
+            expect_value.append(False)
+        elif ch in "]}":
+            if not stack:
+                return None
+            stack.pop()
+            expect_value.pop()
+            mark(i + 1)
+        elif ch == ":" and stack and stack[-1] == "{":
+            expect_value[-1] = True
+        elif ch == "," and stack:
+            if stack[-1] == "{":
+                expect_value[-1] = False
+            mark(i)
+
+    if not stack and not in_string:
+        return None  # not truncated; nothing to close
+    if safe_end < 0:
+        return None
+    head = text[:safe_end].rstrip().rstrip(",")
+    closers = "".join("]" if c == "[" else "}" for c in reversed(safe_stack))
+    return head + closers
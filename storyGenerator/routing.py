@@ -0,0 +1,88 @@
+"""Per-step model routing.
+
+Short structured steps (genres, temas, conceitos, ...) do not need the model
+used for long expansions. A routing table maps step names (the response
+schema name, or the `step` passed to `generate_text`) to a route with its own
+model, endpoint, temperature and token limit. Steps without a route use the
+entrypoint's defaults (the "default" route).
+
+Config (`config.json`):
+
+    "routes": {
+        "fast": {
+            "model": "qwen2.5-3b-instruct",
+            "base_url": "http://localhost:1234/v1",
+            "temperature": 0.8,
+            "max_tokens": 400,
+            "steps": ["genres", "temas", "conceitos", "loglines"]
+        },
+        "large": {
+            "model": "gpt-4o",
+            "steps": ["logline_expansion", "protagonistas", "antagonistas", "acts"]
+        }
+    }
+
+Any field except `steps` may be omitted to keep the entrypoint's value.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+DEFAULT_ROUTE = "default"
+
+
+@dataclass
+class Route:
+    name: str
+    model: Optional[str] = None
+    base_url: Optional[str] = None
+    api_key: Optional[str] = None
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None
+    steps: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, name: str, data: Dict[str, Any]) -> "Route":
+        unknown = set(data) - {"model", "base_url", "api_key", "temperature", "max_tokens", "steps"}
+        if unknown:
+            raise ValueError(f"route {name!r}: unknown keys {sorted(unknown)}")
+        return cls(
+            name=name,
+            model=data.get("model"),
+            base_url=data.get("base_url"),
+            api_key=data.get("api_key"),
+            temperature=data.get("temperature"),
+            max_tokens=data.get("max_tokens"),
+            steps=list(data.get("steps") or []),
+        )
+
+
+class RouteTable:
+    """Resolves a step name to its Route (or the default route)."""
+
+    def __init__(self, routes: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.routes: Dict[str, Route] = {}
+        self._by_step: Dict[str, Route] = {}
+        for name, data in (routes or {}).items():
+            route = self.routes[name] = Route.from_dict(name, data)
+            for step in route.steps:
+                if step in self._by_step:
+                    raise ValueError(f"step {step!r} is routed to both {self._by_step[step].name!r} and {name!r}")
+                self._by_step[step] = route
+        self.default = Route(DEFAULT_ROUTE)
+
+    def __bool__(self) -> bool:
+        return bool(self.routes)
+
+    def for_step(self, step: Optional[str]) -> Route:
+        return self._by_step.get(step or "", self.default)
+
+    def base_urls(self) -> List[str]:
+        return [r.base_url for r in self.routes.values() if r.base_url]
+
+    def api_key_for(self, base_url: str) -> Optional[str]:
+        for route in self.routes.values():
+            if route.base_url == base_url and route.api_key:
+                return route.api_key
+        return None
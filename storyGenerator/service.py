@@ -0,0 +1,249 @@
+"""Long-running local HTTP service for book generation.
+
+Keeps one warm `LLMBookGenerator` (prompts loaded, pooled HTTP connections,
+parsers, last-good cache and optionally a step memo) and serves generation jobs over HTTP
+on a TCP port or a Unix socket, so the editor does not pay process start-up
+per book.
+
+Endpoints:
+  - POST /v1/books: body is a job payload as in worker.py (`seed`, preset
+    fields such as `genre`, `extra_summary`). The answer is streamed as
+    NDJSON, one line per completed step:
+        {"event": "step", "step": "genre", "fields": {"genre": "Fantasia"}}
+    then {"event": "done", "book": {...}} (or {"event": "error", ...}).
+    Closing the connection cancels the remaining steps.
+  - GET /v1/health: status, jobs in flight, circuit breakers.
+  - GET /v1/stats: parse/fallback counters, latency per route, token budget.
+
+Concurrent jobs share the entrypoint (one connection pool, circuit breakers,
+single-flight, routing); at most `max_jobs` run at once, the rest wait.
+"""
+from __future__ import annotations
+
+import json
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+from LLMStructure import LLMBookGenerator, LLMentryPoint, _load_prompts
+from prompt_cache import SimilarityCache
+from step_memo import StepMemo, step_outputs
+from worker import job_book
+
+
+def quiet_choice(msg, items, rng=None):
+    """Random chooser that does not print (the service streams choices instead)."""
+    import random
+    return (rng or random).choice(items)
+
+
+class BookService:
+    """Shared state of the service: the warm generator and the job slots."""
+
+    def __init__(self, llm_config: Dict[str, Any], max_jobs: int = 4, memo_entries: int = 0):
+        self.entrypoint = LLMentryPoint.from_config(llm_config)
+        self.generator = LLMBookGenerator(
+            api_key=self.entrypoint.api_key,
+            base_url=self.entrypoint.base_url,
+            model=self.entrypoint.model,
+            entrypoint=self.entrypoint,
+        )
+        self.generator.chooser = quiet_choice
+        # character names reach the client as step events, not on stdout
+        self.generator.announce = None
+        # off by default: a shared memo also hands every job the same candidate lists
+        self.generator.memo = StepMemo(max_entries=memo_entries) if memo_entries else None
+        self.generator.prompt_cache = SimilarityCache.from_config(llm_config.get("prompt_cache"))
+        self.max_jobs = max_jobs
+        self._slots = threading.BoundedSemaphore(max_jobs)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.stats: Dict[str, int] = {"jobs": 0, "done": 0, "failed": 0, "cancelled": 0}
+        self.started_at = time.time()
+
+    def warm_up(self) -> None:
+        """Load prompts and size the connection pool before the first job."""
+        _load_prompts()
+        from requests.adapters import HTTPAdapter
+
+        session = self.entrypoint.session
+        # one pooled connection per concurrent request across all jobs
+        pool = max(10, self.max_jobs * max(1, self.generator.character_workers))
+        adapter = HTTPAdapter(pool_connections=pool, pool_maxsize=pool)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+    def run_job(self, payload: Dict[str, Any], emit) -> Dict[str, Any]:
+        """Run the pipeline for one job, calling `emit(event)` after each step."""
+        generator = self.generator.spawn()
+        if payload.get("seed") is not None:
+            import random
+            generator.rng = random.Random(payload["seed"])
+        extra_summary = payload.get("extra_summary")
+        book = job_book(payload)
+
+        with self._slots:
+            with self._lock:
+                self.in_flight += 1
+                self.stats["jobs"] += 1
+            try:
+                for name in generator.PIPELINE:
+                    if getattr(book, name, None):
+                        continue
+                    started = time.monotonic()
+                    generator.run_step(name, book, extra_summary)
+                    fields = {f: getattr(book, f) for f in step_outputs(name)}
+                    emit({
+                        "event": "step",
+                        "step": name,
+                        "fields": _jsonable(fields),
+                        "seconds": round(time.monotonic() - started, 3),
+                    })
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+        return book.to_dict()
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "status": "ok",
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "in_flight": self.in_flight,
+            "max_jobs": self.max_jobs,
+            "breakers": self.entrypoint.breaker_status(),
+            "concurrency": self.entrypoint.limiter_status(),
+        }
+
+    def stats_report(self) -> Dict[str, Any]:
+        gen = self.generator
+        return {
+            "jobs": dict(self.stats),
+            "parse": gen.parse_stats.summary(),
+            "fallbacks": {f"{step}:{reason}": n for (step, reason), n in gen.fallback_counts.items()},
+            "routes": self.entrypoint.route_report(),
+            "token_budget": self.entrypoint.budget.stats(),
+            "memo": dict(gen.memo.stats) if gen.memo is not None else None,
+            "prompt_cache": dict(gen.prompt_cache.stats) if gen.prompt_cache is not None else None,
+            "single_flight": dict(self.entrypoint.single_flight.stats),
+        }
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "storyGenerator"
+    service: BookService
+
+    def log_message(self, fmt: str, *args: Any) -> None:
+        # client_address is not a (host, port) tuple on Unix sockets
+        print(f"[service] {fmt % args}")
+
+    def do_GET(self) -> None:
+        if self.path == "/v1/health":
+            self._send_json(200, self.service.health())
+        elif self.path == "/v1/stats":
+            self._send_json(200, self.service.stats_report())
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self) -> None:
+        if self.path != "/v1/books":
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("job payload must be a JSON object")
+        except ValueError as exc:
+            self._send_json(400, {"error": str(exc)})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            book = self.service.run_job(payload, self._write_event)
+            self._write_event({"event": "done", "book": book})
+            self.service.count("done")
+        except (BrokenPipeError, ConnectionResetError):
+            # client went away: the remaining steps are not run
+            self.service.count("cancelled")
+            self.close_connection = True
+            return
+        except Exception as exc:
+            self.service.count("failed")
+            try:
+                self._write_event({"event": "error", "error": f"{type(exc).__name__}: {exc}"})
+            except OSError:
+                self.close_connection = True
+                return
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _write_event(self, event: Dict[str, Any]) -> None:
+        line = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, code: int, obj: Any) -> None:
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ("unix", 0)
+
+
+def make_server(service: BookService, host: str = "127.0.0.1", port: int = 8765, unix_socket: Optional[str] = None):
+    handler = type("BookServiceHandler", (_Handler,), {"service": service})
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+        return _UnixHTTPServer(unix_socket, handler)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(
+    llm_config: Dict[str, Any],
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    unix_socket: Optional[str] = None,
+    max_jobs: int = 4,
+    memo_entries: int = 0,
+) -> None:
+    service = BookService(llm_config, max_jobs=max_jobs, memo_entries=memo_entries)
+    service.warm_up()
+    server = make_server(service, host, port, unix_socket)
+    where = unix_socket or f"http://{host}:{server.server_address[1]}"
+    print(f"storyGenerator service listening on {where} (max {max_jobs} concurrent jobs)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if unix_socket and os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+
+
+def _jsonable(value: Any) -> Any:
+    return json.loads(json.dumps(value, ensure_ascii=False, default=lambda o: o.to_dict() if hasattr(o, "to_dict") else str(o)))
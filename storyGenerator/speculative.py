@@ -0,0 +1,185 @@
+"""Speculative pipelining across choice points.
+
+Every choice step (genre, conceito, logline, tema) blocks the pipeline until
+`generator.chooser` picks one candidate. When the chooser is slow (a user at
+a prompt, a ranking model), `SpeculativeRunner` starts the *next* step for
+the top-k candidates in parallel while the chooser decides:
+
+  - candidates are ordered by `ranker(step, candidates, book)` (default: as
+    returned by the LLM) and the first `top_k` get a speculative branch;
+  - each branch runs the next step on a copy of the book with that
+    candidate filled in (for a choice step only its candidates are
+    generated; the choice itself always happens on the main thread);
+  - the branch of the chosen candidate is kept and its output is used as
+    the next step's result; the other branches are cancelled (not started
+    yet) or discarded (already running, their requests cannot be aborted;
+    `build` returns without waiting for them);
+  - at most `max_branches` branches are started per book (the speculation
+    budget); once it is spent the pipeline runs normally.
+
+The result is the same book the normal pipeline would build for the same
+choices; only the waiting time per decision changes.
+"""
+from __future__ import annotations
+
+import copy
+import dataclasses
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from book_dataclasses import Book
+from LLMStructure import LLMBookGenerator
+import profiling
+
+Ranker = Callable[[str, List[Any], Book], List[Any]]
+
+
+def keep_order(step: str, candidates: List[Any], book: Book) -> List[Any]:
+    return list(candidates)
+
+
+class _Branch:
+    __slots__ = ("candidates", "fields", "fallbacks")
+
+    def __init__(self, candidates: Optional[List[Any]], fields: Dict[str, Any], fallbacks: List[Dict[str, Any]]):
+        self.candidates = candidates
+        self.fields = fields
+        self.fallbacks = fallbacks
+
+
+class SpeculativeRunner:
+    """Runs `generator`'s pipeline, speculating on the top-k candidates of each choice."""
+
+    def __init__(
+        self,
+        generator: LLMBookGenerator,
+        top_k: int = 2,
+        max_branches: int = 8,
+        ranker: Optional[Ranker] = None,
+        max_workers: int = 4,
+    ):
+        self.generator = generator
+        self.top_k = top_k
+        self.max_branches = max_branches
+        self.ranker = ranker or keep_order
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {
+            "branches": 0,
+            "hits": 0,
+            "misses": 0,
+            "cancelled": 0,
+            "discarded": 0,
+            "budget_exhausted": 0,
+        }
+
+    def build(
+        self,
+        temperature: Optional[float] = None,
+        extra_summary: Optional[Dict[str, Any]] = None,
+        seed: Optional[int] = None,
+        book: Optional[Book] = None,
+    ) -> Book:
+        """Same contract as `LLMBookGenerator.build_book_structure_with_llm`."""
+        gen = self.generator
+        if temperature is not None:
+            gen.temperature = temperature
+        if seed is not None:
+            import random
+            gen.rng = random.Random(seed)
+        else:
+            gen.rng = None
+
+        book = book or Book()
+        budget = self.max_branches
+        prefetched: Optional[_Branch] = None
+        # no `with`: its exit would wait for the discarded branches still running
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="speculate")
+        try:
+            for i, name in enumerate(gen.PIPELINE):
+                if getattr(book, name, None):
+                    continue
+                branch, prefetched = prefetched, None
+                if name not in gen.CHOICE_STEPS:
+                    if branch is not None:
+                        self._adopt(book, branch)
+                    else:
+                        gen.run_step(name, book, extra_summary)
+                    continue
+
+                if branch is not None:
+                    candidates = branch.candidates
+                    book.fallbacks.extend(branch.fallbacks)
+                else:
+                    with profiling.step(name, book):
+                        candidates = gen.step_candidates(name, book, extra_summary)
+                following = self._next_step(book, i)
+                futures: Dict[int, Future] = {}
+                if following is not None and candidates:
+                    for value in self.ranker(name, candidates, book)[: self.top_k]:
+                        if budget <= 0:
+                            self._count("budget_exhausted")
+                            break
+                        key = _index(candidates, value)
+                        if key is None or key in futures:
+                            continue
+                        budget -= 1
+                        self._count("branches")
+                        snapshot = copy.deepcopy(book)
+                        setattr(snapshot, name, value)
+                        futures[key] = pool.submit(self._run_branch, snapshot, following, extra_summary)
+
+                chosen = gen.choose_candidate(name, candidates)
+                setattr(book, name, chosen)
+
+                hit = futures.pop(_index(candidates, chosen), None) if futures else None
+                for fut in futures.values():
+                    self._count("cancelled" if fut.cancel() else "discarded")
+                if hit is not None:
+                    self._count("hits")
+                    prefetched = hit.result()
+                elif futures:
+                    self._count("misses")
+        finally:
+            # discarded branches finish in the background; their results are dropped
+            pool.shutdown(wait=False, cancel_futures=True)
+        return book
+
+    def _next_step(self, book: Book, index: int) -> Optional[str]:
+        for name in self.generator.PIPELINE[index + 1:]:
+            if not getattr(book, name, None):
+                return name
+        return None
+
+    def _run_branch(self, book: Book, step: str, extra_summary: Optional[Dict[str, Any]]) -> _Branch:
+        gen = self.generator
+        mark = len(book.fallbacks)
+        if step in gen.CHOICE_STEPS:
+            with profiling.step(step, book):
+                candidates = gen.step_candidates(step, book, extra_summary)
+            return _Branch(candidates, {}, book.fallbacks[mark:])
+        before = {f.name: getattr(book, f.name) for f in dataclasses.fields(book)}
+        gen.run_step(step, book, extra_summary)
+        changed = {
+            name: getattr(book, name)
+            for name, value in before.items()
+            if name != "fallbacks" and getattr(book, name) != value
+        }
+        return _Branch(None, changed, book.fallbacks[mark:])
+
+    def _adopt(self, book: Book, branch: _Branch) -> None:
+        for name, value in branch.fields.items():
+            setattr(book, name, value)
+        book.fallbacks.extend(branch.fallbacks)
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+
+def _index(candidates: List[Any], value: Any) -> Optional[int]:
+    for i, c in enumerate(candidates):
+        if c is value or c == value:
+            return i
+    return None
@@ -0,0 +1,136 @@
+"""Step dependency graph and memoized step outputs.
+
+Each pipeline step declares the Book fields it reads (`STEP_INPUTS`) and the
+fields it writes (`STEP_OUTPUTS`). From that:
+
+  - `StepMemo` stores a step's outputs under a hash of its declared inputs
+    (plus the model/temperature settings and extra_summary), so re-running a step with inputs it has
+    already seen costs no LLM call. Choice steps memoize their candidate
+    list; the chooser still picks from it.
+  - `dependents(changed_fields)` lists the steps that must be recomputed
+    after some fields changed, in pipeline order; it is what
+    `LLMBookGenerator.regenerate` runs.
+
+Outputs produced with a fallback (see `Book.fallbacks`) are never memoized.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+# Book fields each step reads. This is the semantic dependency, not every
+# field a prompt happens to mention: the logline prompt accepts a tema, but
+# in the pipeline the tema is only chosen after the logline.
+STEP_INPUTS: Dict[str, List[str]] = {
+    "genre": [],
+    "conceito": ["genre"],
+    "logline": ["genre", "conceito"],
+    "tema": ["genre", "conceito"],
+    "logline_expanded": ["genre", "conceito", "logline", "tema"],
+    "acts": ["logline_expanded"],
+    "protagonistas": ["conceito", "logline", "tema"],
+    "antagonistas": ["conceito", "logline", "tema"],
+    "character_sheets": ["genre", "conceito", "logline", "tema", "protagonistas", "antagonistas"],
+}
+
+# Book fields each step writes (default: the field named like the step)
+STEP_OUTPUTS: Dict[str, List[str]] = {
+    "protagonistas": ["protagonistas", "heroi"],
+    "antagonistas": ["antagonistas", "vilao"],
+}
+
+# Request (schema) names recorded in Book.fallbacks by each step
+STEP_REQUESTS: Dict[str, List[str]] = {
+    "genre": ["genres"],
+    "conceito": ["conceitos"],
+    "logline": ["loglines"],
+    "tema": ["temas"],
+    "logline_expanded": ["logline_expansion"],
+    "acts": ["acts"],
+    "protagonistas": ["protagonistas"],
+    "antagonistas": ["antagonistas"],
+    "character_sheets": ["character_sheets"],
+}
+
+
+def step_outputs(step: str) -> List[str]:
+    return STEP_OUTPUTS.get(step, [step])
+
+
+def dependents(changed_fields: Iterable[str], pipeline: Optional[List[str]] = None) -> List[str]:
+    """
+    Steps to recompute after `changed_fields` changed, in pipeline order.
+
+    A step is affected when one of its inputs changed or was produced by an
+    affected step. Steps whose own output is among `changed_fields` are not
+    included: their new value was set by the caller.
+    """
+    changed = set(changed_fields)
+    if "genero" in changed:
+        changed.add("genre")
+    dirty = set(changed)
+    out: List[str] = []
+    for step in pipeline or list(STEP_INPUTS):
+        outputs = step_outputs(step)
+        if any(f in changed for f in outputs):
+            continue
+        if any(f in dirty for f in STEP_INPUTS.get(step, ())):
+            out.append(step)
+            dirty.update(outputs)
+    return out
+
+
+class StepMemo:
+    """LRU map of `(step, hash of declared inputs)` -> step outputs."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "stored": 0}
+
+    def key(self, step: str, book: Any, extra_summary: Optional[Dict[str, Any]] = None, settings: Any = None) -> str:
+        """Key of `step` for the book's declared inputs; `settings` is whatever else shapes the answer (model, temperature, ...)."""
+        inputs = {name: getattr(book, name, None) for name in STEP_INPUTS.get(step, ())}
+        raw = json.dumps([step, settings, inputs, extra_summary], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+        # callers mutate books; hand out a copy
+        return json.loads(value)
+
+    def put(self, key: str, value: Any) -> None:
+        raw = json.dumps(value, ensure_ascii=False, default=lambda o: o.to_dict())
+        with self._lock:
+            self._entries[key] = raw
+            self._entries.move_to_end(key)
+            self.stats["stored"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def save(self, path: str) -> None:
+        with self._lock:
+            data = dict(self._entries)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    def load(self, path: str) -> None:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        with self._lock:
+            self._entries.update(data)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
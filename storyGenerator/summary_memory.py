@@ -0,0 +1,196 @@
+"""Rolling hierarchical summaries for generation below act level.
+
+Filling `Scene.beats` / `Beat.contents` needs continuity, but pasting every
+previous beat into the prompt makes each prompt grow with the book (and the
+total prefill quadratically). `SummaryMemory` keeps instead:
+
+  - one rolling summary per open scene, chapter and act, and one for the
+    book ("the story so far"), each capped at `max_chars`;
+  - the last `recent_beats` beat texts of the current scene, each capped at
+    `recent_chars`.
+
+Summaries are updated incrementally as nodes complete: `beat_done` folds the
+beat into its scene summary, `scene_done` folds the scene summary into its
+chapter, `chapter_done` into its act and `act_done` into the book. A summary
+is dropped once folded into its parent, so only the open nodes and the book
+are kept, however long the book.
+`context(act, chapter, scene)` joins the relevant levels into a continuity
+text of bounded size, so the cost per beat stays flat as the book grows.
+
+The summaries live on `book.summaries` (keys "book", "act:0", "chapter:0.1",
+"scene:0.1.2"), so they travel with `Book.to_dict()` and a resumed run
+continues from them. Folding uses `summarize(previous, new_text, max_chars)`:
+`extractive_summary` (default, no LLM call) or `llm_summarizer(entrypoint)`.
+"""
+from __future__ import annotations
+
+import re
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+Summarizer = Callable[[str, str, int], str]
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _clip(text: str, max_chars: int) -> str:
+    text = " ".join((text or "").split())
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars].rsplit(" ", 1)[0]
+    return cut + "…"
+
+
+def extractive_summary(previous: str, new_text: str, max_chars: int) -> str:
+    """
+    Fold `new_text` into `previous` without an LLM: keep the first and last
+    sentences of the new text (how it starts and where it leaves things) and
+    drop the oldest sentences (after the first, which usually sets up the
+    situation) until the summary fits in `max_chars`.
+    """
+    sentences = [s for s in _SENTENCE_END.split(" ".join((previous or "").split())) if s]
+    new = [s for s in _SENTENCE_END.split(" ".join((new_text or "").split())) if s]
+    for s in new if len(new) <= 2 else (new[0], new[-1]):
+        sentences.append(_clip(s, max_chars))
+    while len(sentences) > 2 and len(" ".join(sentences)) > max_chars:
+        del sentences[1]
+    return _clip(" ".join(sentences), max_chars)
+
+
+def llm_summarizer(entrypoint: Any, temperature: float = 0.3, prompts: Optional[Dict[str, str]] = None) -> Summarizer:
+    """Summarizer that asks the LLM to merge the new text into the summary (falls back to extractive)."""
+    if prompts is None:
+        from LLMStructure import _load_prompts
+
+        prompts = _load_prompts()
+    system = prompts.get("system_summary", "Você resume narrativas de forma fiel e concisa.")
+    template = prompts.get(
+        "user_summary",
+        "Resumo até agora:\n{{resumo}}\n\nNovo trecho:\n{{trecho}}\n\nReescreva o resumo incorporando o novo trecho em no máximo {{max_chars}} caracteres.",
+    )
+
+    def summarize(previous: str, new_text: str, max_chars: int) -> str:
+        from circuit_breaker import LLMUnavailableError
+
+        user = (
+            template.replace("{{resumo}}", previous or "-")
+            .replace("{{trecho}}", _clip(new_text, 4 * max_chars))
+            .replace("{{max_chars}}", str(max_chars))
+        )
+        messages = [{"role": "system", "content": system}, {"role": "user", "content": user}]
+        try:
+            text = entrypoint.generate_text(messages, temperature=temperature, max_tokens=max(64, max_chars // 3), step="summary")
+        except LLMUnavailableError:
+            text = ""
+        if not text.strip():
+            return extractive_summary(previous, new_text, max_chars)
+        return _clip(text, max_chars)
+
+    return summarize
+
+
+def scene_key(act: int, chapter: int, scene: int) -> str:
+    return f"scene:{act}.{chapter}.{scene}"
+
+
+def chapter_key(act: int, chapter: int) -> str:
+    return f"chapter:{act}.{chapter}"
+
+
+def act_key(act: int) -> str:
+    return f"act:{act}"
+
+
+class SummaryMemory:
+    """Rolling scene/chapter/act/book summaries of `book`, kept on `book.summaries`."""
+
+    def __init__(
+        self,
+        book: Any,
+        summarize: Optional[Summarizer] = None,
+        max_chars: int = 600,
+        recent_beats: int = 2,
+        recent_chars: int = 400,
+    ):
+        self.book = book
+        if getattr(book, "summaries", None) is None:
+            book.summaries = {}
+        self.summaries: Dict[str, str] = book.summaries
+        self.summarize = summarize or extractive_summary
+        self.max_chars = max_chars
+        self.recent_beats = recent_beats
+        self.recent_chars = recent_chars
+        self._recent: Dict[Tuple[int, int, int], Deque[str]] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"folds": 0, "contexts": 0}
+
+    def _fold(self, key: str, text: str) -> None:
+        if not text or not text.strip():
+            return
+        with self._lock:
+            previous = self.summaries.get(key, "")
+        # the summarizer may call the LLM: do not hold the lock meanwhile
+        merged = self.summarize(previous, text, self.max_chars)
+        with self._lock:
+            self.summaries[key] = merged
+            self.stats["folds"] += 1
+
+    def forget(self, key: str) -> None:
+        """Drop one summary (e.g. a scene that will be re-folded from its beats)."""
+        with self._lock:
+            self.summaries.pop(key, None)
+
+    def snapshot(self) -> Dict[str, str]:
+        """Copy of the summaries, consistent while other threads fold."""
+        with self._lock:
+            return dict(self.summaries)
+
+    def _fold_into(self, key: str, parent: str, title: Optional[str]) -> None:
+        summary = self.summaries.get(key, "")
+        self._fold(parent, f"{title}: {summary}" if title and summary else summary)
+        # folded into its parent: the node is closed
+        self.forget(key)
+
+    def beat_done(self, act: int, chapter: int, scene: int, beat: Any) -> None:
+        """Fold a finished beat (a Beat, or its text) into the scene summary."""
+        text = getattr(beat, "contents", None) or getattr(beat, "text", None) or (beat if isinstance(beat, str) else "")
+        with self._lock:
+            recent = self._recent.setdefault((act, chapter, scene), deque(maxlen=max(1, self.recent_beats)))
+            recent.append(_clip(text, self.recent_chars))
+        self._fold(scene_key(act, chapter, scene), text)
+
+    def scene_done(self, act: int, chapter: int, scene: int, title: Optional[str] = None) -> None:
+        with self._lock:
+            self._recent.pop((act, chapter, scene), None)
+        self._fold_into(scene_key(act, chapter, scene), chapter_key(act, chapter), title)
+
+    def chapter_done(self, act: int, chapter: int, title: Optional[str] = None) -> None:
+        self._fold_into(chapter_key(act, chapter), act_key(act), title)
+
+    def act_done(self, act: int, title: Optional[str] = None) -> None:
+        self._fold_into(act_key(act), "book", title)
+
+    def context(self, act: int, chapter: int, scene: int) -> str:
+        """Continuity text for the next beat of scene (act, chapter, scene); bounded in size."""
+        with self._lock:
+            parts: List[str] = []
+            for label, key in (
+                ("História até aqui", "book"),
+                ("Ato atual", act_key(act)),
+                ("Capítulo atual", chapter_key(act, chapter)),
+                ("Cena atual", scene_key(act, chapter, scene)),
+            ):
+                text = self.summaries.get(key)
+                if text:
+                    parts.append(f"{label}: {text}")
+            recent = self._recent.get((act, chapter, scene))
+            if recent:
+                parts.append("Últimos beats: " + " | ".join(recent))
+            self.stats["contexts"] += 1
+        return "\n".join(parts)
+
+    def max_context_chars(self) -> int:
+        """Upper bound of `len(context(...))`, independent of book length."""
+        labels = 80
+        return 4 * (self.max_chars + 1) + self.recent_beats * (self.recent_chars + 4) + labels
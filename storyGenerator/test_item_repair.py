@@ -0,0 +1,67 @@
+"""Regression tests for the partial re-request of list steps (`_request_items`).
+
+Run from this directory: `python -m pytest -q test_item_repair.py`.
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List
+
+from book_dataclasses import Book
+from LLMStructure import LLMBookGenerator
+from routing import RouteTable
+
+
+class FakeEntrypoint:
+    """Answers `generate_json` with `answer(prompts)`; the first call is the step, the next ones repairs."""
+
+    def __init__(self, answer: Callable[[List[Dict[str, str]], int], Any]):
+        self.answer = answer
+        self.model = "fake"
+        self.routes = RouteTable()
+        self.calls: List[List[Dict[str, str]]] = []
+
+    def generate_json(self, prompts, response_schema=None, temperature=None):
+        self.calls.append(prompts)
+        return self.answer(prompts, len(self.calls) - 1)
+
+
+def _generator(answers: List[Any]) -> LLMBookGenerator:
+    entrypoint = FakeEntrypoint(lambda prompts, call: answers[min(call, len(answers) - 1)])
+    return LLMBookGenerator(api_key="k", base_url="http://fake/v1", model="fake", entrypoint=entrypoint)
+
+
+def test_repair_skips_echoed_characters():
+    gen = _generator([
+        {"protagonistas": [{"nome": "Ana", "descricao": "heroína"}, {"nome": "Bia"}]},
+        # the repair answer echoes the valid item it was given as context
+        {"protagonistas": [{"nome": "Ana", "descricao": "heroína"}, {"nome": "Bia", "descricao": "irmã"}]},
+    ])
+    book = Book(conceito="C", logline="L", tema="T")
+    out = gen.generate_protagonistas(book)
+    assert [c["nome"] for c in out] == ["Ana", "Bia"]
+    assert out[1]["descricao"] == "irmã"
+    assert gen.item_repair_counts[("protagonistas", "repaired")] == 1
+
+
+def test_repair_never_relabels_an_echoed_act():
+    gen = _generator([
+        {"acts": [{"act": 1, "description": "A1", "disaster_point": "D1"}, {"act": 2, "description": "A2", "disaster_point": "D2"}]},
+        {"acts": [{"act": 1, "description": "A1 again", "disaster_point": "D1"}, {"act": 3, "description": "A3", "disaster_point": "D3"}]},
+    ])
+    book = Book(logline_expanded="Um parágrafo. Ocorre um desastre terrível. Há uma falha. O sacrifício final.")
+    acts = gen.generate_three_acts_from_logline(book)
+    assert [(a["act"], a["description"]) for a in acts] == [(1, "A1"), (2, "A2"), (3, "A3")]
+    assert book.fallbacks == []
+
+
+def test_duplicate_act_is_dropped_and_heuristic_fills_the_gap():
+    gen = _generator([
+        {"acts": [{"act": 1, "description": "A1", "disaster_point": "D1"}, {"act": 2, "description": "A2", "disaster_point": "D2"}]},
+        {"acts": [{"act": 1, "description": "A1 again", "disaster_point": "D1"}]},
+    ])
+    book = Book(logline_expanded="Um parágrafo. Ocorre um desastre terrível. Há uma falha. O sacrifício final.")
+    acts = gen.generate_three_acts_from_logline(book)
+    assert [a["act"] for a in acts] == [1, 2, 3]
+    assert [a["description"] for a in acts[:2]] == ["A1", "A2"]
+    assert "A1 again" not in acts[2]["description"]
+    assert {"step": "acts", "reason": "incomplete"} in book.fallbacks
@@ -0,0 +1,127 @@
+"""Per-step `max_tokens` planning.
+
+Sending every request with the same `max_tokens` over-reserves server KV
+cache for short outputs (a genre list needs a few hundred tokens) and cuts
+off long ones. `TokenBudgetPlanner` estimates the completion length a step
+needs, first from its `response_schema` and then from the completion
+tokens it actually used on previous calls, and clamps the result between
+`floor` and `ceiling`.
+
+Truncated answers are completed with continuation requests by
+`LLMentryPoint`, and the full length is recorded, so the next plan for that
+step grows to fit.
+"""
+from __future__ import annotations
+
+import math
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+# Rough token costs used for schema-based estimates
+TOKENS_PER_STRING = 32
+TOKENS_PER_FIELD_VALUE = 48
+TOKENS_OVERHEAD = 16
+# LLMs usually return more items than `minItems` asks for
+ITEM_COUNT_FACTOR = 3
+DEFAULT_ITEM_COUNT = 4
+
+
+class TokenBudgetPlanner:
+    """Plans `max_tokens` per step from its schema and past usage.
+
+    - plan(step, schema): tokens to request for the next call of `step`
+    - record(step, completion_tokens, truncated): feed back observed usage
+    """
+
+    def __init__(
+        self,
+        default_max_tokens: int = 1500,
+        floor: int = 64,
+        ceiling: int = 4096,
+        headroom: float = 1.25,
+        percentile: float = 0.95,
+        history: int = 50,
+        min_samples: int = 3,
+    ):
+        self.default_max_tokens = default_max_tokens
+        self.floor = floor
+        self.ceiling = ceiling
+        self.headroom = headroom
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self._history: Dict[str, Deque[int]] = {}
+        self._history_len = history
+        self._truncations: Dict[str, int] = {}
+        self._schema_estimates: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def estimate_from_schema(self, schema: Optional[Dict[str, Any]]) -> int:
+        """Estimate the completion length of a structured answer from its schema."""
+        if not schema:
+            return self.default_max_tokens
+        body = schema.get("json_schema", {}).get("schema", {}) or {}
+        return TOKENS_OVERHEAD + _estimate_node(body)
+
+    def plan(self, step: Optional[str], schema: Optional[Dict[str, Any]] = None, ceiling: Optional[int] = None) -> int:
+        """Tokens to request for `step`; `ceiling` overrides `self.ceiling` (e.g. a route's limit)."""
+        with self._lock:
+            samples = list(self._history.get(step or "", ()))
+        if len(samples) >= self.min_samples:
+            samples.sort()
+            idx = min(len(samples) - 1, int(math.ceil(self.percentile * len(samples))) - 1)
+            planned = int(samples[idx] * self.headroom)
+        elif schema is not None:
+            planned = self.estimate_from_schema(schema)
+            with self._lock:
+                self._schema_estimates[step or ""] = planned
+        else:
+            planned = self._schema_estimates.get(step or "", self.default_max_tokens)
+        return max(self.floor, min(ceiling or self.ceiling, planned))
+
+    def record(self, step: Optional[str], completion_tokens: int, truncated: bool = False) -> None:
+        key = step or ""
+        with self._lock:
+            hist = self._history.get(key)
+            if hist is None:
+                hist = self._history[key] = deque(maxlen=self._history_len)
+            hist.append(int(completion_tokens))
+            if truncated:
+                self._truncations[key] = self._truncations.get(key, 0) + 1
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return `{step: {calls, mean, max, truncations, next_plan}}` for recorded steps."""
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._history.items()}
+            truncations = dict(self._truncations)
+        out: Dict[str, Dict[str, Any]] = {}
+        for step, samples in snapshot.items():
+            out[step] = {
+                "calls": len(samples),
+                "mean": sum(samples) / len(samples) if samples else 0,
+                "max": max(samples) if samples else 0,
+                "truncations": truncations.get(step, 0),
+                "next_plan": self.plan(step),
+            }
+        return out
+
+
+def _estimate_node(node: Dict[str, Any]) -> int:
+    kind = node.get("type")
+    if kind == "array":
+        count = max(int(node.get("minItems", 0) or 0), 1) * ITEM_COUNT_FACTOR
+        if "maxItems" in node:
+            count = min(count, int(node["maxItems"]))
+        elif not node.get("minItems"):
+            count = DEFAULT_ITEM_COUNT
+        return count * _estimate_node(node.get("items", {}) or {})
+    if kind == "object":
+        props = node.get("properties", {}) or {}
+        if not props:
+            return TOKENS_PER_FIELD_VALUE
+        return sum(4 + _estimate_node(p) for p in props.values())
+    if kind == "string":
+        return TOKENS_PER_STRING
+    if kind in ("integer", "number", "boolean"):
+        return 4
+    return TOKENS_PER_FIELD_VALUE
@@ -0,0 +1,178 @@
+"""Endpoint discovery and model warm-up before a run.
+
+Local servers (LM Studio, llama.cpp, Ollama's OpenAI API, ...) load models
+lazily: the first request of a run, or the first after an idle unload, can
+take tens of seconds and hit the request timeout of the first step.
+`warm_up(entrypoint)` makes that cost explicit and pays it up front:
+
+  - every base URL the entrypoint can send to (`base_url`, `endpoints` and
+    the routes' base URLs) is asked for `/v1/models`, to check that the
+    models it will be sent are served there (`available` is None when the
+    server has no model listing);
+  - every (base URL, model) pair then gets a one-token chat request with a
+    long timeout (which loads the model), retried `attempts` times while
+    the server answers 5xx/429 or times out, and a second one to measure the
+    warm latency; `cold_start` is the time from the first attempt to the
+    first answer, minus the warm latency.
+
+Discovery and warm-up run in parallel across endpoints. The requests go
+through the entrypoint's breakers and limiters like any other, but give
+the limiter no latency sample (a one-token ping is no baseline). The report
+says whether every pair is `ready`; batch runs (`main.py worker --warm-up`,
+`main.py generate --warm-up`, or `"warm_up": true` in config.json) only
+start once at least one is.
+"""
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from circuit_breaker import LLMUnavailableError
+
+WARMUP_PROMPT = "Responda apenas: ok"
+
+
+def targets(entrypoint: Any) -> List[Tuple[str, str]]:
+    """(base URL, model) pairs the entrypoint may send requests to."""
+    pairs: List[Tuple[str, str]] = []
+    for url in [entrypoint.base_url] + list(entrypoint.endpoints):
+        pairs.append((url, entrypoint.model))
+    for route in entrypoint.routes.routes.values():
+        urls = [route.base_url] if route.base_url else [entrypoint.base_url] + list(entrypoint.endpoints)
+        for url in urls:
+            pairs.append((url, route.model or entrypoint.model))
+    return list(dict.fromkeys(pairs))
+
+
+def list_models(entrypoint: Any, base_url: str, timeout: float = 10.0) -> Optional[List[str]]:
+    """Model ids served at `base_url` (`GET /v1/models`), or None when it cannot be listed."""
+    import requests
+
+    from LLMStructure import _build_endpoint
+
+    headers = {"Authorization": f"Bearer {entrypoint.routes.api_key_for(base_url) or entrypoint.api_key}"}
+    try:
+        resp = entrypoint.session.get(_build_endpoint(base_url, "models"), headers=headers, timeout=(entrypoint.connect_timeout, timeout))
+        if resp.status_code != 200:
+            return None
+        data = resp.json()
+    except (requests.RequestException, ValueError):
+        return None
+    items = data.get("data") if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return None
+    return [str(m.get("id")) for m in items if isinstance(m, dict) and m.get("id")]
+
+
+def _ping(entrypoint: Any, base_url: str, model: str, timeout: float) -> float:
+    payload = {
+        "model": model,
+        "messages": [{"role": "user", "content": WARMUP_PROMPT}],
+        "max_tokens": 1,
+        "temperature": 0,
+    }
+    started = time.monotonic()
+    # no latency sample: a one-token ping would set a per-token baseline the
+    # AIMD limiter can never see again on real steps
+    entrypoint._post_chat(payload, timeout=timeout, base_url=base_url, latency_sample=False)
+    return time.monotonic() - started
+
+
+def _warm_pair(entrypoint: Any, base_url: str, model: str, models: Optional[List[str]], timeout: float, attempts: int, wait: float) -> Dict[str, Any]:
+    status: Dict[str, Any] = {
+        "base_url": base_url,
+        "model": model,
+        "available": None if models is None else model in models,
+        "ready": False,
+    }
+    if models is not None:
+        status["models"] = len(models)
+        if model not in models:
+            status["error"] = "model not listed by the server"
+            return status
+    started = time.monotonic()
+    for attempt in range(1, max(1, attempts) + 1):
+        status["attempts"] = attempt
+        try:
+            _ping(entrypoint, base_url, model, timeout)
+            # the model may have loaded during an attempt that failed: the
+            # first answer is timed from the first attempt
+            first = time.monotonic() - started
+            warm = _ping(entrypoint, base_url, model, timeout)
+        except LLMUnavailableError as exc:
+            status["error"] = str(exc)
+            if attempt < attempts:
+                time.sleep(wait)
+            continue
+        except Exception as exc:
+            # 4xx: retrying will not help (bad model name, auth, ...)
+            status["error"] = f"{type(exc).__name__}: {exc}"
+            break
+        status.pop("error", None)
+        status.update(
+            ready=True,
+            first_seconds=round(first, 3),
+            warm_seconds=round(warm, 3),
+            cold_start=round(max(0.0, first - warm), 3),
+        )
+        break
+    status["seconds"] = round(time.monotonic() - started, 3)
+    return status
+
+
+def warm_up(entrypoint: Any, timeout: float = 180.0, attempts: int = 3, wait: float = 5.0) -> Dict[str, Any]:
+    """
+    Discover and warm every (base URL, model) pair of `entrypoint`.
+
+    Returns `{"ready": all pairs ready, "ready_count", "seconds", "endpoints": [...]}`
+    with one status per pair (available, ready, attempts, first/warm
+    seconds, cold_start, error).
+    """
+    started = time.monotonic()
+    pairs = targets(entrypoint)
+    urls = list(dict.fromkeys(url for url, _model in pairs))
+    with ThreadPoolExecutor(max_workers=max(1, len(pairs)), thread_name_prefix="warmup") as pool:
+        listed = dict(zip(urls, pool.map(lambda url: list_models(entrypoint, url), urls)))
+        statuses = list(pool.map(
+            lambda pair: _warm_pair(entrypoint, pair[0], pair[1], listed[pair[0]], timeout, attempts, wait),
+            pairs,
+        ))
+    ready = sum(1 for s in statuses if s["ready"])
+    return {
+        "ready": ready == len(statuses),
+        "ready_count": ready,
+        "seconds": round(time.monotonic() - started, 3),
+        "endpoints": statuses,
+    }
+
+
+def warm_up_from_config(entrypoint: Any, config: Any) -> Optional[Dict[str, Any]]:
+    """
+    Warm-up driven by the `warm_up` key of the LLM config: true for the
+    defaults or `{"timeout": ..., "attempts": ..., "wait": ...}`; None when off.
+    """
+    if not config:
+        return None
+    if config is True:
+        return warm_up(entrypoint)
+    return warm_up(
+        entrypoint,
+        timeout=config.get("timeout", 180.0),
+        attempts=config.get("attempts", 3),
+        wait=config.get("wait", 5.0),
+    )
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """One line per endpoint/model pair, then the total."""
+    lines = []
+    for s in report["endpoints"]:
+        if s["ready"]:
+            state = f"ready  first {s['first_seconds']:.2f}s  warm {s['warm_seconds']:.2f}s  cold start {s['cold_start']:.2f}s"
+        else:
+            state = f"NOT READY ({s.get('error', 'unknown error')})"
+        listed = {None: "unlisted", True: "listed", False: "missing"}[s["available"]]
+        lines.append(f"{s['base_url']}  {s['model']}  [{listed}]  {state}")
+    lines.append(f"{report['ready_count']}/{len(report['endpoints'])} ready in {report['seconds']:.2f}s")
+    return "\n".join(lines)
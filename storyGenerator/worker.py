@@ -0,0 +1,173 @@
+"""Worker process mode: pull generation jobs from a JobQueue and run LLMBookGenerator.
+
+Job payload keys (all optional):
+  - seed: int, makes the choices between LLM candidates reproducible
+  - genre / conceito / tema / ...: Book fields fixed up front (their steps are skipped)
+  - extra_summary: dict passed to every generate_* step as extra context
+  - structure: structure config (acts/chapters/...) stored with the result
+
+Each worker claims one job at a time, keeps its lease alive while the book
+is generated and stores `{"book": book.to_dict(), "structure": ...}` as the
+job result. With `store_path` every finished book is also saved into a
+`BookStore` (its row id is added to the result as `book_id`). `run_pool`
+starts several worker processes on the same queue.
+"""
+from __future__ import annotations
+
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional
+
+from book_dataclasses import Book
+from job_queue import JobQueue
+from LLMStructure import LLMBookGenerator, LLMentryPoint
+from prompt_cache import SimilarityCache
+import profiling
+
+# Book fields a job may preset
+PRESET_FIELDS = ("title", "author", "genre", "conceito", "logline", "tema")
+
+
+def job_book(payload: Dict[str, Any]) -> Book:
+    book = Book()
+    for name in PRESET_FIELDS:
+        if payload.get(name):
+            setattr(book, name, payload[name])
+    return book
+
+
+def run_job(generator: LLMBookGenerator, payload: Dict[str, Any]) -> Dict[str, Any]:
+    book = generator.build_book_structure_with_llm(
+        temperature=generator.temperature,
+        extra_summary=payload.get("extra_summary"),
+        seed=payload.get("seed"),
+        book=job_book(payload),
+    )
+    with profiling.section("serialization"):
+        book_dict = book.to_dict()
+    return {"book": book_dict, "structure": payload.get("structure")}
+
+
+class _LeaseKeeper(threading.Thread):
+    """Extends a job's lease every `interval` seconds while it runs."""
+
+    def __init__(self, queue_path: str, job_id: int, worker: str, interval: float):
+        super().__init__(daemon=True)
+        self.queue_path = queue_path
+        self.job_id = job_id
+        self.worker = worker
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        # sqlite connections are per thread
+        queue = JobQueue(self.queue_path)
+        try:
+            while not self.stopped.wait(self.interval):
+                if not queue.extend(self.job_id, self.worker):
+                    break
+        finally:
+            queue.close()
+
+
+def run_worker(
+    queue_path: str,
+    llm_config: Dict[str, Any],
+    worker_id: Optional[str] = None,
+    max_jobs: Optional[int] = None,
+    poll_interval: float = 2.0,
+    exit_when_empty: bool = False,
+    visibility_timeout: float = 600.0,
+    store_path: Optional[str] = None,
+    profile_path: Optional[str] = None,
+) -> int:
+    """
+    Process jobs until `max_jobs` are done (or the queue is empty with `exit_when_empty`).
+
+    The optional `prompt_cache` key of `llm_config` enables the similarity
+    cache of prompt_cache.py for the steps it lists.
+
+    With `profile_path`, the run is profiled (see profiling.py) and the step
+    breakdown and folded stacks are written to `<profile_path>.<worker>.json`
+    and `.folded`.
+    """
+    worker = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    profiler = None
+    if profile_path:
+        profiler = profiling.Profiler(sample=True)
+        profiler.start()
+    queue = JobQueue(queue_path, visibility_timeout=visibility_timeout)
+    entrypoint = LLMentryPoint.from_config(llm_config)
+    generator = LLMBookGenerator(api_key=entrypoint.api_key, base_url=entrypoint.base_url, model=entrypoint.model, entrypoint=entrypoint)
+    generator.prompt_cache = SimilarityCache.from_config(llm_config.get("prompt_cache"))
+    store = None
+    if store_path:
+        from book_storage import BookStore
+
+        store = BookStore(store_path)
+
+    done = 0
+    try:
+        while max_jobs is None or done < max_jobs:
+            job = queue.claim(worker)
+            if job is None:
+                if exit_when_empty:
+                    break
+                time.sleep(poll_interval)
+                continue
+            keeper = _LeaseKeeper(queue_path, job["id"], worker, interval=max(1.0, visibility_timeout / 3))
+            keeper.start()
+            try:
+                result = run_job(generator, job["payload"])
+                if store is not None:
+                    result["book_id"] = store.save(result["book"])
+            except Exception as exc:
+                error = f"{type(exc).__name__}: {exc}\n{traceback.format_exc(limit=5)}"
+                if not queue.fail(job["id"], worker, error):
+                    # the lease expired and the job moved on: its new owner decides
+                    print(f"[{worker}] job {job['id']} failed after its lease was lost: {type(exc).__name__}: {exc}")
+            else:
+                queue.complete(job["id"], worker, result)
+                done += 1
+            finally:
+                keeper.stopped.set()
+    finally:
+        queue.close()
+        if store is not None:
+            store.close()
+        if generator.prompt_cache is not None:
+            print(f"[{worker}] prompt cache: {generator.prompt_cache.stats}")
+        if profiler is not None:
+            profiler.stop()
+            prefix = f"{profile_path}.{worker.replace(':', '_')}"
+            profiler.write_report(prefix + ".json")
+            profiler.write_stacks(prefix + ".folded")
+    return done
+
+
+def run_pool(queue_path: str, llm_config: Dict[str, Any], processes: int, **worker_kwargs: Any) -> List[int]:
+    """Run `processes` worker processes on `queue_path` and wait for them; returns exit codes."""
+    procs = [
+        multiprocessing.Process(
+            target=run_worker,
+            args=(queue_path, llm_config),
+            kwargs={"worker_id": f"{socket.gethostname()}:w{i}", **worker_kwargs},
+            name=f"book-worker-{i}",
+        )
+        for i in range(processes)
+    ]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.join()
+    return [p.exitcode for p in procs]